@@ -0,0 +1,161 @@
+"""
+Router benchmarks, run with::
+
+    python setup.py bench -f benchmark/bench_router.py -- --benchmark-autosave
+
+Save a baseline, and compare later runs against it::
+
+    python setup.py bench -f benchmark/bench_router.py -- --benchmark-save=baseline
+    python setup.py bench -f benchmark/bench_router.py -- --benchmark-compare=0001_baseline
+
+Every round is a single ``Router.find`` call, ``p50``, ``p90`` and ``p99`` latencies are saved
+into ``extra_info`` of the json results.
+"""
+import sys
+import time
+from os import path
+from functools import lru_cache
+from random import Random
+from typing import Callable, List, Tuple
+from uuid import UUID
+
+import pytest
+
+VIZEN_DIR = path.join(path.dirname(path.realpath(__file__)), "..", "src")
+
+if path.isdir(VIZEN_DIR):
+    sys.path.insert(0, VIZEN_DIR)
+
+from vizen.router import Router, RouteTree, RouteRegex, RouteNotFound  # noqa
+
+SIZES = [10, 100, 1000, 10000]
+ENGINES = {"tree": RouteTree, "regex": RouteRegex}
+ROUNDS = 20000
+MIN_ROUNDS = 100
+MAX_TIME = 2.0
+URLS = 1000
+CALIBRATE = 50
+
+UrlFactory = Callable[[Random], str]
+
+
+def _uuid(rnd: Random) -> str:
+    return str(UUID(int=rnd.getrandbits(128), version=4))
+
+
+def _route(i: int) -> Tuple[str, UrlFactory]:
+    kind = i % 6
+    if kind == 0:
+        return f"/static/page{i}", lambda rnd: f"/static/page{i}"
+    elif kind == 1:
+        return f"/users{i}/{{id:int}}", lambda rnd: f"/users{i}/{rnd.randint(1, 10**6)}"
+    elif kind == 2:
+        return f"/items{i}/{{id:uuid}}/detail", lambda rnd: f"/items{i}/{_uuid(rnd)}/detail"
+    elif kind == 3:
+        return f"/blog{i}/{{slug:str}}", lambda rnd: f"/blog{i}/post-{rnd.randint(1, 10**6)}-title"
+    elif kind == 4:
+        return (f"/shop{i}/{{name:str}}-{{id:int}}/page-{{page:int}}",
+                lambda rnd: f"/shop{i}/product-{rnd.randint(1, 10**6)}/page-{rnd.randint(1, 100)}")
+    else:
+        return (f"/api/v1/res{i}/{{id:int}}/sub/{{sub:int}}",
+                lambda rnd: f"/api/v1/res{i}/{rnd.randint(1, 10**6)}/sub/{rnd.randint(1, 10**6)}")
+
+
+def make_routes(count: int) -> List[Tuple[str, UrlFactory]]:
+    """ Route table with static routes, int / uuid / str params and multi param segments """
+    return [_route(i) for i in range(count)]
+
+
+async def _handler():
+    pass
+
+
+@lru_cache(maxsize=None)
+def make_router(count: int, engine: str, catch_all: bool = False) -> Router:
+    router = Router(engine=ENGINES[engine])
+    for pattern, _ in make_routes(count):
+        router.add_handler([b"GET"], pattern, _handler)
+
+    if catch_all:
+        router.add_handler([b"GET"], "/{path}", _handler)
+
+    router.freeze()
+    return router
+
+
+def hit_urls(count: int) -> List[str]:
+    rnd = Random(count)
+    routes = make_routes(count)
+    return [routes[rnd.randrange(count)][1](rnd) for _ in range(URLS)]
+
+
+def miss_urls(count: int) -> List[str]:
+    rnd = Random(count)
+    urls = []
+    for _ in range(URLS):
+        i = rnd.randrange(count)
+        urls.append(f"/missing{i}/x" if i % 2 else f"/api/v1/res{i}/not-int/sub/1")
+    return urls
+
+
+def worst_urls(count: int) -> List[str]:
+    """ Urls, that are only matched by the lowest priority catch-all route """
+    rnd = Random(count)
+    return [f"/unknown/{rnd.randint(1, 10**6)}/path" for _ in range(URLS)]
+
+
+def run(benchmark, router: Router, urls: List[str]) -> None:
+    find = router.find
+    i = 0
+
+    def setup():
+        nonlocal i
+        url = urls[i % len(urls)]
+        i += 1
+        return (url, b"GET"), {}
+
+    def lookup(url: str, method: bytes):
+        try:
+            find(url, method)
+        except RouteNotFound:
+            pass
+
+    begin = time.perf_counter()
+    for url in urls[:CALIBRATE]:
+        lookup(url, b"GET")
+    per_call = (time.perf_counter() - begin) / CALIBRATE
+    rounds = max(MIN_ROUNDS, min(ROUNDS, int(MAX_TIME / per_call)))
+
+    benchmark.pedantic(lookup, setup=setup, rounds=rounds)
+    if benchmark.stats is None:
+        # --benchmark-disable
+        return
+
+    data = sorted(benchmark.stats.stats.data)
+    for p in (50, 90, 99):
+        benchmark.extra_info[f"p{p}"] = data[min(len(data) - 1, len(data) * p // 100)]
+
+
+engines = pytest.mark.parametrize("engine", list(ENGINES))
+sizes = pytest.mark.parametrize("count", SIZES)
+
+
+@engines
+@sizes
+def test_hit(benchmark, engine, count):
+    benchmark.group = f"hit-{count}"
+    run(benchmark, make_router(count, engine), hit_urls(count))
+
+
+@engines
+@sizes
+def test_miss(benchmark, engine, count):
+    benchmark.group = f"miss-{count}"
+    run(benchmark, make_router(count, engine), miss_urls(count))
+
+
+@engines
+@sizes
+def test_worst(benchmark, engine, count):
+    benchmark.group = f"worst-{count}"
+    run(benchmark, make_router(count, engine, True), worst_urls(count))
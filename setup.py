@@ -133,7 +133,7 @@ class Benchmark(Command):
         cmd_prerun(self, requirements)
         import shlex
         import pytest
-        errno = pytest.main(shlex.split(self.pytest_args))
+        errno = pytest.main(shlex.split(self.pytest_args) + subcommand_args)
         sys.exit(errno)
 
 
@@ -150,7 +150,7 @@ setup(
     package_dir={"vizen": "src/vizen"},
     package_data={"vizen": ["_di.pyi"]},
     # ext_modules=[cpp_ext],
-    tests_require=["pytest"],
+    tests_require=["pytest", "websockets>=11"],
     python_requires=">=3.7",
     extras_require={"benchmark": ["pytest", "pytest-benchmark"]},
     cmdclass={
@@ -8,19 +8,29 @@ from .protocol import (
     HTTP1Protocol,
     HTTP2Protocol,
     WebsocketProtocol,
+    WebSocket,
+    WebSocketClosed,
+    broadcast,
+    UPGRADE,
     Request,
     Response,
     Output,
+    Input,
     Cookie,
+    Compression,
+    RequestContext,
+    RequestContextFactory,
 )  # noqa
 from .error import (HTTPError, HTTPRedirect)  # noqa
 from .json import Json
 from .event import Event
 from .host import Host
 from .cors import CORS  # noqa
+from .static import StaticFiles  # noqa
 from .session import Session, FileSession  # noqa
 from .restarter import Restarter
 from .router import Router
+from .protocol.body import FormDataParser
 
 
 @Server.on_init
@@ -28,11 +38,39 @@ def init_server(injector: Injector):
     injector.provide(ProtocolFactory)
     injector.provide(ProtocolSelector)
     injector.provide(HTTP1Protocol)
+    injector[HTTP1Protocol.KEEP_ALIVE_TIMEOUT] = 5.0
+    injector[HTTP1Protocol.MAX_REQUESTS] = 1000
+    injector[HTTP1Protocol.PIPELINE_DEPTH] = 16
+    injector[HTTP1Protocol.MAX_BODY_SIZE] = 1073741824
+    injector[FormDataParser.SPOOL_SIZE] = 1048576
+    injector[FormDataParser.HASH] = None
     injector.provide(HTTP2Protocol)
+    injector[HTTP2Protocol.MAX_CONCURRENT_STREAMS] = 100
+    injector[HTTP2Protocol.INITIAL_WINDOW_SIZE] = 1048576
+    injector[HTTP2Protocol.CONNECTION_WINDOW_SIZE] = 16777216
+    injector[HTTP2Protocol.MAX_FRAME_SIZE] = 16384
     injector.provide(WebsocketProtocol)
+    injector[WebsocketProtocol.MAX_MESSAGE_SIZE] = 1048576
+    injector[WebsocketProtocol.PING_INTERVAL] = 20.0
+    injector[WebsocketProtocol.DEFLATE] = True
+    injector.provide(WebSocket)
+    injector[UPGRADE] = None
+    injector.provide(RequestContextFactory, RequestContextFactory, SINGLETON)
+    injector[RequestContextFactory.POOL_SIZE] = 0
+    injector[RequestContextFactory.POOL_DEBUG] = False
     injector.provide(Request)
     injector.provide(Response)
     injector.provide(Output)
+    injector[Output.HIGH_WATER] = 65536
+    injector[Output.LOW_WATER] = 16384
+    injector.provide(Input)
+    injector.provide(Compression, Compression, SINGLETON)
+    injector[Compression.ENABLED] = False
+    injector[Compression.TYPES] = [b"text/", b"application/json", b"application/javascript", b"image/svg+xml"]
+    injector[Compression.MIN_SIZE] = 1024
+    injector[Compression.LEVEL] = 6
+    injector[Compression.OFFLOAD_SIZE] = 65536
+    injector[Compression.CACHE_SIZE] = 16777216
     injector.provide(Host, Host.determine, SCOPED_SINGLETON)
     injector.provide(Cookie)
     injector.provide(Restarter)
@@ -1,4 +1,4 @@
-from asyncio import AbstractEventLoop, new_event_loop, set_event_loop, set_event_loop_policy, get_event_loop
+from asyncio import AbstractEventLoop, new_event_loop, set_event_loop, set_event_loop_policy
 from yapic.di import Injector
 from .server import Server
 
@@ -14,5 +14,6 @@ def init_loop(injector: Injector):
         set_event_loop(loop)
     else:
         set_event_loop_policy(uvloop.EventLoopPolicy())
-        loop = get_event_loop()
+        loop = new_event_loop()
+        set_event_loop(loop)
     injector[Loop] = loop
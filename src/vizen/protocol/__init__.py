@@ -1,15 +1,18 @@
-import re
-from asyncio import Protocol, AbstractEventLoop
+from asyncio import Protocol, AbstractEventLoop, BaseTransport, TimerHandle
+from typing import Union
 from yapic.di import Injector, Inject, Token
 
-from .protocol import AbstractProtocol, SOCK_LISTEN, SOCK_TRANSPORT  # noqa
+from .protocol import AbstractProtocol, SOCK_LISTEN, SOCK_TRANSPORT, UPGRADE  # noqa
 from .http1 import HTTP1Protocol
 from .http2 import HTTP2Protocol
-from .websocket import WebsocketProtocol  # noqa
+from .websocket import WebsocketProtocol, WebSocket, WebSocketClosed, broadcast  # noqa
 from .request import Request  # noqa
 from .response import Response  # noqa
 from .output import Output
+from .input import Input
 from .cookie import Cookie
+from .compression import Compression  # noqa
+from .context import RequestContext, RequestContextFactory  # noqa
 
 HTTP_VERSION = Token("HTTP_VERSION")
 HTTP_METHOD = Token("HTTP_METHOD")
@@ -24,54 +27,129 @@ class ProtocolFactory(Protocol):
 
 
 _HTTP_VERSION_PROTO = {
-    b"1.0": HTTP1Protocol,
-    b"1.1": HTTP1Protocol,
-    b"2.0": HTTP2Protocol,
+    b"HTTP/1.0": HTTP1Protocol,
+    b"HTTP/1.1": HTTP1Protocol,
 }
 
-_RE_HTTP_VERSION = re.compile(rb"^.+HTTP/(.+)\r\n", re.I).match
+# HTTP/2 connection preface (h2c with prior knowledge)
+_H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+# longer request lines are rejected with 414
+MAX_REQUEST_LINE = 8192
+
+_BAD_REQUEST = b"HTTP/1.1 400 Bad Request\r\nconnection: close\r\ncontent-length: 0\r\n\r\n"
+_URI_TOO_LONG = b"HTTP/1.1 414 URI Too Long\r\nconnection: close\r\ncontent-length: 0\r\n\r\n"
+_VERSION_NOT_SUPPORTED = (b"HTTP/1.1 505 HTTP Version Not Supported\r\n"
+                          b"connection: close\r\ncontent-length: 0\r\n\r\n")
 
 
 class ProtocolSelector(Protocol):
+    """ Select the protocol of the connection, by the HTTP/2 preface, or by the version in the request line
+
+    Received data is buffered until the request line (or the preface) is complete, and it is handed over
+    to the selected protocol as is. The connection is closed, when nothing is selected in ``KEEP_ALIVE_TIMEOUT``.
+    """
     injector: Inject[Injector]
+    loop: Inject[AbstractEventLoop]
+    keep_alive_timeout: Inject[HTTP1Protocol.KEEP_ALIVE_TIMEOUT]
     output: Output
+    transport: BaseTransport
+    buffer: Union[bytes, bytearray, None]
+    idle_timer: Union[TimerHandle, None]
 
     # ---------------- #
     # PROTOCOL METHODS #
     # ---------------- #
 
     def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = None
         self.injector[SOCK_TRANSPORT] = transport
-        self.injector[Output] = self.injector[Output]
+        self.output = self.injector[Output] = self.injector[Output]
+        self.injector[Input] = self.injector[Input]
+
+        if self.keep_alive_timeout:
+            self.idle_timer = self.loop.call_later(self.keep_alive_timeout, transport.close)
+        else:
+            self.idle_timer = None
+
+        ssl_object = transport.get_extra_info("ssl_object")
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+            self.__select(HTTP2Protocol)
 
     def connection_lost(self, exc):
-        # print("connection_lost", exc)
-        pass
+        self.__cancel_idle_timer()
+        self.output.connection_lost()
 
     def pause_writing(self):
-        self.output.writable.clear()
-        print("pause_writing")
+        self.output.pause_writing()
 
     def resume_writing(self):
-        self.output.writable.set()
-        print("resume_writing")
+        self.output.resume_writing()
 
     def data_received(self, data):
-        version = _RE_HTTP_VERSION(data)
-        if version:
-            protocol = self.injector[_HTTP_VERSION_PROTO[version[1]]]
-            self.connection_lost = protocol.connection_lost
-            self.pause_writing = protocol.pause_writing
-            self.resume_writing = protocol.resume_writing
-            self.data_received = protocol.data_received
-            self.eof_received = protocol.eof_received
-            protocol.data_received(data)
+        buffer = self.buffer
+        if buffer is None:
+            buffer = data
         else:
-            raise RuntimeError()
+            buffer += data
+
+        if buffer[:1] == b"P" and _H2_PREFACE.startswith(buffer[:len(_H2_PREFACE)]):
+            if len(buffer) < len(_H2_PREFACE):
+                return self.__wait(buffer)
+            protocol_type = HTTP2Protocol
+        else:
+            # empty lines before the request line are allowed (RFC 7230 3.5)
+            start = 0
+            while buffer.startswith(b"\r\n", start):
+                start += 2
+
+            end = buffer.find(b"\r\n", start, start + MAX_REQUEST_LINE + 2)
+            if end == -1:
+                if len(buffer) - start > MAX_REQUEST_LINE:
+                    return self.__reject(_URI_TOO_LONG)
+                return self.__wait(buffer)
+
+            space = buffer.rfind(b" ", start, end)
+            version = bytes(buffer[space + 1:end])
+            try:
+                protocol_type = _HTTP_VERSION_PROTO[version]
+            except KeyError:
+                if space == -1 or not version.startswith(b"HTTP/"):
+                    return self.__reject(_BAD_REQUEST)
+                return self.__reject(_VERSION_NOT_SUPPORTED)
+
+        self.buffer = None
+        self.__select(protocol_type).data_received(buffer)
 
     def eof_received(self):
         pass
 
+    def __wait(self, buffer: Union[bytes, bytearray]) -> None:
+        if self.buffer is None:
+            self.buffer = bytearray(buffer)
+
+    def __reject(self, response: bytes) -> None:
+        self.__cancel_idle_timer()
+        self.buffer = None
+        self.transport.write(response)
+        self.transport.close()
+
+    def __select(self, protocol_type: type) -> AbstractProtocol:
+        self.__cancel_idle_timer()
+        protocol = self.injector[protocol_type]
+        self.connection_lost = protocol.connection_lost
+        self.pause_writing = protocol.pause_writing
+        self.resume_writing = protocol.resume_writing
+        self.data_received = protocol.data_received
+        self.eof_received = protocol.eof_received
+        return protocol
+
+    def __cancel_idle_timer(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
     # --------------------- #
     # PARSER EVENT HANDLERS #
     # --------------------- #
@@ -1,15 +1,31 @@
 from cgi import parse_header
-from http.client import parse_headers
 from abc import ABC, abstractmethod
 from enum import Enum
-from tempfile import TemporaryFile
-from io import BytesIO
-from typing import List
+from tempfile import SpooledTemporaryFile
+from hashlib import new as new_hash
+from asyncio import Event
+from collections import deque
+from typing import AsyncIterator, Deque, List, Union
+
+from yapic.di import Token
 
 from ..error import HTTPError
+from ..headers import Headers
+from .input import Input
+
+# maximum size of buffered, but not consumed data of a streaming request body
+STREAM_BUFFER_SIZE = 1048576
+
+# maximum size of the headers of one multipart/form-data part
+MAX_PART_HEADERS_SIZE = 16384
+
+# uploaded files up to this size are kept in memory
+SPOOL_MEMORY_SIZE = 1048576
 
 
 class BodyParser(ABC):
+    streaming = False
+
     @abstractmethod
     def feed(self, data: bytes) -> None:
         pass
@@ -18,12 +34,87 @@ class BodyParser(ABC):
     def process(self) -> None:
         pass
 
+    def discard(self) -> None:
+        """ Called when the request is done, but the body is not completely consumed """
+        pass
+
+    def abort(self, error: Exception) -> None:
+        """ Called when the connection is lost, before the body is completely received """
+        pass
+
+
+class MultipartState(Enum):
+    PREAMBLE = 0
+    BOUNDARY = 1
+    HEADERS = 2
+    CONTENT = 3
+    END = 4
+
+
+class Spool:
+    """ File like storage of uploaded content
+
+    Content is kept in memory until it is larger than ``max_size``, after that it is moved into a temporary file.
+    The size and optionally a hash digest is computed while the content is written.
+
+    example::
+
+        spool = Spool(1024, "sha256")
+        spool.write(b"data")
+        spool.seek(0)
+        spool.hexdigest()
+    """
+    __slots__ = ("file", "size", "hash")
+
+    file: SpooledTemporaryFile
+    size: int
+
+    def __init__(self, max_size: int = SPOOL_MEMORY_SIZE, hash_name: str = None):
+        self.file = SpooledTemporaryFile(max_size=max_size)
+        self.size = 0
+        self.hash = None if hash_name is None else new_hash(hash_name)
+
+    @property
+    def in_memory(self) -> bool:
+        return not self.file._rolled
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.hash is not None:
+            self.hash.update(data)
+        return self.file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def fileno(self) -> int:
+        """ Returns the file descriptor, the content is moved to disk if it is in memory """
+        return self.file.fileno()
+
+    def close(self) -> None:
+        self.file.close()
 
-class FDE_State(Enum):
-    EMPTY = 0
-    BOUNDARY_RECVD = 1
-    HEADERS_RECVD = 2
-    CONTENT_RECVD = 4
+    def digest(self) -> bytes:
+        if self.hash is None:
+            raise RuntimeError("Hashing is not enabled")
+        return self.hash.digest()
+
+    def hexdigest(self) -> str:
+        if self.hash is None:
+            raise RuntimeError("Hashing is not enabled")
+        return self.hash.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
 
 class FormDataEntry:
@@ -44,154 +135,292 @@ class FormDataFile(FormDataEntry):
         self.content_type = content_type
 
 
-# class FormDataParser(BodyParser):
-#     __slots__ = ("begin", "end", "buffer", "entries", "current", "parser")
-
-#     begin: bytes
-#     buffer: bytes
-#     entries: List[FormDataEntry]
-#     current: FormDataEntry
-
-#     def __init__(self, boundary: str):
-#         self.begin = b"--" + boundary.encode("ASCII")
-#         self.end = b"--" + boundary.encode("ASCII") + b"--"
-#         self.buffer = b""
-#         self.current = FormDataEntry()
-#         self.entries = [self.current]
-#         self.parser = HttpRequestParser(self)
-#         self.parser.feed_data(b"GET / HTTP/1.1\r\n")
-
-#     def feed(self, data: bytes) -> None:
-#         self.buffer += data
-
-#         boundary_length = len(self.begin)
-#         if len(self.buffer) < boundary_length + 4:
-#             # wait for more data
-#             return
-
-#         if self.current.state == FDE_State.EMPTY:
-#             if not self.buffer.startswith(self.begin):
-#                 raise HTTPError(400)
-#             else:
-#                 self.current.state = FDE_State.BOUNDARY_RECVD
-#                 self.buffer = self.buffer[boundary_length + 2:]
-#         else:
-#             try:
-#                 idx = self.buffer.index(self.begin)
-#             except ValueError:
-#                 pass
-#             else:
-#                 print("### end found", idx)
-
-#                 self.parser.feed_data(self.buffer[0:idx])
-
-#                 # reset parser
-#                 self.parser = HttpRequestParser(self)
-#                 self.parser.feed_data(b"GET / HTTP/1.1\r\n")
-#                 rem = self.buffer[idx + 1:]
-#                 self.buffer = b""
-#                 self.feed(rem)
-#                 return
-
-#         self.parser.feed_data(self.buffer)
-
-#     def on_header(self, name: bytes, value: bytes) -> None:
-#         self.current.headers[name] = value
-
-#     def on_headers_complete(self) -> None:
-#         print(self.current.headers)
-#         try:
-#             cd = self.current.headers[b"content-disposition"]
-#         except KeyError:
-#             pass
-#         else:
-#             cd = parse_header(cd.decode("utf-8"))
-#             print("content-disposition", cd)
-
-#             self.current.content = TemporaryFile()
-
-#     def on_body(self, body: bytes):
-#         pass
-
-#     def begin_entry(self):
-#         self.current = FormDataEntry()
-#         self.entries.append(self.current)
+class FormDataParser(BodyParser):
+    """ Incremental ``multipart/form-data`` parser
 
+    Only the unprocessed tail of the received data is buffered, file contents are
+    written into a :class:`Spool` as they arrive.
+    """
+    __slots__ = ("buffer", "boundary", "delimiter", "fields", "state", "current", "value", "spool_size",
+                 "hash_name")
 
-class FormDataParser(BodyParser):
-    __slots__ = ("buffer", "boundary", "fields")
+    SPOOL_SIZE = Token("UPLOAD_SPOOL_SIZE")
+    HASH = Token("UPLOAD_HASH")
 
-    buffer: bytes
+    buffer: bytearray
     boundary: bytes
+    delimiter: bytes
     fields: List[FormDataEntry]
-
-    def __init__(self, boundary: bytes):
-        self.buffer = b""
+    state: MultipartState
+    current: Union[FormDataEntry, None]
+    value: Union[bytearray, None]
+    spool_size: int
+    hash_name: Union[str, None]
+
+    def __init__(self, boundary: bytes, spool_size: int = SPOOL_MEMORY_SIZE, hash_name: str = None):
+        # the first boundary is not preceded by a line break
+        self.buffer = bytearray(b"\r\n")
         self.boundary = boundary
+        self.delimiter = b"\r\n--" + boundary
         self.fields = []
+        self.state = MultipartState.PREAMBLE
+        self.current = None
+        self.value = None
+        self.spool_size = spool_size
+        self.hash_name = hash_name
 
     def feed(self, data: bytes):
-        self.buffer += data
+        buffer = self.buffer
+        buffer += data
+
+        while True:
+            state = self.state
+
+            if state is MultipartState.CONTENT or state is MultipartState.PREAMBLE:
+                idx = buffer.find(self.delimiter)
+                if idx == -1:
+                    # keep the tail, that may be the beginning of the delimiter
+                    idx = len(buffer) - len(self.delimiter) + 1
+                    if idx > 0:
+                        if state is MultipartState.CONTENT:
+                            self.__content(buffer, idx)
+                        del buffer[:idx]
+                    return
+                else:
+                    if state is MultipartState.CONTENT:
+                        self.__content(buffer, idx)
+                        self.__end_part()
+                    del buffer[:idx + len(self.delimiter)]
+                    self.state = MultipartState.BOUNDARY
+
+            elif state is MultipartState.BOUNDARY:
+                if len(buffer) < 2:
+                    return
+
+                if buffer.startswith(b"--"):
+                    self.state = MultipartState.END
+                elif buffer.startswith(b"\r\n"):
+                    self.state = MultipartState.HEADERS
+                else:
+                    raise HTTPError(400)
+                del buffer[:2]
+
+            elif state is MultipartState.HEADERS:
+                idx = buffer.find(b"\r\n\r\n")
+                if idx == -1:
+                    if len(buffer) > MAX_PART_HEADERS_SIZE:
+                        raise HTTPError(400)
+                    return
+
+                self.__begin_part(parse_part_headers(buffer, idx))
+                del buffer[:idx + 4]
+                self.state = MultipartState.CONTENT
+
+            else:
+                # ignore epilogue
+                buffer.clear()
+                return
 
     def process(self):
-        if self.buffer is None:
-            return
+        if self.state is not MultipartState.END:
+            raise HTTPError(400)
+
+    def __begin_part(self, headers: Headers):
+        self.current = None
+        self.value = None
 
-        end = b"--" + self.boundary + b"--\r\n"
-        if not self.buffer.endswith(end):
+        try:
+            cd = headers[b"content-disposition"]
+        except KeyError:
             raise HTTPError(400)
 
-        parts = self.buffer[0:-len(end)].split(b"--" + self.boundary + b"\r\n")
-        self.buffer = None
+        cd = parse_header(cd.decode("utf-8"))
+        if cd[0] != "form-data":
+            return
+
+        cd = cd[1]
+        if "name" not in cd:
+            return
 
-        for part in parts:
-            part = part[0:-2]  # remove trailing \r\n
-            if not part:
-                continue
+        if "filename" in cd:
+            if b"content-type" in headers:
+                ct = parse_header(headers[b"content-type"].decode("utf-8"))
+            else:
+                ct = None
+            content = Spool(self.spool_size, self.hash_name)
+            self.current = FormDataFile(headers, content, cd["name"], cd["filename"], ct)
+        else:
+            self.value = bytearray()
+            self.current = FormDataEntry(headers, None, cd["name"])
+
+    def __content(self, buffer: bytearray, end: int):
+        if self.current is None:
+            return
 
-            sub_parts = part.split(b"\r\n\r\n")
-            if len(sub_parts) < 2:
-                raise HTTPError(400)
+        if self.value is None:
+            with memoryview(buffer) as view:
+                self.current.content.write(view[:end])
+        else:
+            self.value += buffer[:end]
 
-            head = sub_parts.pop(0)
-            body = b"\r\n\r\n".join(sub_parts)
+    def __end_part(self):
+        current = self.current
+        if current is None:
+            return
 
-            headers = parse_headers(BytesIO(head))
+        if self.value is None:
+            current.content.seek(0)
+        else:
+            current.content = bytes(self.value)
+        self.fields.append(current)
+        self.current = None
+        self.value = None
 
-            try:
-                cd = headers["content-disposition"]
-            except KeyError:
-                raise HTTPError(400)
-            else:
-                cd = parse_header(cd)
 
-                if cd[0] != "form-data":
-                    continue
+def parse_part_headers(buffer: bytearray, end: int) -> Headers:
+    headers = Headers()
+    for line in bytes(buffer[:end]).split(b"\r\n"):
+        name, sep, value = line.partition(b":")
+        if not sep:
+            raise HTTPError(400)
+        headers[name.strip()] = value.strip()
+    return headers
 
-                cd = cd[1]
-                if "name" in cd:
-                    if "filename" in cd:
-                        content = TemporaryFile("wb")
-                        content.write(body)
 
-                        if "content-type" in headers:
-                            ct = parse_header(headers["content-type"])
-                        else:
-                            ct = None
+def form_boundary(content_type: bytes) -> Union[bytes, None]:
+    """ Returns the boundary of a ``multipart/form-data`` content type, or ``None`` for other types """
+    ct, params = parse_header(content_type.decode("latin-1"))
+    if ct != "multipart/form-data":
+        return None
 
-                        self.fields.append(FormDataFile(headers, content, cd["name"], cd["filename"], ct))
-                    else:
-                        self.fields.append(FormDataEntry(headers, body, cd["name"]))
+    try:
+        boundary = params["boundary"].encode("ASCII")
+    except (KeyError, UnicodeEncodeError):
+        raise HTTPError(400)
+    if not boundary:
+        raise HTTPError(400)
+    return boundary
 
 
 class RawBody(BodyParser):
-    __slots__ = ("data", )
-
-    def __init__(self):
-        self.data = b""
+    """ Unparsed request body
+
+    The body is available as a whole in :attr:`data` after the request is completed,
+    or chunk by chunk as it arrives with :meth:`stream`. While streaming, reading from
+    the connection is paused when more than ``limit`` bytes are waiting to be consumed.
+    When the connection is lost before the body is complete, :meth:`stream` raises ``ConnectionResetError``.
+    """
+    __slots__ = ("input", "limit", "chunks", "size", "readable", "completed", "streaming", "paused", "discarded",
+                 "error")
+
+    input: Input
+    limit: int
+    chunks: Deque[bytes]
+    size: int
+    readable: Event
+    completed: bool
+    streaming: bool
+    paused: bool
+    discarded: bool
+    error: Union[Exception, None]
+
+    def __init__(self, input: Input = None, limit: int = STREAM_BUFFER_SIZE):
+        self.input = input
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+        self.readable = Event()
+        self.completed = False
+        self.streaming = False
+        self.paused = False
+        self.discarded = False
+        self.error = None
+
+    @property
+    def data(self) -> bytes:
+        chunks = self.chunks
+        if len(chunks) > 1:
+            data = b"".join(chunks)
+            chunks.clear()
+            chunks.append(data)
+            return data
+        elif chunks:
+            return chunks[0]
+        else:
+            return b""
 
     def feed(self, data: bytes) -> None:
-        self.data += data
+        if self.discarded:
+            return
+
+        self.chunks.append(data)
+        self.size += len(data)
+        self.readable.set()
+
+        if self.streaming and not self.paused and self.size > self.limit and self.input is not None:
+            self.paused = True
+            self.input.pause_reading()
 
     def process(self):
-        pass
+        self.completed = True
+        self.readable.set()
+
+    def discard(self):
+        self.discarded = True
+        self.chunks.clear()
+        self.size = 0
+        self.__resume()
+
+    def abort(self, error: Exception) -> None:
+        self.error = error
+        self.readable.set()
+
+    def _recycle(self) -> None:
+        """ Reset to the initial state, before it is reused with another request """
+        self.input = None
+        self.chunks.clear()
+        self.size = 0
+        self.readable.clear()
+        self.completed = False
+        self.paused = False
+        self.discarded = False
+        self.error = None
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """ Yields the chunks of the body as they arrive, the yielded chunks are not kept in :attr:`data`
+
+        example::
+
+            async for chunk in body.stream():
+                ...
+        """
+        if self.streaming:
+            raise RuntimeError("Request body is already streaming")
+        self.streaming = True
+
+        chunks = self.chunks
+        try:
+            while True:
+                while chunks:
+                    chunk = chunks.popleft()
+                    self.size -= len(chunk)
+                    if self.paused and self.size <= self.limit // 2:
+                        self.__resume()
+                    yield chunk
+
+                if self.completed:
+                    return
+                if self.error is not None:
+                    raise self.error
+
+                self.readable.clear()
+                self.__resume()
+                await self.readable.wait()
+        finally:
+            self.streaming = False
+            self.__resume()
+
+    def __resume(self):
+        if self.paused:
+            self.paused = False
+            self.input.resume_reading()
@@ -0,0 +1,180 @@
+import gzip
+import zlib
+from asyncio import AbstractEventLoop
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Tuple, Union
+
+from yapic.di import Inject, Token
+
+from ..headers import Headers
+
+__all__ = "Compression", "VariantCache"
+
+_ENCODERS: Dict[bytes, Callable[[bytes, int], bytes]] = {
+    b"gzip": lambda data, level: gzip.compress(data, level, mtime=0),
+    b"deflate": lambda data, level: zlib.compress(data, level),
+}
+
+# preferred encoding, when the client accepts more with the same quality
+_PREFERENCE = (b"gzip", b"deflate")
+
+
+class VariantCache:
+    """ LRU cache of compressed bodies, the total size is limited by ``max_size`` bytes
+
+    The keys are ``(key, encoding)`` tuples, where ``key`` identifies the content, eg.: ``(path, etag)``.
+    """
+    __slots__ = ("max_size", "size", "entries")
+
+    max_size: int
+    size: int
+    entries: Dict[Tuple[Hashable, bytes], bytes]
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key: Tuple[Hashable, bytes]) -> Union[bytes, None]:
+        try:
+            value = self.entries[key]
+        except KeyError:
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Tuple[Hashable, bytes], value: bytes) -> None:
+        size = len(value)
+        if size > self.max_size:
+            return
+
+        entries = self.entries
+        old = entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+
+        while entries and self.size + size > self.max_size:
+            self.size -= len(entries.popitem(last=False)[1])
+
+        entries[key] = value
+        self.size += size
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Compression:
+    """ Response body compression, negotiated by the ``Accept-Encoding`` request header
+
+    Bodies with a content type listed in ``TYPES`` (a prefix like ``text/`` matches every text type),
+    and not smaller than ``MIN_SIZE`` are compressed. Bodies larger than ``OFFLOAD_SIZE`` are compressed
+    in the default executor. Compressed variants of responses with an ``etag`` header are cached by the
+    path and the etag, because an etag is only unique for one resource.
+
+    example::
+
+        injector[Compression.ENABLED] = True
+        injector[Compression.TYPES] = [b"text/", b"application/json"]
+    """
+    __slots__ = ("loop", "enabled", "types", "min_size", "level", "offload_size", "cache_size", "cache")
+
+    ENABLED = Token("COMPRESSION_ENABLED")
+    TYPES = Token("COMPRESSION_TYPES")
+    MIN_SIZE = Token("COMPRESSION_MIN_SIZE")
+    LEVEL = Token("COMPRESSION_LEVEL")
+    OFFLOAD_SIZE = Token("COMPRESSION_OFFLOAD_SIZE")
+    CACHE_SIZE = Token("COMPRESSION_CACHE_SIZE")
+
+    loop: Inject[AbstractEventLoop]
+    enabled: Inject[ENABLED]
+    types: Inject[TYPES]
+    min_size: Inject[MIN_SIZE]
+    level: Inject[LEVEL]
+    offload_size: Inject[OFFLOAD_SIZE]
+    cache_size: Inject[CACHE_SIZE]
+
+    def __init__(self):
+        self.types = tuple(self.types)
+        self.cache = VariantCache(self.cache_size)
+
+    def negotiate(self, accept_encoding: Union[bytes, None], content_type: bytes) -> Union[bytes, None]:
+        """ Returns the encoding, that should be used for the given content type """
+        if not self.enabled or accept_encoding is None or not content_type.startswith(self.types):
+            return None
+        return negotiate(accept_encoding, _PREFERENCE)
+
+    async def compress(self, data: bytes, encoding: bytes, key: Hashable = None) -> bytes:
+        """ Compress data with the given encoding, the result is cached when ``key`` is given
+
+        The ``key`` must identify the content, eg.: ``(path, etag)``.
+        """
+        if key is not None:
+            compressed = self.cache.get((key, encoding))
+            if compressed is not None:
+                return compressed
+
+        if len(data) > self.offload_size:
+            compressed = await self.loop.run_in_executor(None, _ENCODERS[encoding], data, self.level)
+        else:
+            compressed = _ENCODERS[encoding](data, self.level)
+
+        if key is not None:
+            self.cache.put((key, encoding), compressed)
+        return compressed
+
+    async def compress_response(self, headers: Headers, accept_encoding: Union[bytes, None], content_type: bytes,
+                                data: bytes, path: bytes = None) -> bytes:
+        """ Compress the response body if possible, and set ``content-encoding`` and ``vary`` headers
+
+        The result is cached, when the response has an ``etag`` header and the ``path`` of the resource is given.
+        """
+        if len(data) < self.min_size or b"content-encoding" in headers or not content_type.startswith(self.types):
+            return data
+
+        add_vary(headers)
+        encoding = self.negotiate(accept_encoding, content_type)
+        if encoding is None:
+            return data
+
+        etag = headers.get(b"etag")
+        compressed = await self.compress(data, encoding, None if etag is None or path is None else (path, etag))
+        if len(compressed) >= len(data):
+            return data
+
+        headers[b"content-encoding"] = encoding
+        if etag is not None and not etag.startswith(b"W/"):
+            # the compressed representation is not byte to byte equal with the original one
+            headers[b"etag"] = b"W/" + etag
+        return compressed
+
+
+def negotiate(accept_encoding: bytes, available: Iterable[bytes]) -> Union[bytes, None]:
+    """ Choose the encoding with the highest quality from the ``available`` ones """
+    qualities = {}
+    for item in accept_encoding.split(b","):
+        coding, _, params = item.partition(b";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith(b"q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[coding] = q
+
+    default = qualities.get(b"*", 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = qualities.get(coding, default)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def add_vary(headers: Headers) -> None:
+    vary = headers.get(b"vary")
+    if vary is None:
+        headers[b"vary"] = b"accept-encoding"
+    elif b"accept-encoding" not in vary.lower():
+        headers[b"vary"] = vary + b", accept-encoding"
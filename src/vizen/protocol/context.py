@@ -0,0 +1,272 @@
+from http.cookies import Morsel
+from typing import Any, Dict, Iterable, Union
+from yapic.di import Inject, Injector, Token
+
+from ..headers import Headers
+from ..json import Json
+from ..router import Router
+from .protocol import UPGRADE
+from .request import Request
+from .response import Response
+from .cookie import Cookie
+from .params import Params
+from .body import BodyParser, RawBody
+from .input import Input
+from .output import Output
+from .compression import Compression
+from .pool import Pool
+
+
+class RequestContext:
+    """ Core objects of a request, available without resolving them with the injector
+
+    The DI scope of the request is descended from the connection injector lazily, only when
+    something else is requested than the core objects, and the core objects are registered in it.
+    It can be used like the injector, :class:`Request` and :class:`Response` get this as ``injector``.
+
+    example::
+
+        context[Response] is context.response
+        context[Session]  # descends the scope
+    """
+    __slots__ = ("factory", "parent", "request", "response", "body", "output", "params", "compression", "json",
+                 "upgrade", "_cookie", "_injector")
+
+    factory: "RequestContextFactory"
+    parent: Injector
+    request: Request
+    response: Response
+    body: BodyParser
+    output: Output
+    params: Union[Params, None]
+    compression: Compression
+    json: Json
+    upgrade: Any
+
+    def __init__(self, factory: "RequestContextFactory", parent: Injector, output: Output, body: BodyParser):
+        self.factory = factory
+        self.parent = parent
+        self.request = None
+        self.response = None
+        self.output = output
+        self.body = body
+        self.compression = factory.compression
+        self.json = factory.json
+        self.params = None
+        self.upgrade = None
+        self._cookie = None
+        self._injector = None
+
+    @property
+    def cookie(self) -> Cookie:
+        cookie = self._cookie
+        if cookie is None:
+            cookie = self._cookie = self.factory.cookie(self.request)
+        return cookie
+
+    @cookie.setter
+    def cookie(self, value: Cookie) -> None:
+        self._cookie = value
+
+    def new_cookies(self) -> Iterable[Morsel]:
+        """ Returns the cookies set in the response, without loading the cookies of the request """
+        cookie = self._cookie
+        return () if cookie is None else cookie._new()
+
+    @property
+    def injector(self) -> Injector:
+        """ The DI scope of the request, created on first access """
+        injector = self._injector
+        if injector is None:
+            injector = self._injector = self.parent.descend()
+            injector[RequestContext] = self
+            if self.request is not None:
+                injector[Request] = self.request
+            if self.response is not None:
+                injector[Response] = self.response
+            injector[BodyParser] = self.body
+            injector[Output] = self.output
+            injector.provide(Cookie, self.__get_cookie)
+            if self.params is not None:
+                injector[Params] = self.params
+            if self.upgrade is not None:
+                injector[UPGRADE] = self.upgrade
+        return injector
+
+    def __get_cookie(self) -> Cookie:
+        return self.cookie
+
+    def __getitem__(self, key: Any) -> Any:
+        try:
+            name = _CORE[key]
+        except (KeyError, TypeError):
+            return self.injector[key]
+        return getattr(self, name)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        try:
+            name = _CORE[key]
+        except (KeyError, TypeError):
+            self.injector[key] = value
+        else:
+            setattr(self, name, value)
+            if self._injector is not None:
+                self._injector[key] = value
+
+
+_CORE: Dict[Any, str] = {
+    Request: "request",
+    Response: "response",
+    Cookie: "cookie",
+    Params: "params",
+    BodyParser: "body",
+    Output: "output",
+    Compression: "compression",
+    Json: "json",
+    UPGRADE: "upgrade",
+}
+
+# types of handler arguments, that are passed without the injector
+CORE_ARGS = frozenset(t for t in _CORE if isinstance(t, type))
+
+
+class RequestContextFactory:
+    """ Creates the request context, and the request and response in it, without the injector
+
+    When :class:`Request` or :class:`Response` is provided by another type, they are resolved by the injector
+    instead, this is detected with the first request.
+
+    The objects of finished requests are reused, when ``POOL_SIZE`` is set (it is the maximum number of
+    released objects kept per type). With ``POOL_DEBUG`` the use of a released object raises ``RuntimeError``.
+
+    example::
+
+        injector[RequestContextFactory.POOL_SIZE] = 1024
+    """
+    __slots__ = ("router", "compression", "json", "pool_size", "pool_debug", "resolve", "requests", "responses",
+                 "headers_pool", "cookies", "bodies")
+
+    POOL_SIZE = Token("REQUEST_POOL_SIZE")
+    POOL_DEBUG = Token("REQUEST_POOL_DEBUG")
+
+    router: Inject[Router]
+    compression: Inject[Compression]
+    json: Inject[Json]
+    pool_size: Inject[POOL_SIZE]
+    pool_debug: Inject[POOL_DEBUG]
+
+    resolve: Union[bool, None]
+    requests: Pool
+    responses: Pool
+    headers_pool: Pool
+    cookies: Pool
+    bodies: Pool
+
+    def __init__(self):
+        self.resolve = None
+        self.requests = Pool(self.pool_size, self.pool_debug)
+        self.responses = Pool(self.pool_size, self.pool_debug)
+        self.headers_pool = Pool(self.pool_size, self.pool_debug)
+        self.cookies = Pool(self.pool_size, self.pool_debug)
+        self.bodies = Pool(self.pool_size, self.pool_debug)
+
+    def __call__(self, parent: Injector, output: Output, body: BodyParser) -> RequestContext:
+        context = RequestContext(self, parent, output, body)
+        if self.resolve is not False:
+            return self.__resolve(context)
+
+        request = self.requests.acquire()
+        if request is None:
+            request = create(Request, injector=context, router=self.router, body=body)
+        else:
+            request.injector = context
+            request.body = body
+        context.request = request
+
+        response = self.responses.acquire()
+        if response is None:
+            response = create(Response, injector=context, output=output, compression=self.compression)
+        else:
+            response.injector = context
+            response.output = output
+        context.response = response
+        return context
+
+    def __resolve(self, context: RequestContext) -> RequestContext:
+        injector = context.injector
+        request = context.request = injector[Request]
+        injector[Request] = request
+        response = context.response = injector[Response]
+        injector[Response] = response
+        request.injector = response.injector = context
+
+        if self.resolve is None:
+            self.resolve = type(request) is not Request or type(response) is not Response
+        return context
+
+    def headers(self) -> Headers:
+        headers = self.headers_pool.acquire()
+        if headers is None:
+            headers = Headers()
+        return headers
+
+    def release_headers(self, headers: Headers) -> None:
+        """ Put back the headers into the pool, eg.: of a request, that is ignored """
+        if self.pool_size and type(headers) is Headers:
+            headers.clear()
+            self.headers_pool.release(headers)
+
+    def cookie(self, request: Request) -> Cookie:
+        cookie = self.cookies.acquire()
+        if cookie is None:
+            cookie = create(Cookie, request=request)
+        else:
+            cookie.request = request
+            cookie._load()
+        return cookie
+
+    def raw_body(self, input: Input) -> RawBody:
+        body = self.bodies.acquire()
+        if body is None:
+            body = RawBody(input)
+        else:
+            body.input = input
+        return body
+
+    def release(self, context: RequestContext) -> None:
+        """ Reset the objects of the finished request, and put them back into the pools """
+        if not self.pool_size:
+            return
+
+        request = context.request
+        headers = request.headers
+        if type(request) is Request:
+            request._recycle()
+            self.requests.release(request)
+
+        response = context.response
+        if type(response) is Response:
+            response._recycle()
+            self.responses.release(response)
+
+        self.release_headers(headers)
+
+        cookie = context._cookie
+        if cookie is not None:
+            cookie._recycle()
+            self.cookies.release(cookie)
+
+        body = context.body
+        # a body, that is still streaming is referenced by its unfinished iterator
+        if type(body) is RawBody and not body.streaming:
+            body._recycle()
+            self.bodies.release(body)
+
+
+def create(cls: type, **injected: Any) -> Any:
+    """ Create an instance like the injector does, the injected attributes are set before ``__init__`` """
+    obj = cls.__new__(cls)
+    for name, value in injected.items():
+        setattr(obj, name, value)
+    obj.__init__()
+    return obj
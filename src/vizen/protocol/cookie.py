@@ -11,12 +11,13 @@ class Cookie:
     request: Inject[Request]
 
     def __init__(self):
-        headers = self.request.headers
         self.__get = SimpleCookie()
         self.__set = SimpleCookie()
+        self._load()
 
+    def _load(self) -> None:
         try:
-            cookie = headers[b"cookie"]
+            cookie = self.request.headers[b"cookie"]
         except KeyError:
             pass
         else:
@@ -79,3 +80,9 @@ class Cookie:
 
     def _new(self):
         return self.__set.values()
+
+    def _recycle(self) -> None:
+        """ Reset to the initial state, before it is reused with another request (see :meth:`_load`) """
+        self.request = None
+        self.__get.clear()
+        self.__set.clear()
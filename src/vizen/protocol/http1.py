@@ -1,20 +1,55 @@
-from httptools import HttpRequestParser, parse_url
-from cgi import parse_header
-from typing import Any
+from asyncio import Task, TimerHandle
+from httptools import HttpRequestParser, HttpParserError, HttpParserUpgrade, parse_url
+from typing import Any, Set, Union
 
-# from yapic.di import Inject
+from yapic.di import Inject, Token
 
 from ..headers import Headers
-from ..error import handle_error
-from .protocol import AbstractProtocol
+from ..error import HTTPError, handle_error
+from .protocol import AbstractProtocol, SOCK_TRANSPORT, UPGRADE
 from .request import Request
 from .response import Response
-from .body import BodyParser, FormDataParser, RawBody
-from .cookie import Cookie
+from .body import BodyParser, FormDataParser, form_boundary
+from .context import RequestContext, RequestContextFactory
+from .output import Output, ResponseQueue
+from .input import Input
 
 
 class HTTP1Protocol(AbstractProtocol):
-    __slots__ = ("parser", "headers", "request", "response", "url", "body_parser")
+    """ HTTP/1.x protocol with persistent connections and pipelining
+
+    The connection is closed after ``KEEP_ALIVE_TIMEOUT`` seconds of inactivity, or after
+    ``MAX_REQUESTS`` requests, or when the client does not want to keep it alive.
+
+    Pipelined requests are handled concurrently, but the responses are written in request order.
+    Reading is paused while more than ``PIPELINE_DEPTH`` responses are waiting.
+
+    Request bodies (with ``content-length`` or chunked transfer encoding) larger than
+    ``MAX_BODY_SIZE`` are rejected with ``413 Payload Too Large``.
+
+    The connection is closed after an ``Upgrade`` request, unless the handler hands it over
+    to another protocol with the callable provided as ``UPGRADE`` (see :class:`WebSocket`).
+    """
+    __slots__ = ("parser", "headers", "request", "response", "url", "body_parser", "transport", "input", "output",
+                 "keep_alive_timeout", "max_requests", "pipeline_depth", "max_body_size", "spool_size",
+                 "upload_hash", "contexts", "requests", "queue", "closing", "paused", "idle_timer", "task",
+                 "tasks", "body_size", "upgraded", "upgrade_data")
+
+    KEEP_ALIVE_TIMEOUT = Token("KEEP_ALIVE_TIMEOUT")
+    MAX_REQUESTS = Token("MAX_REQUESTS")
+    PIPELINE_DEPTH = Token("PIPELINE_DEPTH")
+    MAX_BODY_SIZE = Token("MAX_BODY_SIZE")
+
+    transport: Inject[SOCK_TRANSPORT]
+    input: Inject[Input]
+    output: Inject[Output]
+    keep_alive_timeout: Inject[KEEP_ALIVE_TIMEOUT]
+    max_requests: Inject[MAX_REQUESTS]
+    pipeline_depth: Inject[PIPELINE_DEPTH]
+    max_body_size: Inject[MAX_BODY_SIZE]
+    spool_size: Inject[FormDataParser.SPOOL_SIZE]
+    upload_hash: Inject[FormDataParser.HASH]
+    contexts: Inject[RequestContextFactory]
 
     parser: HttpRequestParser
     body_parser: BodyParser
@@ -22,32 +57,85 @@ class HTTP1Protocol(AbstractProtocol):
     response: Response
     headers: Headers
     url: Any
+    requests: int
+    queue: ResponseQueue
+    closing: bool
+    paused: bool
+    idle_timer: Union[TimerHandle, None]
+    task: Union[Task, None]
+    tasks: Set[Task]
+    body_size: int
+    upgraded: Union[AbstractProtocol, None]
+    upgrade_data: bytes
 
     def __init__(self):
         super().__init__()
         self.parser = HttpRequestParser(self)
-        self.headers = Headers()
         self.body_parser = None
+        self.requests = 0
+        self.queue = ResponseQueue(self.output)
+        self.closing = False
+        self.paused = False
+        self.idle_timer = None
+        self.task = None
+        self.tasks = set()
+        self.body_size = 0
+        self.upgraded = None
+        self.upgrade_data = b""
 
     # ---------------- #
     # PROTOCOL METHODS #
     # ---------------- #
 
     def connection_lost(self, exc):
-        # print("HTTP1Protocol.connection_lost")
-        pass
+        if self.upgraded is not None:
+            self.upgraded.connection_lost(exc)
+        self.__cancel_idle_timer()
+        self.output.connection_lost()
+        self.queue.close()
+
+        body = self.body_parser
+        if body is not None:
+            self.body_parser = None
+            body.abort(ConnectionResetError("Connection lost"))
+
+        if self.upgraded is None:
+            # the handler, that streams the body gets the error from the stream
+            for task in tuple(self.tasks):
+                if task.context.body is not body or not body.streaming:
+                    task.cancel()
 
     def pause_writing(self):
-        print("HTTP1Protocol.pause_writing")
+        self.output.pause_writing()
 
     def resume_writing(self):
-        print("HTTP1Protocol.resume_writing")
+        self.output.resume_writing()
 
     def data_received(self, data):
-        self.parser.feed_data(data)
+        # the body of the last request is still received after closing
+        if self.closing and self.body_parser is None:
+            if self.upgraded is not None:
+                self.upgraded.data_received(data)
+            return
+
+        try:
+            self.parser.feed_data(data)
+        except HttpParserUpgrade as e:
+            # data following the upgrade request belongs to the next protocol
+            self.upgrade_data = data[e.args[0]:]
+        except HttpParserError:
+            if self.body_parser is not None:
+                self.__body_error(HTTPError(400))
+                return
+            # close the connection after the already received requests are answered
+            self.closing = True
+            if self.queue:
+                self.input.pause_reading()
+            else:
+                self.transport.close()
 
     def eof_received(self):
-        print("HTTP1Protocol.eof_received")
+        pass
 
     # --------------------- #
     # PARSER EVENT HANDLERS #
@@ -59,61 +147,219 @@ class HTTP1Protocol(AbstractProtocol):
     def on_header(self, name: bytes, value: bytes) -> None:
         self.headers[name] = value
 
+    def on_message_begin(self) -> None:
+        self.__cancel_idle_timer()
+        self.headers = self.contexts.headers()
+        self.url = None
+        self.body_parser = None
+        self.request = None
+        self.response = None
+        self.task = None
+        self.body_size = 0
+
     def on_headers_complete(self) -> None:
-        injector = self.injector.descend()
+        if self.closing:
+            # requests pipelined after a "connection: close" request are ignored
+            self.contexts.release_headers(self.headers)
+            self.headers = None
+            return
 
-        method = self.parser.get_method()
-        if method == b"POST":
-            if b"content-type" in self.headers:
-                ct, params = parse_header(self.headers[b"content-type"].decode("ASCII"))
+        self.requests += 1
+        keep_alive = self.parser.should_keep_alive() and self.requests < self.max_requests
+        upgrade = self.parser.should_upgrade()
+        if upgrade:
+            keep_alive = False
 
-                if ct == "multipart/form-data":
-                    self.body_parser = FormDataParser(params["boundary"].encode("ASCII"))
+        method = self.parser.get_method()
+        body_error = None
+        if method == b"POST" and b"content-type" in self.headers:
+            try:
+                boundary = form_boundary(self.headers[b"content-type"])
+            except HTTPError as e:
+                body_error = e
+            else:
+                if boundary is not None:
+                    self.body_parser = FormDataParser(boundary, self.spool_size, self.upload_hash)
 
         if self.body_parser is None:
-            self.body_parser = RawBody()
+            self.body_parser = self.contexts.raw_body(self.input)
 
-        injector[BodyParser] = self.body_parser
+        context = self.contexts(self.injector, self.queue.push(), self.body_parser)
+        response = self.response = context.response
+        request = self.request = context.request
 
-        response = self.response = injector[Response] = injector[Response]
-        request = self.request = injector[Request] = injector[Request]
-
-        request.method = method
+        request.method = response.method = method
         request.version = response.version = self.parser.get_http_version()
         request.url = self.url
         request.headers = self.headers
 
-        injector[Cookie] = injector[Cookie]
+        if not keep_alive:
+            self.closing = True
+            response.headers[b"connection"] = b"close"
+        elif request.version == "1.0":
+            response.headers[b"connection"] = b"keep-alive"
+
+        if upgrade:
+            context[UPGRADE] = self.upgrade
 
-        task = self.loop.create_task(request())
-        task.injector = injector
+        task = self.task = self.loop.create_task(request())
+        task.context = context
+        task.error = None
         task.add_done_callback(self.__finalize_task)
+        self.tasks.add(task)
         request.on_headers.set()
 
-    # def on_message_begin(self):
-    #     print("on_message_begin")
+        if not self.paused and len(self.queue) > self.pipeline_depth:
+            self.paused = True
+            self.input.pause_reading()
+
+        if body_error is not None:
+            self.__body_error(body_error)
+        elif self.max_body_size and b"content-length" in self.headers:
+            try:
+                length = int(self.headers[b"content-length"])
+            except ValueError:
+                self.__body_error(HTTPError(400))
+            else:
+                if length > self.max_body_size:
+                    self.__body_error(HTTPError(413))
 
     def on_body(self, body: bytes):
         if self.body_parser is not None:
-            self.body_parser.feed(body)
+            self.body_size += len(body)
+            if self.max_body_size and self.body_size > self.max_body_size:
+                self.__body_error(HTTPError(413))
+            else:
+                try:
+                    self.body_parser.feed(body)
+                except HTTPError as e:
+                    self.__body_error(e)
 
     def on_message_complete(self):
-        self.body_parser.process()
+        if self.body_parser is not None:
+            try:
+                self.body_parser.process()
+            except HTTPError as e:
+                self.__body_error(e)
+            else:
+                self.body_parser = None
+                self.request.on_body.set()
+
+        if self.closing and not self.paused and self.upgraded is None:
+            # nothing is read after the last request
+            self.paused = True
+            self.input.pause_reading()
+
+    def upgrade(self, protocol_type: type) -> AbstractProtocol:
+        """ Hand over the connection to a new instance of the given protocol, after the upgrade request """
+        protocol = self.upgraded = self.injector[protocol_type]
+
+        # called soon, so the caller is able to configure the protocol before it receives anything
+        if self.upgrade_data:
+            self.loop.call_soon(protocol.data_received, self.upgrade_data)
+            self.upgrade_data = b""
+
+        if self.paused:
+            self.paused = False
+            self.input.resume_reading()
+        return protocol
+
+    def __body_error(self, error: HTTPError):
+        """ Stop receiving the body, respond with the given error and close the connection """
         self.body_parser = None
-        self.request.on_body.set()
+        self.closing = True
 
-    def on_chunk_header(self):
-        print("on_chunk_header")
+        if not self.paused:
+            self.paused = True
+            self.input.pause_reading()
 
-    def on_chunk_complete(self):
-        print("on_chunk_header")
+        task = self.task
+        if task.done():
+            if not self.queue:
+                self.transport.close()
+        else:
+            self.response.headers[b"connection"] = b"close"
+            task.error = error
+            task.cancel()
 
     def __finalize_task(self, task):
+        self.tasks.discard(task)
+        context = task.context
+        context.body.discard()
+
+        finalize = None
+        if task.cancelled():
+            response = context.response
+            if response.headers_sent or self.output.closed:
+                response.keep_alive = False
+            elif task.error is not None:
+                finalize = self.loop.create_task(handle_error(context.injector, task.error))
+            else:
+                finalize = self.loop.create_task(response.begin(503))
+        else:
+            exc = task.exception()
+            if exc is not None:
+                response = context.response
+                if response.headers_sent or self.output.closed:
+                    response.keep_alive = False
+                else:
+                    finalize = self.loop.create_task(handle_error(context.injector, exc))
+
+        if finalize is None:
+            self.__request_done(task)
+        else:
+            finalize.add_done_callback(lambda t: self.__finalize_error(t, task))
+
+    def __finalize_error(self, task, request_task: Task):
         if task.cancelled():
-            response = task.injector[Response]
-            if not response.headers_sent:
-                self.loop.create_task(response.begin(503))
+            self.transport.close()
         else:
             exc = task.exception()
             if exc is not None:
-                self.loop.create_task(handle_error(task.injector, exc))
+                if not isinstance(exc, ConnectionResetError):
+                    self.loop.call_exception_handler({
+                        "message": "Unhandled exception in request handler",
+                        "exception": exc,
+                        "protocol": self,
+                    })
+                self.transport.close()
+            else:
+                self.__request_done(request_task)
+
+    def __request_done(self, task: Task):
+        context = task.context
+        if not context.response.keep_alive and not self.closing:
+            self.closing = True
+            if not self.paused:
+                self.paused = True
+                self.input.pause_reading()
+
+        queue = self.queue
+        queue.finish(context.output)
+        self.__release(context)
+
+        if self.closing:
+            if not queue:
+                self.transport.close()
+            return
+
+        if self.paused and len(queue) <= self.pipeline_depth:
+            self.paused = False
+            self.input.resume_reading()
+
+        if not queue and self.keep_alive_timeout:
+            self.__cancel_idle_timer()
+            self.idle_timer = self.loop.call_later(self.keep_alive_timeout, self.transport.close)
+
+    def __release(self, context: RequestContext) -> None:
+        if self.request is context.request:
+            # the rest of the body is discarded
+            self.body_parser = None
+            self.request = None
+            self.response = None
+        self.contexts.release(context)
+
+    def __cancel_idle_timer(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
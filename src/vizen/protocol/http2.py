@@ -1,5 +1,579 @@
-from .protocol import AbstractProtocol
+from asyncio import Event, Task, TimerHandle
+from typing import Any, BinaryIO, Dict, Iterable, List, Tuple, Union
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.errors import ErrorCodes
+from h2.events import (ConnectionTerminated, DataReceived, RemoteSettingsChanged, RequestReceived, StreamEnded,
+                       StreamReset, WindowUpdated)
+from h2.exceptions import ProtocolError, StreamClosedError
+from h2.settings import Settings, SettingCodes
+from httptools import parse_url, HttpParserInvalidURLError
+from yapic.di import Inject, Token
+
+from ..headers import Headers
+from ..error import HTTPError, handle_error
+from .protocol import AbstractProtocol, SOCK_TRANSPORT
+from .http1 import HTTP1Protocol
+from .request import Request
+from .response import http_date
+from .body import BodyParser, FormDataParser, RawBody, form_boundary
+from .context import RequestContext, RequestContextFactory
+from .output import Output, copy_file
+
+# connection specific headers, that are not allowed in HTTP/2
+_CONNECTION_HEADERS = frozenset(
+    (b"connection", b"keep-alive", b"proxy-connection", b"transfer-encoding", b"upgrade"))
+
+# data frames are flushed to the transport after this many bytes
+_FLUSH_SIZE = 65536
 
 
 class HTTP2Protocol(AbstractProtocol):
-    __slots__ = ()
+    """ HTTP/2 protocol, selected by the connection preface (h2c with prior knowledge) or by ALPN (h2)
+
+    Every stream is handled like a HTTP/1 request, with its own :class:`Request` and :class:`Response`.
+    The response is converted into HEADERS and DATA frames by :class:`Stream`, and DATA frames
+    are only sent while the flow control window of the stream and the connection allows it.
+    Received body data is acknowledged when the body parser accepts it, so a streaming handler
+    that falls behind only blocks its own stream.
+
+    The connection is closed with GOAWAY after ``KEEP_ALIVE_TIMEOUT`` seconds without active streams.
+    """
+    __slots__ = ("transport", "output", "keep_alive_timeout", "max_body_size", "spool_size", "upload_hash",
+                 "max_concurrent_streams", "initial_window_size", "connection_window_size", "max_frame_size",
+                 "conn", "contexts", "streams", "window_updated", "idle_timer")
+
+    MAX_CONCURRENT_STREAMS = Token("H2_MAX_CONCURRENT_STREAMS")
+    INITIAL_WINDOW_SIZE = Token("H2_INITIAL_WINDOW_SIZE")
+    CONNECTION_WINDOW_SIZE = Token("H2_CONNECTION_WINDOW_SIZE")
+    MAX_FRAME_SIZE = Token("H2_MAX_FRAME_SIZE")
+
+    transport: Inject[SOCK_TRANSPORT]
+    output: Inject[Output]
+    keep_alive_timeout: Inject[HTTP1Protocol.KEEP_ALIVE_TIMEOUT]
+    max_body_size: Inject[HTTP1Protocol.MAX_BODY_SIZE]
+    spool_size: Inject[FormDataParser.SPOOL_SIZE]
+    upload_hash: Inject[FormDataParser.HASH]
+    max_concurrent_streams: Inject[MAX_CONCURRENT_STREAMS]
+    initial_window_size: Inject[INITIAL_WINDOW_SIZE]
+    connection_window_size: Inject[CONNECTION_WINDOW_SIZE]
+    max_frame_size: Inject[MAX_FRAME_SIZE]
+    contexts: Inject[RequestContextFactory]
+
+    conn: H2Connection
+    streams: Dict[int, "Stream"]
+    window_updated: Event
+    idle_timer: Union[TimerHandle, None]
+
+    def __init__(self):
+        super().__init__()
+        self.streams = {}
+        self.window_updated = Event()
+        self.idle_timer = None
+
+        conn = self.conn = H2Connection(H2Configuration(client_side=False, header_encoding=None))
+        conn.local_settings = Settings(client=False,
+                                       initial_values={
+                                           SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams,
+                                           SettingCodes.INITIAL_WINDOW_SIZE: self.initial_window_size,
+                                           SettingCodes.MAX_FRAME_SIZE: self.max_frame_size,
+                                       })
+        conn.initiate_connection()
+
+        increment = self.connection_window_size - conn.inbound_flow_control_window
+        if increment > 0:
+            conn.increment_flow_control_window(increment)
+
+    # ---------------- #
+    # PROTOCOL METHODS #
+    # ---------------- #
+
+    def connection_lost(self, exc):
+        self.__cancel_idle_timer()
+        self.output.connection_lost()
+
+        for stream in tuple(self.streams.values()):
+            stream.reset = True
+            if not stream.received:
+                stream.body.abort(ConnectionResetError("Connection lost"))
+            # the handler, that streams the body gets the error from the stream
+            if not stream.task.done() and not stream.body.streaming:
+                stream.task.cancel()
+        self.__wake_writers()
+
+    def pause_writing(self):
+        self.output.pause_writing()
+
+    def resume_writing(self):
+        self.output.resume_writing()
+
+    def data_received(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except ProtocolError:
+            self.flush_now()
+            self.transport.close()
+            return
+
+        for event in events:
+            kind = type(event)
+            if kind is DataReceived:
+                self.__data_received(event.stream_id, event.data, event.flow_controlled_length)
+            elif kind is RequestReceived:
+                self.__request_received(event.stream_id, event.headers)
+            elif kind is StreamEnded:
+                self.__stream_ended(event.stream_id)
+            elif kind is WindowUpdated or kind is RemoteSettingsChanged:
+                self.__wake_writers()
+            elif kind is StreamReset:
+                self.__stream_reset(event.stream_id)
+            elif kind is ConnectionTerminated:
+                self.flush_now()
+                self.transport.close()
+                return
+
+        self.flush_now()
+
+    def eof_received(self):
+        pass
+
+    # ------------- #
+    # FRAME WRITING #
+    # ------------- #
+
+    def flush_now(self) -> None:
+        """ Write the pending frames, without waiting for the transport's write buffer """
+        data = self.conn.data_to_send()
+        if data and not self.output.closed:
+            self.transport.write(data)
+
+    async def flush(self) -> None:
+        output = self.output
+        await output.writable.wait()
+        if output.closed:
+            raise ConnectionResetError("Connection lost")
+        data = self.conn.data_to_send()
+        if data:
+            self.transport.write(data)
+
+    async def send_data(self, stream: "Stream", data: bytes, end: bool) -> None:
+        """ Send data frames, waiting for window updates when the flow control window is exhausted """
+        conn = self.conn
+        offset = 0
+        total = len(data)
+        pending = 0
+
+        while True:
+            if self.output.closed:
+                raise ConnectionResetError("Connection lost")
+
+            try:
+                window = conn.local_flow_control_window(stream.id)
+            except StreamClosedError:
+                raise ConnectionResetError("Stream reset by peer")
+
+            if window <= 0 and offset < total:
+                if pending:
+                    pending = 0
+                    await self.flush()
+                await self.window_updated.wait()
+                continue
+
+            size = min(window, conn.max_outbound_frame_size, total - offset)
+            last = offset + size == total
+            conn.send_data(stream.id, data[offset:offset + size], end_stream=end and last)
+            offset += size
+            pending += size
+
+            if last:
+                break
+            elif pending >= _FLUSH_SIZE:
+                pending = 0
+                await self.flush()
+
+        if end:
+            stream.ended = True
+        await self.flush()
+
+    def __wake_writers(self):
+        self.window_updated.set()
+        self.window_updated = Event()
+
+    # ------------- #
+    # STREAM EVENTS #
+    # ------------- #
+
+    def __request_received(self, stream_id: int, raw_headers: List[Tuple[bytes, bytes]]) -> None:
+        self.__cancel_idle_timer()
+
+        headers = Headers()
+        method = path = authority = None
+        for name, value in raw_headers:
+            if name.startswith(b":"):
+                if name == b":method":
+                    method = value
+                elif name == b":path":
+                    path = value
+                elif name == b":authority":
+                    authority = value
+            elif name == b"cookie" and b"cookie" in headers:
+                # cookies may be split into multiple fields, for better header compression
+                headers[b"cookie"] += b"; " + value
+            else:
+                headers[name] = value
+
+        if authority is not None and b"host" not in headers:
+            headers[b"host"] = authority
+
+        try:
+            url = parse_url(path or b"")
+        except HttpParserInvalidURLError:
+            self.conn.reset_stream(stream_id, ErrorCodes.PROTOCOL_ERROR)
+            return
+
+        boundary = None
+        if method == b"POST" and b"content-type" in headers:
+            try:
+                boundary = form_boundary(headers[b"content-type"])
+            except HTTPError:
+                self.conn.reset_stream(stream_id, ErrorCodes.PROTOCOL_ERROR)
+                return
+
+        stream = self.streams[stream_id] = Stream(self, stream_id, method == b"HEAD")
+        if boundary is None:
+            body_parser = RawBody(stream)
+        else:
+            body_parser = FormDataParser(boundary, self.spool_size, self.upload_hash)
+
+        stream.body = body_parser
+        context = stream.context = self.contexts(self.injector, stream, body_parser)
+        response = context.response
+        request = stream.request = context.request
+
+        request.method = response.method = method
+        request.version = response.version = "2.0"
+        request.url = url
+        request.headers = headers
+
+        task = stream.task = self.loop.create_task(request())
+        task.add_done_callback(lambda t: self.__finalize_task(stream))
+        request.on_headers.set()
+
+        if self.max_body_size and b"content-length" in headers:
+            try:
+                length = int(headers[b"content-length"])
+            except ValueError:
+                self.__body_error(stream, HTTPError(400))
+            else:
+                if length > self.max_body_size:
+                    self.__body_error(stream, HTTPError(413))
+
+    def __data_received(self, stream_id: int, data: bytes, flow_controlled_length: int) -> None:
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.error is not None:
+            self.conn.acknowledge_received_data(flow_controlled_length, stream_id)
+            return
+
+        stream.body_size += len(data)
+        if self.max_body_size and stream.body_size > self.max_body_size:
+            self.__body_error(stream, HTTPError(413))
+        else:
+            try:
+                stream.body.feed(data)
+            except HTTPError as e:
+                self.__body_error(stream, e)
+
+        if stream.paused and stream.error is None:
+            # only the window of the stream is held back, the connection window is returned immediately
+            stream.unacknowledged += flow_controlled_length
+            if flow_controlled_length:
+                self.conn.increment_flow_control_window(flow_controlled_length)
+        else:
+            self.conn.acknowledge_received_data(flow_controlled_length, stream_id)
+
+    def __stream_ended(self, stream_id: int) -> None:
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return
+
+        stream.received = True
+        if stream.error is None:
+            try:
+                stream.body.process()
+            except HTTPError as e:
+                self.__body_error(stream, e)
+            else:
+                stream.request.on_body.set()
+
+    def __stream_reset(self, stream_id: int) -> None:
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            stream.reset = True
+            if not stream.task.done():
+                stream.task.cancel()
+        self.__wake_writers()
+
+    def __body_error(self, stream: "Stream", error: HTTPError) -> None:
+        """ Stop receiving the body, and respond with the given error """
+        stream.error = error
+        stream.resume_reading()
+        if not stream.task.done():
+            stream.task.cancel()
+
+    # -------------- #
+    # REQUEST RESULT #
+    # -------------- #
+
+    def __finalize_task(self, stream: "Stream") -> None:
+        task = stream.task
+        stream.body.discard()
+
+        finalize = None
+        if task.cancelled():
+            if stream.headers_sent or stream.reset:
+                stream.failed = True
+            elif stream.error is not None:
+                finalize = self.loop.create_task(handle_error(stream.context.injector, stream.error))
+            else:
+                finalize = self.loop.create_task(stream.context.response.begin(503))
+        else:
+            exc = task.exception()
+            if exc is not None:
+                if stream.headers_sent:
+                    stream.failed = True
+                else:
+                    finalize = self.loop.create_task(handle_error(stream.context.injector, exc))
+
+        if finalize is None:
+            self.__stream_done(stream)
+        else:
+            finalize.add_done_callback(lambda t: self.__finalize_error(t, stream))
+
+    def __finalize_error(self, task: Task, stream: "Stream") -> None:
+        if task.cancelled():
+            stream.failed = True
+        else:
+            exc = task.exception()
+            if exc is not None:
+                stream.failed = True
+                if not isinstance(exc, ConnectionResetError):
+                    self.loop.call_exception_handler({
+                        "message": "Unhandled exception in request handler",
+                        "exception": exc,
+                        "protocol": self,
+                    })
+        self.__stream_done(stream)
+
+    def __stream_done(self, stream: "Stream") -> None:
+        del self.streams[stream.id]
+
+        if not stream.reset and not self.output.closed:
+            conn = self.conn
+            try:
+                if stream.failed or not stream.headers_sent or not stream.context.response.keep_alive:
+                    # incomplete response
+                    conn.reset_stream(stream.id, ErrorCodes.INTERNAL_ERROR)
+                else:
+                    if not stream.ended:
+                        conn.end_stream(stream.id)
+                    if not stream.received:
+                        # the response is complete, the rest of the request body is not needed
+                        conn.reset_stream(stream.id, ErrorCodes.NO_ERROR)
+            except StreamClosedError:
+                pass
+            self.flush_now()
+
+        if not self.streams and self.keep_alive_timeout and not self.output.closed:
+            self.__cancel_idle_timer()
+            self.idle_timer = self.loop.call_later(self.keep_alive_timeout, self.__idle_close)
+
+    def __idle_close(self) -> None:
+        self.idle_timer = None
+        self.conn.close_connection()
+        self.flush_now()
+        self.transport.close()
+
+    def __cancel_idle_timer(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+
+class Stream:
+    """ One stream of a HTTP/2 connection
+
+    It is the :class:`Output` of the response, :class:`Response` sends the head with :meth:`send_head`
+    as a HEADERS frame (a prebuilt HTTP/1 head written by ``send_prepared`` is converted), and the written
+    data is sent in DATA frames. It is the input of the request body too, while it is paused, the received data
+    is not acknowledged in the window of the stream, so only this stream is blocked (the connection window
+    is returned as the data arrives).
+    """
+    __slots__ = ("protocol", "id", "context", "head_only", "task", "request", "body", "head", "headers_sent",
+                 "unflushed", "remaining", "ended", "received", "reset", "failed", "error", "paused",
+                 "unacknowledged", "body_size")
+
+    protocol: HTTP2Protocol
+    id: int
+    context: RequestContext
+    head_only: bool
+    task: Task
+    request: Request
+    body: BodyParser
+    head: Union[bytearray, None]
+    headers_sent: bool
+    unflushed: bool
+    remaining: Union[int, None]
+    ended: bool
+    received: bool
+    reset: bool
+    failed: bool
+    error: Union[HTTPError, None]
+    paused: bool
+    unacknowledged: int
+    body_size: int
+
+    def __init__(self, protocol: HTTP2Protocol, stream_id: int, head_only: bool):
+        self.protocol = protocol
+        self.id = stream_id
+        self.head_only = head_only
+        self.head = None
+        self.headers_sent = False
+        self.unflushed = False
+        self.remaining = None
+        self.ended = False
+        self.received = False
+        self.reset = False
+        self.failed = False
+        self.error = None
+        self.paused = False
+        self.unacknowledged = 0
+        self.body_size = 0
+
+    # ------ #
+    # OUTPUT #
+    # ------ #
+
+    async def write(self, data: bytes):
+        await self.writelines((data, ))
+
+    async def writelines(self, data: Iterable[bytes]):
+        if self.reset:
+            raise ConnectionResetError("Stream reset by peer")
+
+        for chunk in data:
+            if not self.headers_sent:
+                chunk = self.__send_head(chunk)
+                if chunk is None:
+                    continue
+
+            if not chunk or self.ended or self.head_only:
+                continue
+
+            self.unflushed = False
+            if self.remaining is None:
+                await self.protocol.send_data(self, chunk, False)
+            else:
+                self.remaining -= len(chunk)
+                await self.protocol.send_data(self, chunk, self.remaining <= 0)
+
+        if self.unflushed:
+            # the body may follow later, the client should not wait for the headers
+            self.unflushed = False
+            self.protocol.flush_now()
+
+    async def sendfile(self, file: BinaryIO, offset: int, count: int):
+        await copy_file(self.protocol.loop, self, file, offset, count)
+
+    def send_head(self, code: int, length: Union[int, None], content_type: Union[bytes, None],
+                  headers: Union[Headers, None], cookies: Iterable[Any]) -> None:
+        """ Send the HEADERS frame of the response, the frame is flushed with the first write """
+        fields = [(b":status", b"%d" % code), (b"date", http_date())]
+        if content_type is not None:
+            fields.append((b"content-type", content_type))
+        if length is not None:
+            fields.append((b"content-length", b"%d" % length))
+        if headers:
+            for name, value in headers.items():
+                if name not in _CONNECTION_HEADERS:
+                    fields.append((name, value))
+        for cookie in cookies:
+            fields.append((b"set-cookie", cookie.OutputString().encode("ASCII")))
+
+        if not self.__send_headers(fields, length):
+            self.unflushed = True
+
+    def __send_headers(self, fields: List[Tuple[bytes, bytes]], length: Union[int, None]) -> bool:
+        """ Returns ``True`` when the stream is ended with the headers """
+        self.headers_sent = True
+        self.remaining = length
+
+        end_stream = self.head_only or length == 0 or fields[0][1] in (b"204", b"304")
+        self.protocol.conn.send_headers(self.id, fields, end_stream=end_stream)
+        if end_stream:
+            self.ended = True
+        return end_stream
+
+    def __send_head(self, chunk: bytes) -> Union[bytes, None]:
+        """ Send the HEADERS frame of a prebuilt head, when it is complete, returns the data following the head """
+        if self.head is None:
+            head = chunk
+        else:
+            head = self.head
+            head += chunk
+
+        end = head.find(b"\r\n\r\n")
+        if end == -1:
+            if self.head is None:
+                self.head = bytearray(head)
+            return None
+        self.head = None
+
+        headers, length = parse_head(head, end)
+        end_stream = self.__send_headers(headers, length)
+        body = bytes(head[end + 4:])
+        if not end_stream and not body:
+            # the body may follow later, the client should not wait for the headers
+            self.protocol.flush_now()
+        return body
+
+    # ----- #
+    # INPUT #
+    # ----- #
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+        if self.unacknowledged:
+            increment = self.unacknowledged
+            self.unacknowledged = 0
+            if not self.received and not self.reset:
+                protocol = self.protocol
+                try:
+                    protocol.conn.increment_flow_control_window(increment, self.id)
+                except (KeyError, StreamClosedError):
+                    return
+                protocol.flush_now()
+
+
+def parse_head(head: bytes, end: int) -> Tuple[List[Tuple[bytes, bytes]], Union[int, None]]:
+    """ Convert the HTTP/1 response head into HTTP/2 header fields, returns the fields and the content length """
+    lines = bytes(head[:end]).split(b"\r\n")
+
+    # HTTP/2.0 200 OK
+    headers = [(b":status", lines[0][9:12])]
+    length = None
+
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name in _CONNECTION_HEADERS:
+            continue
+        value = value.strip()
+        if name == b"content-length":
+            length = int(value)
+        headers.append((name, value))
+
+    return headers, length
@@ -6,22 +6,33 @@ from .protocol import SOCK_TRANSPORT
 
 
 class Input:
-    __slots__ = ("sock", "readable")
+    """ Read side of the connection
+
+    Reading is paused until every :meth:`pause_reading` call is balanced with a :meth:`resume_reading` call,
+    so the request body and the protocol can pause it independently.
+    """
+    __slots__ = ("sock", "readable", "paused")
 
     sock: Inject[SOCK_TRANSPORT]
     readable: Event
+    paused: int
 
     def __init__(self):
         self.readable = Event()
         self.readable.set()
+        self.paused = 0
 
     def pause_reading(self):
-        self.sock.pause_reading()
-        self.readable.clear()
+        self.paused += 1
+        if self.paused == 1:
+            self.sock.pause_reading()
+            self.readable.clear()
 
     def resume_reading(self):
-        self.sock.resume_reading()
-        self.readable.set()
+        self.paused -= 1
+        if self.paused == 0:
+            self.sock.resume_reading()
+            self.readable.set()
 
     async def read(self):
         await self.readable.wait()
@@ -1,19 +1,257 @@
-from asyncio import Event
-from yapic.di import Inject
+from asyncio import AbstractEventLoop, Event, Future, SendfileNotAvailableError
+from collections import deque
+from os import close, dup, pread
+from typing import BinaryIO, Deque, Iterable, List, Union
+
+from yapic.di import Inject, Token
 
 from .protocol import SOCK_TRANSPORT
 
+try:
+    from os import sendfile as os_sendfile
+except ImportError:  # pragma: no cover
+    os_sendfile = None
+
+# maximum size of buffered data of a response, that is waiting for the previous responses
+QUEUE_BUFFER_SIZE = 65536
+
+# size of the chunks, when a file is copied through userspace
+SENDFILE_CHUNK_SIZE = 262144
+
 
 class Output:
-    __slots__ = ("sock", "writable")
+    """ Write side of the connection
+
+    Writing waits while the transport's write buffer is above the high water mark
+    (``WRITE_BUFFER_HIGH``), until it drains below the low water mark (``WRITE_BUFFER_LOW``).
+    """
+    __slots__ = ("sock", "loop", "writable", "closed", "high_water", "low_water", "fd_writable")
+
+    HIGH_WATER = Token("WRITE_BUFFER_HIGH")
+    LOW_WATER = Token("WRITE_BUFFER_LOW")
 
     sock: Inject[SOCK_TRANSPORT]
+    loop: Inject[AbstractEventLoop]
+    high_water: Inject[HIGH_WATER]
+    low_water: Inject[LOW_WATER]
     writable: Event
+    closed: bool
+    fd_writable: Union[Future, None]
 
     def __init__(self):
         self.writable = Event()
         self.writable.set()
+        self.closed = False
+        self.fd_writable = None
+        self.sock.set_write_buffer_limits(self.high_water, self.low_water)
+
+    def pause_writing(self):
+        self.writable.clear()
+
+    def resume_writing(self):
+        self.writable.set()
+
+    def connection_lost(self):
+        self.closed = True
+        self.writable.set()
+        if self.fd_writable is not None and not self.fd_writable.done():
+            self.fd_writable.set_result(None)
 
     async def write(self, data: bytes):
         await self.writable.wait()
+        if self.closed:
+            raise ConnectionResetError("Connection lost")
         self.sock.write(data)
+
+    async def writelines(self, data: Iterable[bytes]):
+        await self.writable.wait()
+        if self.closed:
+            raise ConnectionResetError("Connection lost")
+        self.sock.writelines(data)
+
+    async def sendfile(self, file: BinaryIO, offset: int, count: int):
+        """ Send a part of the file with ``loop.sendfile``, or with ``os.sendfile`` on the socket, when the loop
+        does not implement it (uvloop). Without a plain socket (eg.: TLS) the file is copied in chunks.
+        """
+        await self.writable.wait()
+        if self.closed:
+            raise ConnectionResetError("Connection lost")
+
+        sock = self.sock
+        if sock.get_extra_info("sslcontext") is None:
+            try:
+                await self.loop.sendfile(sock, file, offset, count, fallback=False)
+            except (SendfileNotAvailableError, NotImplementedError):
+                pass
+            else:
+                return
+
+            raw = sock.get_extra_info("socket")
+            if raw is not None and os_sendfile is not None:
+                await self.__sendfile_native(raw.fileno(), file, offset, count)
+                return
+
+        await copy_file(self.loop, self, file, offset, count)
+
+    async def __sendfile_native(self, sock_fd: int, file: BinaryIO, offset: int, count: int):
+        # the loop does not allow watching the fd of a transport, but a duplicate of it can be watched
+        fd = dup(sock_fd)
+        try:
+            # the data buffered by the transport (eg.: the response head) is sent first
+            while self.sock.get_write_buffer_size():
+                await self.__wait_fd_writable(fd)
+
+            file_fd = file.fileno()
+            while count > 0:
+                try:
+                    sent = os_sendfile(fd, file_fd, offset, count)
+                except BlockingIOError:
+                    await self.__wait_fd_writable(fd)
+                    continue
+                except OSError as e:
+                    raise ConnectionResetError("Connection lost") from e
+
+                if sent == 0:
+                    raise EOFError("File is shorter than expected")
+                offset += sent
+                count -= sent
+        finally:
+            close(fd)
+
+    async def __wait_fd_writable(self, fd: int):
+        if self.closed:
+            raise ConnectionResetError("Connection lost")
+
+        loop = self.loop
+        waiter = self.fd_writable = loop.create_future()
+        loop.add_writer(fd, lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await waiter
+        finally:
+            loop.remove_writer(fd)
+            self.fd_writable = None
+
+        if self.closed:
+            raise ConnectionResetError("Connection lost")
+
+
+async def copy_file(loop: AbstractEventLoop, output: Output, file: BinaryIO, offset: int, count: int):
+    """ Write a part of the file into the output in ``SENDFILE_CHUNK_SIZE`` chunks, reading in an executor """
+    fd = file.fileno()
+    while count > 0:
+        data = await loop.run_in_executor(None, pread, fd, min(count, SENDFILE_CHUNK_SIZE), offset)
+        if not data:
+            raise EOFError("File is shorter than expected")
+        await output.write(data)
+        offset += len(data)
+        count -= len(data)
+
+
+class QueuedOutput:
+    """ Output of one request in a pipelined connection
+
+    Written data is buffered until every previous response of the connection is finished.
+    When more than ``QUEUE_BUFFER_SIZE`` bytes are buffered, writing waits until this output becomes active.
+    """
+    __slots__ = ("output", "buffer", "size", "active", "activated", "finished")
+
+    output: Output
+    buffer: List[bytes]
+    size: int
+    active: bool
+    activated: Union[Event, None]
+    finished: bool
+
+    def __init__(self, output: Output, active: bool):
+        self.output = output
+        self.buffer = []
+        self.size = 0
+        self.active = active
+        self.activated = None
+        self.finished = False
+
+    async def write(self, data: bytes):
+        if not self.active:
+            if self.size + len(data) <= QUEUE_BUFFER_SIZE:
+                self.buffer.append(data)
+                self.size += len(data)
+                return
+            await self.wait_active()
+        await self.output.write(data)
+
+    async def writelines(self, data: Iterable[bytes]):
+        if not self.active:
+            data = tuple(data)
+            size = sum(map(len, data))
+            if self.size + size <= QUEUE_BUFFER_SIZE:
+                self.buffer.extend(data)
+                self.size += size
+                return
+            await self.wait_active()
+        await self.output.writelines(data)
+
+    async def sendfile(self, file: BinaryIO, offset: int, count: int):
+        await self.wait_active()
+        await self.output.sendfile(file, offset, count)
+
+    def activate(self):
+        self.active = True
+        if self.buffer:
+            self.output.sock.writelines(self.buffer)
+            self.buffer = []
+            self.size = 0
+        if self.activated is not None:
+            self.activated.set()
+
+    async def wait_active(self):
+        """ Wait until every previous response of the connection is sent """
+        if self.active:
+            return
+        if self.activated is None:
+            self.activated = Event()
+        await self.activated.wait()
+
+
+class ResponseQueue:
+    """ Keeps the responses of pipelined requests in request order
+
+    example::
+
+        output = queue.push()
+        await output.write(b"...")
+        queue.finish(output)
+    """
+    __slots__ = ("output", "items")
+
+    output: Output
+    items: Deque[QueuedOutput]
+
+    def __init__(self, output: Output):
+        self.output = output
+        self.items = deque()
+
+    def push(self) -> QueuedOutput:
+        item = QueuedOutput(self.output, not self.items)
+        self.items.append(item)
+        return item
+
+    def finish(self, item: QueuedOutput) -> None:
+        """ Mark the given output as finished, and flush the buffered data of the following outputs """
+        item.finished = True
+        items = self.items
+        while items and items[0].finished:
+            items.popleft()
+            if items:
+                items[0].activate()
+
+    def close(self) -> None:
+        """ Wake up every waiting output, when the connection is lost """
+        for item in self.items:
+            item.active = True
+            item.buffer = []
+            if item.activated is not None:
+                item.activated.set()
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
@@ -4,6 +4,11 @@ ParamsDict = Dict[str, Union[str, int, float, list]]
 
 _DEFAULT: Any = dict()
 
+# sources of request params, see Params.source
+URL = 0
+QUERY = 1
+BODY = 2
+
 
 class Params:
     __slots__ = ("__url", "__get", "__post")
@@ -22,6 +27,16 @@ class Params:
             else:
                 return default
 
+    def source(self, source: int) -> ParamsDict:
+        """ Returns the params of the given source (``URL``, ``QUERY`` or ``BODY``)
+        """
+        if source == URL:
+            return self.__url
+        elif source == QUERY:
+            return self.__get
+        else:
+            return self.__post
+
     def GET(self, key: str, default: Any = _DEFAULT):
         """ Get parameter from only 'GET' parameters
 
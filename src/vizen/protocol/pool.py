@@ -0,0 +1,87 @@
+from typing import Any, Dict, List, Union
+
+
+class Pool:
+    """ Free list of released objects, that are reused instead of allocating new ones
+
+    At most ``size`` objects are kept, the rest is left to the garbage collector.
+    In debug mode the released objects are poisoned until they are acquired again,
+    so any use of a reference, that was kept after the release raises :class:`RuntimeError`.
+
+    example::
+
+        pool = Pool(1024)
+        headers = pool.acquire() or Headers()
+        ...
+        headers.clear()
+        pool.release(headers)
+    """
+    __slots__ = ("items", "size", "debug")
+
+    items: List[Any]
+    size: int
+    debug: bool
+
+    def __init__(self, size: int, debug: bool = False):
+        self.items = []
+        self.size = size
+        self.debug = debug
+
+    def acquire(self) -> Union[Any, None]:
+        """ Returns a released object, or ``None`` when the pool is empty """
+        items = self.items
+        if items:
+            obj = items.pop()
+            if self.debug:
+                object.__setattr__(obj, "__class__", type(obj).__released__)
+            return obj
+        return None
+
+    def release(self, obj: Any) -> None:
+        """ Put back the already reset object into the pool """
+        if self.debug:
+            if hasattr(type(obj), "__released__"):
+                raise RuntimeError("%s is already released" % type(obj).__released__.__name__)
+            # objects, that do not fit into the pool are poisoned too, they must not be used either
+            object.__setattr__(obj, "__class__", _released_type(type(obj)))
+            if len(self.items) < self.size:
+                self.items.append(obj)
+        elif len(self.items) < self.size:
+            self.items.append(obj)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return "<Pool size: %d/%d>" % (len(self.items), self.size)
+
+
+_RELEASED: Dict[type, type] = {}
+
+_POISONED = ("__getitem__", "__setitem__", "__delitem__", "__contains__", "__iter__", "__len__", "__call__",
+             "__aiter__", "__await__")
+
+
+def _released_type(cls: type) -> type:
+    """ Subclass with the same layout, that raises on every attribute access """
+    try:
+        return _RELEASED[cls]
+    except KeyError:
+        pass
+
+    def used(self, *args, **kwargs):
+        raise RuntimeError("%s is used after it was released to the pool" % cls.__name__)
+
+    def getattribute(self, name):
+        if name == "__class__":
+            return object.__getattribute__(self, name)
+        used(self)
+
+    def repr(self):
+        return "<released %s>" % cls.__name__
+
+    attrs = {name: used for name in _POISONED}
+    attrs.update(__slots__=(), __released__=cls, __getattribute__=getattribute, __setattr__=used, __delattr__=used,
+                 __repr__=repr)
+    released = _RELEASED[cls] = type(cls)(cls.__name__, (cls, ), attrs)
+    return released
@@ -7,6 +7,9 @@ from yapic.di import Inject, Injector, Token
 SOCK_LISTEN = Token("SOCK_LISTEN")
 SOCK_TRANSPORT = Token("SOCK_TRANSPORT")
 
+# callable, that hands over the connection to the given protocol type, or None when the request is not upgradable
+UPGRADE = Token("PROTOCOL_UPGRADE")
+
 
 class AbstractProtocol(ABC):
     __slots__ = ("injector", "loop")
@@ -1,6 +1,6 @@
 import asyncio
 from enum import Enum
-from typing import Any
+from typing import Any, AsyncIterator
 from urllib.parse import parse_qsl, unquote_to_bytes
 from cgi import parse_header
 
@@ -11,7 +11,7 @@ from ..router import Router
 from ..error import HTTPError
 from ..json import Json
 from .params import Params, ParamsDict
-from .body import BodyParser, FormDataFile
+from .body import BodyParser, FormDataFile, RawBody
 
 # from .response import Response
 
@@ -44,11 +44,20 @@ class Request:
         self.on_headers = asyncio.Event()
         self.on_body = asyncio.Event()
 
+    def _recycle(self) -> None:
+        """ Reset to the initial state, before it is reused with another request """
+        self.on_headers.clear()
+        self.on_body.clear()
+        self.injector = None
+        self.body = None
+        self.headers = None
+        self.url = None
+
     async def __call__(self):
         await self.on_headers.wait()
 
         path = unquote_to_bytes(self.url.path).decode("utf-8")
-        injectable, params = self.router.find(path, self.method)
+        handler, params = self.router.find(path, self.method)
 
         query = self.url.query
         if query is not None:
@@ -57,7 +66,7 @@ class Request:
             qs = {}
         self.injector[Params] = Params(params, qs, {})
 
-        await injectable(self.injector)
+        await handler.call(self.injector)
 
     async def json(self):
         try:
@@ -77,6 +86,20 @@ class Request:
         j = self.injector[Json]
         return j.loads(self.body.data.decode(charset))
 
+    def stream(self) -> AsyncIterator[bytes]:
+        """ Iterate over the chunks of the request body as they arrive
+
+        Reading from the connection is paused while the handler falls behind.
+
+        example::
+
+            async for chunk in request.stream():
+                file.write(chunk)
+        """
+        if not isinstance(self.body, RawBody):
+            raise RuntimeError("Request body is already consumed by %r" % self.body)
+        return self.body.stream()
+
     @property
     async def files(self):
         await self.on_body.wait()
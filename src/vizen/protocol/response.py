@@ -1,76 +1,355 @@
-from typing import Union, Any
+from os import fstat
+from time import time
+from email.utils import formatdate
+from typing import Union, Any, BinaryIO, Dict, Tuple
 from http import HTTPStatus
 from yapic.di import Inject, Injector
 
 from ..headers import Headers
 from ..json import Json
 from .output import Output
-from .cookie import Cookie
+from .request import Request
+from .compression import Compression
+
+# bodies up to this size are sent in the same buffer as the head
+SMALL_BODY_SIZE = 16384
+
+CONTENT_TYPE_TEXT = b"text/plain; charset=utf-8"
+CONTENT_TYPE_HTML = b"text/html; charset=utf-8"
+CONTENT_TYPE_JSON = b"application/json; charset=utf-8"
 
 _HTTP_STATUS = {}
 
 for v in ("1.0", "1.1", "2.0"):
     _HTTP_STATUS[v] = {entry.value: f"HTTP/{v} {entry.value} {entry.phrase}".encode() for entry in HTTPStatus}
 
+_CONTENT_TYPE_HEADER = {
+    ct: b"content-type: " + ct + b"\r\n"
+    for ct in (CONTENT_TYPE_TEXT, CONTENT_TYPE_HTML, CONTENT_TYPE_JSON)
+}
+
+_HEAD_CACHE: Dict[Tuple[str, int, bytes], bytes] = {}
+_HEAD_CACHE_TIME = 0
+
+_DATE = b""
+_DATE_TIME = 0
+
+
+def http_date() -> bytes:
+    """ Returns the value of the ``date`` header, the result is cached for one second """
+    global _DATE, _DATE_TIME
+
+    now = int(time())
+    if now != _DATE_TIME:
+        _DATE = formatdate(now, usegmt=True).encode("ASCII")
+        _DATE_TIME = now
+    return _DATE
+
+
+def head_prefix(version: str, code: int, content_type: Union[bytes, None]) -> bytes:
+    """ Returns the status line, ``date`` and ``content-type`` headers, the result is cached for one second """
+    global _HEAD_CACHE_TIME
+
+    now = int(time())
+    if now != _HEAD_CACHE_TIME:
+        _HEAD_CACHE.clear()
+        _HEAD_CACHE_TIME = now
+
+    key = (version, code, content_type)
+    try:
+        return _HEAD_CACHE[key]
+    except KeyError:
+        prefix = b"%s\r\ndate: %s\r\n" % (_HTTP_STATUS[version][code], http_date())
+        if content_type is not None:
+            try:
+                prefix += _CONTENT_TYPE_HEADER[content_type]
+            except KeyError:
+                prefix += b"content-type: " + content_type + b"\r\n"
+        _HEAD_CACHE[key] = prefix
+        return prefix
+
 
 class Response:
-    __slots__ = ("injector", "headers", "transport", "version", "headers_sent", "output")
+    __slots__ = ("injector", "_headers", "content_type", "transport", "version", "method", "headers_sent",
+                 "output", "keep_alive", "compression")
 
     injector: Inject[Injector]
-    headers: Headers
     output: Inject[Output]
+    compression: Inject[Compression]
+    content_type: bytes
     version: str
+    method: bytes
     headers_sent: bool
+    keep_alive: bool
 
     def __init__(self):
-        self.headers = Headers()
-        self.headers[b"content-type"] = b"text/plain; charset=utf-8"
+        self._headers = None
+        self.content_type = CONTENT_TYPE_TEXT
         self.headers_sent = False
+        self.keep_alive = True
 
         # self.output.write = self.transport.write
 
+    @property
+    def headers(self) -> Headers:
+        """ Additional response headers, ``content-type`` header overrides the :attr:`content_type` attribute """
+        headers = self._headers
+        if headers is None:
+            headers = self._headers = Headers()
+        return headers
+
     async def begin(self, code: int = 200, length: int = 0):
-        if self.headers_sent is False:
-            self.headers_sent = True
-            response = (
-                _HTTP_STATUS[self.version][code],
-                b"\r\n",
-                b"content-length: ",
-                str(length).encode(),
-                b"\r\n",
-            )
-            await self.output.write(b"".join(response))
-
-            for item in self.headers.items():
-                await self.output.write(b": ".join(item) + b"\r\n")
-
-            cookies = self.injector[Cookie]
-            for c in cookies._new():
-                await self.output.write(b"set-cookie: " + c.OutputString().encode("ASCII") + b"\r\n")
-
-            await self.output.write(b"\r\n")
-        else:
-            raise RuntimeError("Headers already sent")
+        await self.output.write(self.__head(code, length))
 
     async def send(self, data: Union[str, bytes], code: int = 200) -> None:
         if isinstance(data, str):
             data = data.encode()
 
-        await self.begin(code=code, length=len(data))
-        await self.output.write(data)
+        compression = self.compression
+        # HEAD responses are compressed too, so they have the same headers as GET responses
+        if compression.enabled and len(data) >= compression.min_size:
+            headers = self.headers
+            content_type = headers.get(b"content-type", self.content_type)
+            request = self.injector[Request]
+            accept = request.headers.get(b"accept-encoding")
+            data = await compression.compress_response(headers, accept, content_type, data, request.url.path)
+
+        head = self.__head(code, len(data))
+        if self.method == b"HEAD":
+            await self.output.write(head)
+        elif len(data) <= SMALL_BODY_SIZE:
+            head += data
+            await self.output.write(head)
+        else:
+            await self.output.writelines((head, data))
         self.reset()
         # self.output.sock.close()
 
+    async def sendfile(self, file: BinaryIO, offset: int = 0, count: int = None, code: int = 200) -> None:
+        """ Send the content of a file (or a part of it), without copying it through userspace when possible
+
+        example::
+
+            with open(filename, "rb") as f:
+                await response.sendfile(f)
+        """
+        if count is None:
+            count = fstat(file.fileno()).st_size - offset
+
+        await self.output.write(self.__head(code, count))
+        if self.method != b"HEAD" and count > 0:
+            await self.output.sendfile(file, offset, count)
+        self.reset()
+
+    async def send_prepared(self, head: bytes, body: bytes, code: int = 200) -> None:
+        """ Send a response with prebuilt headers in one write
+
+        The ``head`` contains every header line, that follows the ``date`` header
+        (including ``content-type`` and ``content-length``), and the closing empty line.
+
+        example::
+
+            await response.send_prepared(b"content-type: text/plain\\r\\ncontent-length: 2\\r\\n\\r\\n", b"OK")
+        """
+        if self.headers_sent is True:
+            raise RuntimeError("Headers already sent")
+        self.headers_sent = True
+
+        buffer = bytearray(head_prefix(self.version, code, None))
+        self.__extra_headers(buffer, self._headers, self.injector.new_cookies())
+        buffer += head
+        if self.method != b"HEAD":
+            buffer += body
+        await self.output.write(buffer)
+        self.reset()
+
+    def stream(self, code: int = 200, length: int = None) -> "ResponseStream":
+        """ Begin a response, which body is written in parts
+
+        Without ``length`` the body is sent with chunked transfer encoding (HTTP/1.1),
+        delimited by closing the connection (HTTP/1.0), or by the end of the stream (HTTP/2).
+
+        example::
+
+            async with response.stream() as stream:
+                async for row in rows:
+                    await stream.write(row)
+        """
+        chunked = False
+        if length is None:
+            if self.version == "1.0":
+                self.keep_alive = False
+                self.headers[b"connection"] = b"close"
+            elif self.version == "1.1":
+                chunked = True
+                self.headers[b"transfer-encoding"] = b"chunked"
+
+        return ResponseStream(self, self.__head(code, length), chunked, length)
+
     def text(self, data: str):
         return self.send(data)
 
     def html(self, data: str):
-        self.headers[b"content-type"] = b"text/html; charset=utf-8"
+        self.content_type = CONTENT_TYPE_HTML
         return self.send(data)
 
     def json(self, data: Any):
-        self.headers[b"content-type"] = b"application/json; charset=utf-8"
+        self.content_type = CONTENT_TYPE_JSON
         return self.send(self.injector[Json].dumps(data))
 
     def reset(self):
         self.headers_sent = False
+
+    def _recycle(self) -> None:
+        """ Reset to the initial state, before it is reused with another request """
+        if self._headers:
+            self._headers.clear()
+        self.injector = None
+        self.output = None
+        self.content_type = CONTENT_TYPE_TEXT
+        self.headers_sent = False
+        self.keep_alive = True
+
+    def __head(self, code: int, length: Union[int, None]) -> bytearray:
+        """ Serialize the status line, headers and cookies into one buffer """
+        if self.headers_sent is True:
+            raise RuntimeError("Headers already sent")
+        self.headers_sent = True
+
+        headers = self._headers
+        cookies = self.injector.new_cookies()
+
+        if self.version == "2.0":
+            # the stream sends a HEADERS frame from the fields, the head is not serialized
+            content_type = None if headers and b"content-type" in headers else self.content_type
+            self.output.send_head(code, length, content_type, headers, cookies)
+            return bytearray()
+
+        if not headers and not cookies and length is not None:
+            head = bytearray(head_prefix(self.version, code, self.content_type))
+            head += b"content-length: %d\r\n\r\n" % length
+            return head
+
+        if headers and b"content-type" in headers:
+            head = bytearray(head_prefix(self.version, code, None))
+        else:
+            head = bytearray(head_prefix(self.version, code, self.content_type))
+
+        if length is not None:
+            head += b"content-length: %d\r\n" % length
+
+        self.__extra_headers(head, headers, cookies)
+        head += b"\r\n"
+        return head
+
+    def __extra_headers(self, head: bytearray, headers: Union[Headers, None], cookies) -> None:
+        if headers:
+            for name, value in headers.items():
+                head += name
+                head += b": "
+                head += value
+                head += b"\r\n"
+
+        for c in cookies:
+            head += b"set-cookie: "
+            head += c.OutputString().encode("ASCII")
+            head += b"\r\n"
+
+
+class ResponseStream:
+    """ Body of a streamed response, see :meth:`Response.stream`
+
+    The head of the response is sent together with the first part of the body.
+    """
+    __slots__ = ("response", "output", "head", "chunked", "remaining", "closed")
+
+    response: Response
+    output: Output
+    head: Union[bytearray, None]
+    chunked: bool
+    remaining: Union[int, None]
+    closed: bool
+
+    def __init__(self, response: Response, head: bytearray, chunked: bool, length: Union[int, None]):
+        self.response = response
+        self.output = response.output
+        self.head = head
+        self.chunked = chunked
+        self.remaining = length
+        self.closed = False
+
+    async def write(self, data: Union[str, bytes]) -> None:
+        if self.closed:
+            raise RuntimeError("Response stream is closed")
+
+        if isinstance(data, str):
+            data = data.encode()
+
+        if not data or self.response.method == b"HEAD":
+            return
+
+        if self.remaining is not None:
+            self.remaining -= len(data)
+            if self.remaining < 0:
+                raise RuntimeError("Response body is longer than the given length")
+
+        buffer = self.head
+        self.head = None
+
+        if len(data) <= SMALL_BODY_SIZE:
+            if buffer is None:
+                buffer = bytearray()
+            if self.chunked:
+                buffer += b"%x\r\n" % len(data)
+                buffer += data
+                buffer += b"\r\n"
+            else:
+                buffer += data
+            await self.output.write(buffer)
+        else:
+            parts = [] if buffer is None else [buffer]
+            if self.chunked:
+                parts.append(b"%x\r\n" % len(data))
+                parts.append(data)
+                parts.append(b"\r\n")
+            else:
+                parts.append(data)
+            await self.output.writelines(parts)
+
+    async def close(self) -> None:
+        """ Finish the response body """
+        if self.closed:
+            return
+        self.closed = True
+
+        buffer = self.head
+        self.head = None
+
+        if self.response.method != b"HEAD":
+            if self.chunked:
+                buffer = (buffer or b"") + b"0\r\n\r\n"
+            elif self.remaining:
+                # the client waits for more data, the connection is unusable
+                self.response.keep_alive = False
+
+        if buffer:
+            await self.output.write(buffer)
+        self.response.reset()
+
+    async def __aenter__(self) -> "ResponseStream":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.close()
+        else:
+            self.closed = True
+            if self.head is None:
+                # incomplete body, only closing the connection tells the client
+                self.response.keep_alive = False
+            else:
+                # nothing is sent, so the error handler is able to respond
+                self.head = None
+                self.response.reset()
+                if self.chunked:
+                    del self.response.headers[b"transfer-encoding"]
@@ -1,5 +1,607 @@
-from .protocol import AbstractProtocol
+import zlib
+from asyncio import Event, TimerHandle, gather, wait_for, TimeoutError
+from base64 import b64encode
+from collections import deque
+from hashlib import sha1
+from struct import pack
+from typing import Any, Deque, Dict, Iterable, List, Tuple, Union
+
+from yapic.di import Inject, Token
+
+from ..error import HTTPError, VizenError
+from .protocol import AbstractProtocol, SOCK_TRANSPORT, UPGRADE
+from .request import Request
+from .response import Response
+from .output import Output
+from .input import Input
+
+__all__ = "WebsocketProtocol", "WebSocket", "WebSocketClosed", "broadcast"
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_NO_STATUS = 1005
+CLOSE_ABNORMAL = 1006
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+
+# received messages waiting for the handler, reading is paused above this size
+RECEIVE_BUFFER_SIZE = 1048576
+
+# messages smaller than this are not compressed
+DEFLATE_MIN_SIZE = 128
+DEFLATE_LEVEL = 6
+
+# waiting for the closing handshake of the client
+CLOSE_TIMEOUT = 5.0
+
+# the end of every compressed message, that is removed before sending (RFC 7692 7.2.1)
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class WebSocketClosed(VizenError):
+    """ Raised when receiving from, or sending into a closed websocket """
+
+    def __init__(self, code: int, reason: str = ""):
+        super().__init__(code, reason)
+        self.code = code
+        self.reason = reason
 
 
 class WebsocketProtocol(AbstractProtocol):
-    __slots__ = ()
+    """ WebSocket connection (RFC 6455), that the HTTP/1 connection is upgraded to by :meth:`WebSocket.accept`
+
+    Received messages are buffered until the handler reads them, reading from the connection is paused
+    while more than ``RECEIVE_BUFFER_SIZE`` bytes are waiting. Sending waits for the transport's write buffer.
+    A ping is sent after every ``PING_INTERVAL`` seconds, and the connection is closed, if nothing
+    is received until the next one.
+    """
+    __slots__ = ("transport", "input", "output", "max_message_size", "ping_interval", "buffer", "fragments",
+                 "fragments_size", "message_opcode", "message_compressed", "messages", "buffered", "readable",
+                 "paused", "ping_timer", "alive", "close_sent", "closed", "close_code", "close_reason",
+                 "close_received", "deflate", "compressor", "decompressor", "server_wbits", "client_wbits",
+                 "server_takeover", "client_takeover")
+
+    MAX_MESSAGE_SIZE = Token("WEBSOCKET_MAX_MESSAGE_SIZE")
+    PING_INTERVAL = Token("WEBSOCKET_PING_INTERVAL")
+    DEFLATE = Token("WEBSOCKET_DEFLATE")
+
+    transport: Inject[SOCK_TRANSPORT]
+    input: Inject[Input]
+    output: Inject[Output]
+    max_message_size: Inject[MAX_MESSAGE_SIZE]
+    ping_interval: Inject[PING_INTERVAL]
+
+    buffer: bytearray
+    fragments: Union[List[bytes], None]
+    messages: Deque[Union[str, bytes]]
+    readable: Event
+    ping_timer: Union[TimerHandle, None]
+    closed: Event
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+        self.fragments = None
+        self.fragments_size = 0
+        self.message_opcode = OP_TEXT
+        self.message_compressed = False
+        self.messages = deque()
+        self.buffered = 0
+        self.readable = Event()
+        self.paused = False
+        self.alive = True
+        self.close_sent = False
+        self.close_received = False
+        self.closed = Event()
+        self.close_code = None
+        self.close_reason = ""
+        self.deflate = False
+        self.compressor = None
+        self.decompressor = None
+
+        if self.ping_interval:
+            self.ping_timer = self.loop.call_later(self.ping_interval, self.__ping)
+        else:
+            self.ping_timer = None
+
+    def enable_deflate(self, server_wbits: int, client_wbits: int, server_takeover: bool, client_takeover: bool):
+        """ Enable the negotiated permessage-deflate extension (RFC 7692) """
+        self.deflate = True
+        self.server_wbits = server_wbits
+        self.client_wbits = client_wbits
+        self.server_takeover = server_takeover
+        self.client_takeover = client_takeover
+
+    # ---------------- #
+    # PROTOCOL METHODS #
+    # ---------------- #
+
+    def connection_lost(self, exc):
+        if self.ping_timer is not None:
+            self.ping_timer.cancel()
+            self.ping_timer = None
+        if self.close_code is None:
+            self.close_code = CLOSE_ABNORMAL
+        self.output.connection_lost()
+        self.closed.set()
+        self.readable.set()
+
+    def pause_writing(self):
+        self.output.pause_writing()
+
+    def resume_writing(self):
+        self.output.resume_writing()
+
+    def data_received(self, data):
+        if self.close_received:
+            return
+
+        self.alive = True
+        buffer = self.buffer
+        buffer += data
+        size = len(buffer)
+        pos = 0
+
+        while size - pos >= 2:
+            b0 = buffer[pos]
+            b1 = buffer[pos + 1]
+
+            if not b1 & 0x80:
+                # client frames must be masked
+                return self.fail(CLOSE_PROTOCOL_ERROR)
+
+            length = b1 & 0x7F
+            start = pos + 2
+            if length == 126:
+                if size - start < 2:
+                    break
+                length = int.from_bytes(buffer[start:start + 2], "big")
+                start += 2
+            elif length == 127:
+                if size - start < 8:
+                    break
+                length = int.from_bytes(buffer[start:start + 8], "big")
+                start += 8
+
+            if length > self.max_message_size:
+                return self.fail(CLOSE_TOO_BIG)
+
+            end = start + 4 + length
+            if end > size:
+                break
+
+            payload = unmask(buffer[start + 4:end], buffer[start:start + 4])
+            pos = end
+
+            self.__frame(b0, payload)
+            if self.close_received:
+                break
+
+        del buffer[:pos]
+
+    def eof_received(self):
+        pass
+
+    # ------- #
+    # SENDING #
+    # ------- #
+
+    async def send(self, data: Union[str, bytes]) -> None:
+        if self.close_sent or self.closed.is_set():
+            raise WebSocketClosed(self.close_code or CLOSE_NO_STATUS, self.close_reason)
+
+        if isinstance(data, str):
+            opcode = OP_TEXT
+            data = data.encode("utf-8")
+        else:
+            opcode = OP_BINARY
+
+        if self.deflate and len(data) >= DEFLATE_MIN_SIZE:
+            await self.output.write(encode_frame(opcode, self.__compress(data), True))
+        else:
+            await self.output.write(encode_frame(opcode, data))
+
+    async def ping(self, data: bytes = b"") -> None:
+        await self.output.write(encode_frame(OP_PING, data))
+
+    async def close(self, code: int = CLOSE_NORMAL, reason: str = "") -> None:
+        """ Start the closing handshake, and wait until the client responds or ``CLOSE_TIMEOUT`` expires """
+        if not self.close_sent and not self.closed.is_set():
+            self.__send_close(code, reason)
+
+        if not self.closed.is_set():
+            try:
+                await wait_for(self.closed.wait(), CLOSE_TIMEOUT)
+            except TimeoutError:
+                self.transport.close()
+
+    def fail(self, code: int) -> None:
+        """ Close the connection because of an invalid frame or message """
+        self.buffer.clear()
+        self.close_received = True
+        if not self.close_sent:
+            self.__send_close(code, "")
+        self.transport.close()
+
+    def write_prepared(self, frame: bytes) -> Any:
+        """ Write an already encoded frame, returns an awaitable, when the transport's write buffer is full """
+        output = self.output
+        if self.deflate and frame[0] & 0x40 and self.server_takeover:
+            # the next message must not refer to the previous ones, the client did not receive them in this order
+            self.compressor = None
+
+        if output.writable.is_set():
+            if not output.closed:
+                self.transport.write(frame)
+            return None
+        return output.write(frame)
+
+    def __send_close(self, code: int, reason: str) -> None:
+        self.close_sent = True
+        if code == CLOSE_NO_STATUS:
+            payload = b""
+        else:
+            payload = pack("!H", code) + reason.encode("utf-8")[:123]
+        if not self.output.closed:
+            self.transport.write(encode_frame(OP_CLOSE, payload))
+
+    def __compress(self, data: bytes) -> bytes:
+        compressor = self.compressor
+        if compressor is None:
+            compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -self.server_wbits)
+            if self.server_takeover:
+                self.compressor = compressor
+
+        data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data.endswith(_DEFLATE_TAIL):
+            data = data[:-4]
+        return data
+
+    # --------- #
+    # RECEIVING #
+    # --------- #
+
+    async def receive(self) -> Union[str, bytes]:
+        messages = self.messages
+        while not messages:
+            if self.close_received or self.closed.is_set():
+                raise WebSocketClosed(self.close_code or CLOSE_NO_STATUS, self.close_reason)
+            self.readable.clear()
+            await self.readable.wait()
+
+        message = messages.popleft()
+        self.buffered -= len(message)
+        if self.paused and self.buffered <= RECEIVE_BUFFER_SIZE // 2:
+            self.paused = False
+            self.input.resume_reading()
+        return message
+
+    def __frame(self, b0: int, payload: bytes) -> None:
+        fin = b0 & 0x80
+        rsv1 = b0 & 0x40
+        opcode = b0 & 0x0F
+
+        if b0 & 0x30 or (rsv1 and (not self.deflate or opcode == OP_CONTINUATION)):
+            return self.fail(CLOSE_PROTOCOL_ERROR)
+
+        if opcode >= OP_CLOSE:
+            if not fin or len(payload) > 125:
+                return self.fail(CLOSE_PROTOCOL_ERROR)
+
+            if opcode == OP_PING:
+                if not self.close_sent:
+                    self.transport.write(encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                self.__close_received(payload)
+            elif opcode != OP_PONG:
+                self.fail(CLOSE_PROTOCOL_ERROR)
+            return
+
+        if opcode == OP_CONTINUATION:
+            if self.fragments is None:
+                return self.fail(CLOSE_PROTOCOL_ERROR)
+        elif opcode == OP_TEXT or opcode == OP_BINARY:
+            if self.fragments is not None:
+                return self.fail(CLOSE_PROTOCOL_ERROR)
+            self.fragments = []
+            self.fragments_size = 0
+            self.message_opcode = opcode
+            self.message_compressed = bool(rsv1)
+        else:
+            return self.fail(CLOSE_PROTOCOL_ERROR)
+
+        self.fragments_size += len(payload)
+        if self.fragments_size > self.max_message_size:
+            return self.fail(CLOSE_TOO_BIG)
+        self.fragments.append(payload)
+
+        if fin:
+            fragments = self.fragments
+            self.fragments = None
+            message = fragments[0] if len(fragments) == 1 else b"".join(fragments)
+
+            if self.message_compressed:
+                message = self.__decompress(message)
+                if message is None:
+                    return self.fail(CLOSE_TOO_BIG)
+
+            if self.message_opcode == OP_TEXT:
+                try:
+                    message = message.decode("utf-8")
+                except UnicodeDecodeError:
+                    return self.fail(CLOSE_INVALID_DATA)
+
+            self.messages.append(message)
+            self.buffered += len(message)
+            self.readable.set()
+
+            if not self.paused and self.buffered > RECEIVE_BUFFER_SIZE:
+                self.paused = True
+                self.input.pause_reading()
+
+    def __decompress(self, data: bytes) -> Union[bytes, None]:
+        decompressor = self.decompressor
+        if decompressor is None:
+            decompressor = zlib.decompressobj(-self.client_wbits)
+            if self.client_takeover:
+                self.decompressor = decompressor
+
+        data = decompressor.decompress(data + _DEFLATE_TAIL, self.max_message_size)
+        if decompressor.unconsumed_tail:
+            return None
+        return data
+
+    def __close_received(self, payload: bytes) -> None:
+        if len(payload) >= 2:
+            code = int.from_bytes(payload[:2], "big")
+            try:
+                reason = payload[2:].decode("utf-8")
+            except UnicodeDecodeError:
+                return self.fail(CLOSE_INVALID_DATA)
+        elif payload:
+            return self.fail(CLOSE_PROTOCOL_ERROR)
+        else:
+            code, reason = CLOSE_NO_STATUS, ""
+
+        self.close_received = True
+        self.close_code = code
+        self.close_reason = reason
+        self.readable.set()
+
+        if not self.close_sent:
+            self.__send_close(code, "")
+        # the server closes the TCP connection first (RFC 6455 7.1.1)
+        self.transport.close()
+
+    def __ping(self) -> None:
+        if not self.alive:
+            self.transport.close()
+            return
+
+        self.alive = False
+        if not self.close_sent and not self.output.closed:
+            self.transport.write(encode_frame(OP_PING, b""))
+        self.ping_timer = self.loop.call_later(self.ping_interval, self.__ping)
+
+
+class WebSocket:
+    """ WebSocket endpoint of a request handler
+
+    example::
+
+        @Server.on_get("/echo")
+        async def echo(ws: WebSocket):
+            await ws.accept()
+            async for message in ws:
+                await ws.send(message)
+    """
+    __slots__ = ("request", "response", "output", "upgrade", "deflate", "protocol", "subprotocol")
+
+    request: Inject[Request]
+    response: Inject[Response]
+    output: Inject[Output]
+    upgrade: Inject[UPGRADE]
+    deflate: Inject[WebsocketProtocol.DEFLATE]
+    protocol: Union[WebsocketProtocol, None]
+    subprotocol: Union[str, None]
+
+    def __init__(self):
+        self.protocol = None
+        self.subprotocol = None
+
+    @property
+    def close_code(self) -> Union[int, None]:
+        return None if self.protocol is None else self.protocol.close_code
+
+    async def accept(self, subprotocols: Iterable[str] = ()) -> None:
+        """ Complete the opening handshake, the first of ``subprotocols``, that the client offers is selected """
+        headers = self.request.headers
+        if self.upgrade is None \
+                or headers.get(b"upgrade", b"").lower() != b"websocket" \
+                or b"sec-websocket-key" not in headers:
+            raise HTTPError(400)
+
+        if headers.get(b"sec-websocket-version") != b"13":
+            error = HTTPError(426)
+            error.headers[b"sec-websocket-version"] = b"13"
+            raise error
+
+        accept = b64encode(sha1(headers[b"sec-websocket-key"].strip() + _GUID).digest())
+        head = bytearray(b"HTTP/1.1 101 Switching Protocols\r\nupgrade: websocket\r\nconnection: Upgrade\r\n"
+                         b"sec-websocket-accept: %s\r\n" % accept)
+
+        offered = headers.get(b"sec-websocket-protocol")
+        if offered is not None:
+            offered = [p.strip() for p in offered.decode("ASCII").split(",")]
+            for subprotocol in subprotocols:
+                if subprotocol in offered:
+                    self.subprotocol = subprotocol
+                    head += b"sec-websocket-protocol: %s\r\n" % subprotocol.encode("ASCII")
+                    break
+
+        deflate = None
+        if self.deflate and b"sec-websocket-extensions" in headers:
+            deflate = negotiate_deflate(headers[b"sec-websocket-extensions"])
+            if deflate is not None:
+                head += b"sec-websocket-extensions: %s\r\n" % deflate[0]
+        head += b"\r\n"
+
+        # frames are written directly into the connection, so every previous response must be sent before
+        await self.output.wait_active()
+        await self.output.write(head)
+
+        self.response.headers_sent = True
+        protocol = self.protocol = self.upgrade(WebsocketProtocol)
+        if deflate is not None:
+            protocol.enable_deflate(*deflate[1])
+
+    async def receive(self) -> Union[str, bytes]:
+        """ Returns the next message, raises :class:`WebSocketClosed` when the connection is closed """
+        return await self.__protocol().receive()
+
+    async def send(self, data: Union[str, bytes]) -> None:
+        """ Send a text (``str``) or a binary (``bytes``) message """
+        await self.__protocol().send(data)
+
+    async def ping(self, data: bytes = b"") -> None:
+        await self.__protocol().ping(data)
+
+    async def close(self, code: int = CLOSE_NORMAL, reason: str = "") -> None:
+        await self.__protocol().close(code, reason)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Union[str, bytes]:
+        try:
+            return await self.__protocol().receive()
+        except WebSocketClosed:
+            raise StopAsyncIteration()
+
+    def __protocol(self) -> WebsocketProtocol:
+        if self.protocol is None:
+            raise RuntimeError("WebSocket is not accepted")
+        return self.protocol
+
+
+async def broadcast(websockets: Iterable[WebSocket], data: Union[str, bytes]) -> None:
+    """ Send the same message into every websocket
+
+    The message is encoded (and compressed) once for every distinct set of negotiated parameters,
+    and the same frame is written into each connection. Connections with a full write buffer
+    are waited concurrently, so a slow client does not delay the others.
+
+    example::
+
+        await broadcast(dashboard_clients, json.dumps(tick))
+    """
+    if isinstance(data, str):
+        opcode = OP_TEXT
+        data = data.encode("utf-8")
+    else:
+        opcode = OP_BINARY
+
+    plain = None
+    compressed: Dict[int, bytes] = {}
+    waiting = []
+
+    for ws in websockets:
+        protocol = ws.protocol
+        if protocol is None or protocol.close_sent or protocol.closed.is_set():
+            continue
+
+        if protocol.deflate and len(data) >= DEFLATE_MIN_SIZE:
+            wbits = protocol.server_wbits
+            try:
+                frame = compressed[wbits]
+            except KeyError:
+                compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -wbits)
+                payload = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                frame = compressed[wbits] = encode_frame(opcode, payload[:-4], True)
+        else:
+            if plain is None:
+                plain = encode_frame(opcode, data)
+            frame = plain
+
+        pending = protocol.write_prepared(frame)
+        if pending is not None:
+            waiting.append(pending)
+
+    if waiting:
+        await gather(*waiting, return_exceptions=True)
+
+
+def encode_frame(opcode: int, payload: bytes, compressed: bool = False) -> bytes:
+    """ Encode an unmasked, final frame """
+    b0 = 0x80 | opcode
+    if compressed:
+        b0 |= 0x40
+
+    length = len(payload)
+    if length < 126:
+        return bytes((b0, length)) + payload
+    elif length < 65536:
+        return pack("!BBH", b0, 126, length) + payload
+    else:
+        return pack("!BBQ", b0, 127, length) + payload
+
+
+def unmask(data: bytes, mask: bytes) -> bytes:
+    """ XOR the payload with the masking key, as one big integer operation """
+    length = len(data)
+    if not length:
+        return b""
+    key = (bytes(mask) * (length // 4 + 1))[:length]
+    return (int.from_bytes(data, "little") ^ int.from_bytes(key, "little")).to_bytes(length, "little")
+
+
+def negotiate_deflate(value: bytes) -> Union[Tuple[bytes, Tuple[int, int, bool, bool]], None]:
+    """ Accept the first acceptable permessage-deflate offer, returns the response header value,
+    and the parameters of :meth:`WebsocketProtocol.enable_deflate`
+    """
+    for offer in value.split(b","):
+        params = [p.strip() for p in offer.split(b";")]
+        if params[0].lower() != b"permessage-deflate":
+            continue
+
+        server_wbits = client_wbits = 15
+        server_takeover = client_takeover = True
+        response = [b"permessage-deflate"]
+        valid = True
+
+        for param in params[1:]:
+            name, _, arg = param.partition(b"=")
+            name = name.strip().lower()
+            arg = arg.strip().strip(b'"')
+
+            if name == b"server_no_context_takeover" and not arg:
+                server_takeover = False
+                response.append(name)
+            elif name == b"client_no_context_takeover" and not arg:
+                client_takeover = False
+                response.append(name)
+            elif name == b"server_max_window_bits" and arg.isdigit() and 9 <= int(arg) <= 15:
+                server_wbits = int(arg)
+                response.append(b"server_max_window_bits=%d" % server_wbits)
+            elif name == b"client_max_window_bits" and (not arg or (arg.isdigit() and 9 <= int(arg) <= 15)):
+                # the client uses the given window size, or the default (15) when it is not limited
+                if arg:
+                    client_wbits = int(arg)
+                    response.append(b"client_max_window_bits=%d" % client_wbits)
+            else:
+                valid = False
+                break
+
+        if valid:
+            return b"; ".join(response), (server_wbits, client_wbits, server_takeover, client_takeover)
+    return None
@@ -14,13 +14,15 @@ pattern:
 """
 import re
 import uuid
+from collections import OrderedDict
 from decimal import Decimal
-from typing import Union, Callable, Awaitable, Any, Dict, List, Tuple, Iterable
+from inspect import signature, Parameter
+from typing import Union, Callable, Awaitable, Any, Dict, List, Tuple, Iterable, Sequence, Set, get_type_hints
 
 from yapic.di import Injector, Injectable, KwOnly, NoKwOnly
 
 from .error import HTTPError
-from .protocol.params import Params
+from .protocol.params import Params, URL, QUERY, BODY
 
 RouterHandler = Callable[[Any], Awaitable[Any]]
 
@@ -33,6 +35,17 @@ class RouteNotFound(HTTPError):
         self.route = route
 
 
+class MethodNotAllowed(HTTPError):
+    route: str
+    allowed: Set[bytes]
+
+    def __init__(self, route: str, allowed: Iterable[bytes]):
+        super().__init__(405)
+        self.route = route
+        self.allowed = set(allowed)
+        self.headers[b"allow"] = b", ".join(sorted(self.allowed))
+
+
 class RouteGroup:
     """
     rg = RouteGroup()
@@ -45,14 +58,16 @@ class RouteGroup:
     async def handler():
         pass
     """
-    __slots__ = ("_routes", "_sub_groups")
+    __slots__ = ("_routes", "_sub_groups", "_frozen")
 
-    _routes: Dict[Union[bytes, None], "RouteList"]
+    _routes: Dict[bytes, List["Route"]]
     _sub_groups: List[Tuple[str, "RouteGroup"]]
+    _frozen: bool
 
     def __init__(self):
         self._routes = {}
         self._sub_groups = []
+        self._frozen = False
 
     def on(self, url: str, *methods: Union[str, bytes]):
         if not methods:
@@ -69,8 +84,23 @@ class RouteGroup:
             self.__add(m if isinstance(m, bytes) else m.encode("ASCII"), url, handler)
 
     def add_group(self, prefix: str, group: "RouteGroup"):
+        if self._frozen:
+            raise RuntimeError("Routes are frozen, can't add group: %r" % prefix)
         self._sub_groups.append((prefix, group))
 
+    def static(self, url: str, root: str, **options):
+        """ Serve files from the ``root`` directory under the url prefix, see :class:`vizen.static.StaticFiles`
+
+        example::
+
+            router.static("/assets", "/var/www/assets")
+        """
+        from .static import StaticFiles
+
+        static = StaticFiles(root, **options)
+        self.add_handler([b"GET"], url.rstrip("/") + "/{path}", static.handle)
+        return static
+
     def get(self, url: str):
         return self.__decorator(b"GET", url)
 
@@ -96,18 +126,15 @@ class RouteGroup:
         return self.__decorator(b"PATCH", url)
 
     def __add(self, method: bytes, url: str, handler: RouterHandler):
+        if self._frozen:
+            raise RuntimeError("Routes are frozen, can't add url: %r" % url)
+
         try:
             container = self._routes[method]
         except KeyError:
-            container = self._routes[method] = RouteList()
-
-        if handler.__code__ and handler.__code__.co_kwonlyargcount:  # type: ignore
-            injectable = Injectable(handler, provide=[KwOnly(get_handler_kwarg)])
-        else:
-            injectable = Injectable(handler)
+            container = self._routes[method] = []
 
-        route = Route(url, injectable)
-        container.add(route)
+        container.append(Route(url, Handler(handler, url)))
 
     def __decorator(self, method: bytes, url: str):
         def wrapper(fn: RouterHandler):
@@ -117,26 +144,265 @@ class RouteGroup:
         return wrapper
 
 
-def get_handler_kwarg(params: Params, *, name, type):
-    try:
-        param = params[name]
-    except KeyError:
-        raise NoKwOnly()
+_MISSING: Any = object()
 
-    if isinstance(param, type):
-        return param
-    else:
-        return type(param)
+
+class HandlerArgs:
+    """ Binding plan of handler keyword only arguments
+
+    Sources, converters and defaults are collected, when the handler is registered. Url params
+    are read only from the url, other arguments from the query and then from the body, and the
+    conversion is skipped for url params, when the route already converts them to the annotated type.
+    """
+    __slots__ = ("args", )
+
+    args: Dict[str, Tuple[Tuple[int, ...], Union[type, None], Any]]
+
+    def __init__(self, handler: RouterHandler, url: str):
+        url_types = {}
+        for name, type_name in _RE_PARAMS.findall(url):
+            conv = _RE_TYPE.get(type_name or "_all", (None, None))[1]
+            url_types[name] = conv if isinstance(conv, type) else str
+
+        try:
+            hints = get_type_hints(handler)
+        except Exception:
+            hints = getattr(handler, "__annotations__", {})
+
+        self.args = {}
+        for param in signature(handler).parameters.values():
+            if param.kind is not Parameter.KEYWORD_ONLY:
+                continue
+
+            conv = hints.get(param.name)
+            if not isinstance(conv, type) or (param.name in url_types and issubclass(url_types[param.name], conv)):
+                conv = None
+
+            sources = (URL, ) if param.name in url_types else (QUERY, BODY)
+            default = _MISSING if param.default is Parameter.empty else param.default
+            self.args[param.name] = (sources, conv, default)
+
+    def __call__(self, params: Params, *, name, type):
+        sources, conv, default = self.args[name]
+
+        for source in sources:
+            value = params.source(source).get(name, _MISSING)
+            if value is not _MISSING:
+                break
+        else:
+            if default is _MISSING:
+                raise NoKwOnly()
+            return default
+
+        if conv is None or isinstance(value, conv):
+            return value
+        else:
+            return conv(value)
+
+
+class Handler:
+    """ Route handler, with its arguments resolved by the injector, or without it by :meth:`call`
+
+    When every argument of the handler is a core object of the request (see :class:`RequestContext`)
+    or a keyword only request param, :meth:`call` passes them directly, so the DI scope of the request
+    is not created at all.
+    """
+    __slots__ = ("fn", "injectable", "kwargs", "args", "kwonly")
+
+    fn: RouterHandler
+    injectable: Injectable
+    kwargs: Union[HandlerArgs, None]
+    args: Union[Tuple[type, ...], None]
+    kwonly: Tuple[Tuple[str, Union[type, None]], ...]
+
+    def __init__(self, fn: RouterHandler, url: Union[str, None] = None):
+        self.fn = fn
+
+        if url is not None and fn.__code__ and fn.__code__.co_kwonlyargcount:  # type: ignore
+            self.kwargs = HandlerArgs(fn, url)
+            self.injectable = Injectable(fn, provide=[KwOnly(self.kwargs)])
+        else:
+            self.kwargs = None
+            self.injectable = Injectable(fn)
+
+        self.args, self.kwonly = _direct_args(fn, self.kwargs is not None)
+
+    def __call__(self, injector: Injector) -> Awaitable[Any]:
+        return self.injectable(injector)
+
+    def call(self, context: Any) -> Awaitable[Any]:
+        """ Call the handler with the objects of the given :class:`RequestContext` """
+        args = self.args
+        if args is not None:
+            kwargs = {}
+            for name, type in self.kwonly:
+                try:
+                    kwargs[name] = self.kwargs(context.params, name=name, type=type)
+                except NoKwOnly:
+                    if type is None:
+                        return self.injectable(context.injector)
+                    kwargs[name] = context[type]
+            return self.fn(*[context[t] for t in args], **kwargs)
+        return self.injectable(context.injector)
+
+
+def _direct_args(fn: RouterHandler, kwonly: bool):
+    """ Returns the types of positional arguments and the keyword only arguments (with their type, when it is
+    a core object), or ``(None, ())`` when the handler depends on something, that only the injector provides
+    """
+    from .protocol.context import CORE_ARGS
+
+    try:
+        hints = get_type_hints(fn)
+    except Exception:
+        hints = getattr(fn, "__annotations__", {})
+
+    args = []
+    kwargs = []
+    for param in signature(fn).parameters.values():
+        hint = hints.get(param.name)
+        try:
+            core = hint in CORE_ARGS
+        except TypeError:
+            core = False
+
+        if param.kind is Parameter.KEYWORD_ONLY and kwonly:
+            kwargs.append((param.name, hint if core else None))
+        elif core and param.kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD):
+            args.append(hint)
+        else:
+            return None, ()
+    return tuple(args), tuple(kwargs)
 
 
 class Router(RouteGroup):
-    def find(self, url: str, method: bytes) -> Tuple[Injectable, dict]:
+    """
+    Dynamic routes are matched with ``RouteTree`` by default, ``RouteRegex`` is also available::
+
+        r = Router(engine=RouteRegex)
+    """
+    __slots__ = ("_table", "cache", "engine")
+
+    _table: Union["RouteList", None]
+    cache: Union["RouteCache", None]
+    engine: Callable[[], "RouteMatcher"]
+
+    def __init__(self, *, cache_size: int = 0, engine=None):
+        super().__init__()
+        self._table = None
+        self.cache = RouteCache(cache_size) if cache_size > 0 else None
+        self.engine = engine or RouteTree
+
+    def freeze(self) -> None:
+        """ Build the lookup tables from routes and from mounted groups
+
+        After this, routes can't be added to the router or to its groups. ``Server.start``
+        calls it before workers start, ``find`` calls it when the router is not frozen yet.
+        """
+        if self._table is not None:
+            return
+
+        routes: List[Tuple[bytes, Route]] = []
+        _flatten(self, "", routes)
+        self._table = RouteList(routes, self.engine)
+
+    def find(self, url: str, method: bytes) -> Tuple[Handler, dict]:
+        """ Returns the handler and the url params
+
+        Raises ``RouteNotFound`` when no route matches the url, and ``MethodNotAllowed``
+        when routes match only with other methods.
+        """
+        table = self._table
+        if table is None:
+            self.freeze()
+            table = self._table
+
+        cache = self.cache
+        if cache is None:
+            return table.find(url, method)  # type: ignore
+
+        key = (method, normalize(url))
+        found = cache.get(key)
+        if found is None:
+            found = table.find(key[1], method)  # type: ignore
+            if found[1]:
+                cache.put(key, found)
+        return found
+
+
+class RouteCache:
+    """ Bounded LRU cache of resolved dynamic routes, keyed by ``(method, path)``
+
+    Only matched routes are cached, and the least recently used entry is dropped,
+    when the cache is full, so scanning urls can't grow the memory usage.
+
+    example::
+
+        @Server.on_init
+        def init_router(injector: Injector):
+            injector[Router].cache = RouteCache(4096)
+    """
+    __slots__ = ("maxsize", "hits", "misses", "_entries")
+
+    maxsize: int
+    hits: int
+    misses: int
+    _entries: "OrderedDict[Tuple[bytes, str], Tuple[Handler, dict]]"
+
+    def __init__(self, maxsize: int = 1024):
+        if maxsize <= 0:
+            raise ValueError("Cache size must be greater than zero")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: Tuple[bytes, str]) -> Union[Tuple[Handler, dict], None]:
+        """ Returns the cached handler with a copy of params, so handlers can't modify the cached params """
         try:
-            rl = self._routes[method]
+            handler, params = self._entries[key]
         except KeyError:
-            raise RouteNotFound(url)
+            self.misses += 1
+            return None
         else:
-            return rl.find(url)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (handler, dict(params))
+
+    def put(self, key: Tuple[bytes, str], found: Tuple[Handler, dict]) -> None:
+        entries = self._entries
+        entries[key] = (found[0], dict(found[1]))
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "<RouteCache size: %d/%d, hits: %d, misses: %d>" % (len(self), self.maxsize, self.hits, self.misses)
+
+
+def _flatten(group: RouteGroup, prefix: str, result: List[Tuple[bytes, "Route"]]) -> None:
+    group._frozen = True
+
+    for method, routes in group._routes.items():
+        for route in routes:
+            if not prefix:
+                result.append((method, route))
+            elif "{" in prefix and route.handler.kwargs is not None:
+                # url params of the prefix are bound from the url too
+                pattern = prefix + route.pattern
+                result.append((method, Route(pattern, Handler(route.handler.fn, pattern))))
+            else:
+                result.append((method, Route(prefix + route.pattern, route.handler)))
+
+    for sub_prefix, sub_group in group._sub_groups:
+        _flatten(sub_group, prefix + normalize(sub_prefix).rstrip("/"), result)
 
 
 _RE_PARAMS = re.compile(r"\{([^:\s]+)(?:\s*:\s*([^}]+))?\}", re.I)
@@ -155,46 +421,69 @@ _RE_TYPE["string"] = _RE_TYPE["str"]
 
 
 class Route:
-    __slots__ = ("pattern", "handler", "prefix", "params_regex", "params_conv", "priority")
+    __slots__ = ("pattern", "handler", "prefix", "params_source", "params_conv", "priority")
 
     pattern: str
-    handler: Injectable
+    handler: Handler
     prefix: str
-    params_regex: Union[Any, None]
+    params_source: Union[str, None]
     params_conv: Dict[str, Callable[[str], Any]]
     priority: int
 
-    def __init__(self, pattern: str, handler: Injectable):
+    def __init__(self, pattern: str, handler: Handler):
         self.params_conv = {}
         self.handler = handler
-        self.priority = 0
         self.pattern = pattern = normalize(pattern)
 
         try:
             params_begin = pattern.index("{")
         except ValueError:
             params_begin = len(pattern)
-            self.params_regex = None
+            self.params_source = None
+            self.priority = 0
         else:
-            dynamic = pattern[params_begin:]
-            self.params_regex = re.compile("^" + re.sub(_RE_PARAMS, self.__replace_params, dynamic) + "$").match
+            self.params_source, self.priority = compile_params(pattern[params_begin:], self.params_conv)
 
         self.prefix = pattern[0:params_begin]
 
-    def _handle_match(self, match) -> Dict[str, Any]:
+    def _handle_matches(self, matches) -> Dict[str, Any]:
         conv = self.params_conv
         result: Dict[str, Any] = {}
-        for k, v in match.groupdict().items():
-            result[k] = conv[k](v)
+        for match in matches:
+            for k, v in match.groupdict().items():
+                result[k] = conv[k](v)
         return result
 
-    def __replace_params(self, match) -> str:
+    @property
+    def signature(self) -> str:
+        """ Pattern without param names, routes with the same signature match the same urls """
+        return re.sub(_RE_PARAMS, _param_signature, self.pattern)
+
+    def __repr__(self):
+        return "<Route %r>" % self.pattern
+
+
+def _param_signature(match) -> str:
+    type = match.group(2) or "_all"
+    try:
+        return "{%s}" % _RE_TYPE[type][0]
+    except KeyError:
+        return "{%s}" % type
+
+
+def compile_params(pattern: str, conv: Dict[str, Callable[[str], Any]]) -> Tuple[str, int]:
+    """ Replace params in pattern with named groups, returns regex source and the priority of params
+    """
+    priority = 0
+
+    def replace(match) -> str:
+        nonlocal priority
         name, type = match.groups()
 
         if type is None:
             type = "_all"
 
-        converter: Any = lambda v: v
+        converter: Any
         re_type: Any
 
         try:
@@ -202,56 +491,292 @@ class Route:
         except KeyError:
             re_type, converter, prio = type, lambda v: v, 20
 
-        self.priority += prio
-        self.params_conv[name] = converter
+        priority += prio
+        conv[name] = converter
 
         return "(?P<%s>%s)" % (name, re_type)
 
+    return re.sub(_RE_PARAMS, replace, pattern), priority
+
+
+RouteMethods = Dict[bytes, Route]
+RouteCandidate = Tuple[Tuple[int, int], str, Callable[..., Any], RouteMethods]
+
+
+class RouteNode:
+    """ Node of the dynamic route tree, edges are the literal segments of route prefixes
+
+    A route is kept in the node of the last complete segment of its prefix (the literal part
+    before the first param). Its regex matches the rest of the url from the start of the next segment.
+    Routes of a node are tried in ``(len(prefix), priority)`` order, and the routes with the same pattern
+    are held together by method.
+    """
+    __slots__ = ("static", "routes", "patterns")
+
+    static: Dict[str, "RouteNode"]
+    routes: Sequence[RouteCandidate]
+    patterns: Dict[str, RouteMethods]
+
+    def __init__(self):
+        self.static = {}
+        self.routes = []
+        self.patterns = {}
+
+    def static_child(self, segment: str) -> "RouteNode":
+        try:
+            return self.static[segment]
+        except KeyError:
+            child = self.static[segment] = RouteNode()
+            return child
+
+    def add(self, rest: str, method: bytes, route: Route) -> None:
+        try:
+            methods = self.patterns[route.pattern]
+        except KeyError:
+            methods = self.patterns[route.pattern] = {}
+            match = re.compile(re.escape(rest) + route.params_source).fullmatch  # type: ignore
+            self.routes.append(  # type: ignore
+                ((len(route.prefix), route.priority), route.pattern, match, methods))
+        methods[method] = route
+
+    def freeze(self) -> None:
+        # sorting is stable, so routes with the same key are tried in the order they were added
+        self.routes = tuple(sorted(self.routes, key=lambda item: item[0], reverse=True))
+        self.patterns = {}
+
+        for child in self.static.values():
+            child.freeze()
+
     def __repr__(self):
-        return "<Route %r>" % self.pattern
+        return "<RouteNode static: %r, routes: %r>" % (list(self.static), [r[1] for r in self.routes])
 
 
-class RouteList:
-    __slots__ = ("exact", "dynamic")
+class RouteTree:
+    """ Dynamic route matcher, that walks the literal segments of the url
 
-    exact: Dict[str, Route]
-    dynamic: List[Tuple[str, Any, Route]]
+    Only the routes along the walked path are tried, deeper nodes first, so the routes are
+    tried in the same ``(len(prefix), priority)`` order as in :class:`RouteRegex` and the flat
+    route list, and params may span multiple segments (so ``/files/{path}`` matches ``/files/a/b``).
+
+    Lookup cost depends on the depth of the url, and the number of routes with a matching prefix,
+    and not on the number of all routes.
+    """
+    __slots__ = ("root", )
+
+    root: RouteNode
 
     def __init__(self):
-        self.exact = {}
-        self.dynamic = []
+        self.root = RouteNode()
+
+    def add(self, method: bytes, route: Route) -> None:
+        node = self.root
+        segments = route.prefix.split("/")
+        for segment in segments[1:-1]:
+            node = node.static_child(segment)
+        node.add(segments[-1], method, route)
+
+    def freeze(self) -> None:
+        """ Sort routes once, after all routes are added """
+        self.root.freeze()
+
+    def find(self, url: str, method: bytes, allowed: Set[bytes]) -> Union[Tuple[Handler, dict], None]:
+        node = self.root
+        path = [(node, 1)]
+        pos = 1
+        parts = url.split("/")
+        for i in range(1, len(parts) - 1):
+            segment = parts[i]
+            node = node.static.get(segment)  # type: ignore
+            if node is None:
+                break
+            pos += len(segment) + 1
+            path.append((node, pos))
+
+        for node, pos in reversed(path):
+            for _, _, match, methods in node.routes:
+                params = match(url, pos)
+                if params is not None:
+                    route = methods.get(method)
+                    if route is not None:
+                        return (route.handler, route._handle_matches((params, )))
+                    allowed.update(methods)
+        return None
 
-    def add(self, route: Route):
-        if route.params_regex:
-            self.dynamic.append((route.prefix, route.params_regex, route))
-            self.dynamic.sort(key=lambda item: (len(item[0]), item[2].priority), reverse=True)
-        else:
-            if route.prefix in self.exact:
-                raise ValueError("This url is already defined: %r" % route.prefix)
-            else:
-                self.exact[route.prefix] = route
+    def __repr__(self):
+        return "<RouteTree %r>" % self.root
 
-    def find(self, url: str) -> Tuple[Injectable, dict]:
-        url = normalize(url)
+
+_RE_GROUP_NAME = re.compile(r"\(\?P<([^>]+)>")
+
+RouteAlternation = Tuple[Callable[[str], Any], Dict[str, Tuple[Route, List[Tuple[str, str]]]]]
+
+
+class RouteRegex:
+    """ Dynamic route matcher, that compiles all routes of a method into one regex
+
+    Every route is an alternative with a named group, in ``(len(prefix), priority)`` order,
+    so a single ``fullmatch`` selects the route and extracts its params. Params may span
+    multiple segments, like in the flat route list.
+    """
+    __slots__ = ("routes", "tables")
+
+    routes: Dict[bytes, List[Route]]
+    tables: Dict[bytes, RouteAlternation]
+
+    def __init__(self):
+        self.routes = {}
+        self.tables = {}
+
+    def add(self, method: bytes, route: Route) -> None:
         try:
-            exact = self.exact[url]
+            self.routes[method].append(route)
         except KeyError:
-            return self.__find_dynamic(url)
+            self.routes[method] = [route]
+
+    def freeze(self) -> None:
+        for method, routes in self.routes.items():
+            self.tables[method] = _compile_alternation(routes)
+
+    def find(self, url: str, method: bytes, allowed: Set[bytes]) -> Union[Tuple[Handler, dict], None]:
+        try:
+            match, groups = self.tables[method]
+        except KeyError:
+            params = None
         else:
-            return (exact.handler, {})
+            params = match(url)
+
+        if params is None:
+            for other, (other_match, _) in self.tables.items():
+                if other != method and other_match(url) is not None:
+                    allowed.add(other)
+            return None
+
+        route, names = groups[params.lastgroup]
+        conv = route.params_conv
+        result: Dict[str, Any] = {}
+        for group, name in names:
+            result[name] = conv[name](params.group(group))
+        return (route.handler, result)
+
+    def __repr__(self):
+        return "<RouteRegex %r>" % self.routes
+
+
+def _compile_alternation(routes: List[Route]) -> RouteAlternation:
+    routes = sorted(routes, key=lambda route: (len(route.prefix), route.priority), reverse=True)
+
+    alternatives = []
+    groups = {}
+    for i, route in enumerate(routes):
+        group = f"r{i}"
+        params: List[Tuple[str, str]] = []
+
+        def rename(match) -> str:
+            name = f"{group}_{len(params)}"
+            params.append((name, match.group(1)))
+            return "(?P<%s>" % name
+
+        source = _RE_GROUP_NAME.sub(rename, route.params_source)  # type: ignore
+        alternatives.append("(?P<%s>%s%s)" % (group, re.escape(route.prefix), source))
+        groups[group] = (route, [p for p in params if p[1] in route.params_conv])
+
+    return (re.compile("|".join(alternatives)).fullmatch, groups)
+
+
+RouteMatcher = Union[RouteTree, RouteRegex]
+
 
-    def __find_dynamic(self, url: str) -> Tuple[Injectable, dict]:
-        for prefix, re_params, route in self.dynamic:
-            if url.startswith(prefix):
-                params = re_params(url[len(prefix):])
-                if params:
-                    return (route.handler, route._handle_match(params))
-        raise RouteNotFound(url)
+class RouteList:
+    """ Lookup table of all routes, built once, and matched once regardless of the method
+
+    Leaves hold the routes by method. ``HEAD`` falls back to the ``GET`` handler, and when
+    ``OPTIONS`` is not handled, it responds with the ``Allow`` header. When the url matches only
+    with other methods ``MethodNotAllowed`` is raised.
+    """
+    __slots__ = ("exact", "dynamic")
+
+    exact: Dict[str, RouteMethods]
+    dynamic: RouteMatcher
+
+    def __init__(self, routes: Iterable[Tuple[bytes, Route]], engine: Callable[[], RouteMatcher] = RouteTree):
+        self.exact = {}
+        self.dynamic = engine()
+
+        routes = list(routes)
+        defined: Dict[str, RouteMethods] = {}
+        for method, route in routes:
+            try:
+                methods = defined[route.signature]
+            except KeyError:
+                methods = defined[route.signature] = {}
+            else:
+                if method in methods:
+                    raise ValueError("This url is already defined: %r, conflicts with: %r" %
+                                     (route.pattern, methods[method].pattern))
+            methods[method] = route
+
+        options: Dict[bytes, Handler] = {}
+        for methods in defined.values():
+            route = next(iter(methods.values()))
+
+            allowed = set(methods)
+            allowed.add(b"OPTIONS")
+
+            if b"HEAD" not in methods and b"GET" in methods:
+                routes.append((b"HEAD", methods[b"GET"]))
+                allowed.add(b"HEAD")
+
+            if b"OPTIONS" not in methods:
+                allow = b", ".join(sorted(allowed))
+                try:
+                    handler = options[allow]
+                except KeyError:
+                    handler = options[allow] = _options_handler(allow)
+                routes.append((b"OPTIONS", Route(route.pattern, handler)))
+
+        for method, route in routes:
+            if route.params_source is None:
+                try:
+                    self.exact[route.prefix][method] = route
+                except KeyError:
+                    self.exact[route.prefix] = {method: route}
+            else:
+                self.dynamic.add(method, route)
+
+        self.dynamic.freeze()
+
+    def find(self, url: str, method: bytes) -> Tuple[Handler, dict]:
+        url = normalize(url)
+        allowed: Set[bytes] = set()
+
+        methods = self.exact.get(url)
+        if methods is not None:
+            route = methods.get(method)
+            if route is not None:
+                return (route.handler, {})
+            allowed.update(methods)
+
+        found = self.dynamic.find(url, method, allowed)
+        if found is None:
+            if allowed:
+                raise MethodNotAllowed(url, allowed)
+            raise RouteNotFound(url)
+        return found
 
     def __repr__(self):
         return "<RouteList exact: %r, dynamic: %r>" % (self.exact, self.dynamic)
 
 
+def _options_handler(allow: bytes) -> Handler:
+    from .protocol.response import Response
+
+    async def options(response: Response):
+        response.headers[b"allow"] = allow
+        await response.send(b"")
+
+    return Handler(options)
+
+
 def normalize(pattern: str) -> str:
     if pattern[0] != "/":
         return f"/{pattern}"
@@ -125,11 +125,17 @@ class Server:
     def on_patch(cls, url: str):
         return injector[Router].patch(url)
 
+    @classmethod
+    def static(cls, url: str, root: str, **options):
+        return injector[Router].static(url, root, **options)
+
     @classmethod
     def start(cls, ip: str, port: int):
         for init in _SERVER_INIT:
             init(injector)
 
+        injector[Router].freeze()
+
         server = injector[Server] = injector[Server]
         server.run(ip, port)
 
@@ -160,7 +166,8 @@ class Server:
         server_injector[SOCK_LISTEN] = sock
         # https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.create_server
         try:
-            await self.loop.create_server(server_injector[ProtocolFactory], sock=sock)
+            ssl = None if self.ssl is None else self.ssl.get_context()
+            await self.loop.create_server(server_injector[ProtocolFactory], sock=sock, ssl=ssl)
         except Exception as err:
             handled = await handle_error(server_injector, err)
             if not handled:
@@ -1,5 +1,5 @@
 from pathlib import Path
-from ssl import SSLContext
+from ssl import SSLContext, PROTOCOL_TLS_SERVER, CERT_REQUIRED
 
 
 class SSLConfig:
@@ -16,10 +16,10 @@ class SSLConfig:
                  *,
                  keyfile: Path,
                  certfile: Path,
-                 ca_certs: Path,
+                 ca_certs: Path = None,
                  version: int = 2,
                  cert_required: bool = False,
-                 ciphers: str = "TLSv1"):
+                 ciphers: str = None):
         self.keyfile = keyfile
         self.certfile = certfile
         self.ca_certs = ca_certs
@@ -28,4 +28,14 @@ class SSLConfig:
         self.ciphers = ciphers
 
     def get_context(self) -> SSLContext:
-        pass
+        """ Server side context, offering HTTP/2 (``h2``) and HTTP/1.1 with ALPN """
+        context = SSLContext(PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        if self.ca_certs is not None:
+            context.load_verify_locations(self.ca_certs)
+        if self.cert_required:
+            context.verify_mode = CERT_REQUIRED
+        if self.ciphers is not None:
+            context.set_ciphers(self.ciphers)
+        context.set_alpn_protocols(["h2", "http/1.1"])
+        return context
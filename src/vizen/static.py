@@ -0,0 +1,438 @@
+import os
+import stat
+from collections import OrderedDict, deque
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from time import monotonic
+from typing import Deque, Dict, Tuple, Union
+
+from watchdog.observers.polling import PollingObserver
+from watchdog.events import FileSystemEventHandler, FileSystemEvent
+
+from .error import HTTPError
+from .protocol.request import Request
+from .protocol.response import Response
+from .protocol.compression import Compression, negotiate
+
+__all__ = "StaticFiles", "FileInfo", "HotCache"
+
+# compressed files (eg.: ``app.js.gz``) are served as is, with the type of the archive, not of its content
+_ENCODING_TYPES = {
+    "gzip": "application/gzip",
+    "bzip2": "application/x-bzip2",
+    "xz": "application/x-xz",
+    "br": "application/x-brotli",
+}
+
+
+class FileInfo:
+    """ Cached result of ``os.stat``, with the precomputed validator headers """
+    __slots__ = ("path", "size", "mtime", "etag", "last_modified", "content_type")
+
+    path: str
+    size: int
+    mtime: float
+    etag: bytes
+    last_modified: bytes
+    content_type: bytes
+
+    def __init__(self, path: str, st: os.stat_result):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.etag = b'"%x-%x"' % (st.st_mtime_ns, st.st_size)
+        self.last_modified = formatdate(st.st_mtime, usegmt=True).encode("ASCII")
+
+        ct, encoding = guess_type(path)
+        if encoding is not None:
+            ct = _ENCODING_TYPES.get(encoding, "application/octet-stream")
+        elif ct is None:
+            ct = "application/octet-stream"
+        elif ct.startswith("text/") or ct in ("application/javascript", "application/json"):
+            ct += "; charset=utf-8"
+        self.content_type = ct.encode("ASCII")
+
+
+class HotFile:
+    """ Small file with prebuilt response headers """
+    __slots__ = ("etag", "head", "body", "content_type", "last_modified", "encoded_heads")
+
+    etag: bytes
+    head: bytes
+    body: bytes
+    content_type: bytes
+    last_modified: bytes
+    encoded_heads: Dict[bytes, bytes]
+
+    def __init__(self, info: FileInfo, body: bytes, content_type: bytes = None):
+        if content_type is None:
+            content_type = info.content_type
+
+        self.etag = info.etag
+        self.body = body
+        self.content_type = content_type
+        self.last_modified = info.last_modified
+        self.encoded_heads = {}
+        self.head = (b"content-type: %s\r\ncontent-length: %d\r\netag: %s\r\nlast-modified: %s\r\n"
+                     b"accept-ranges: bytes\r\n\r\n"
+                     % (content_type, len(body), info.etag, info.last_modified))
+
+    def encoded_head(self, encoding: bytes, length: int) -> bytes:
+        """ Returns the prebuilt headers of the compressed variant """
+        try:
+            return self.encoded_heads[encoding]
+        except KeyError:
+            head = self.encoded_heads[encoding] = (
+                b"content-type: %s\r\ncontent-length: %d\r\ncontent-encoding: %s\r\netag: W/%s\r\n"
+                b"last-modified: %s\r\n\r\n"
+                % (self.content_type, length, encoding, self.etag, self.last_modified))
+            return head
+
+    def __len__(self):
+        return len(self.head) + len(self.body)
+
+
+class HotCache:
+    """ LRU cache of small files, the total size of the cached responses is limited by ``max_size`` bytes """
+    __slots__ = ("max_size", "size", "entries")
+
+    max_size: int
+    size: int
+    entries: Dict[str, HotFile]
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, path: str, etag: bytes) -> Union[HotFile, None]:
+        """ Returns the cached file, if it is not changed since it was cached """
+        try:
+            entry = self.entries[path]
+        except KeyError:
+            return None
+
+        if entry.etag == etag:
+            self.entries.move_to_end(path)
+            return entry
+        else:
+            self.discard(path)
+            return None
+
+    def put(self, path: str, entry: HotFile) -> None:
+        self.discard(path)
+
+        size = len(entry)
+        if size > self.max_size:
+            return
+
+        entries = self.entries
+        while entries and self.size + size > self.max_size:
+            self.size -= len(entries.popitem(last=False)[1])
+
+        entries[path] = entry
+        self.size += size
+
+    def discard(self, path: str) -> None:
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class _Watcher(FileSystemEventHandler):
+    """ Collects the changed paths (relative to root) from the observer thread """
+
+    def __init__(self, root: str, changes: Deque[str]):
+        self.root = root
+        self.changes = changes
+
+    def on_any_event(self, event: FileSystemEvent):
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if path:
+                self.changes.append(os.path.relpath(path, self.root).replace(os.sep, "/"))
+
+
+class StaticFiles:
+    """ Serve files from the ``root`` directory
+
+    Files are sent with ``sendfile`` (see :meth:`Output.sendfile`), conditional (``If-None-Match``,
+    ``If-Modified-Since``) and range (``Range``, ``If-Range``) requests are supported. The result of
+    ``os.stat`` is cached for ``stat_ttl`` seconds.
+
+    Files up to ``hot_file_size`` bytes are kept in memory together with their response headers,
+    until the total size reaches ``hot_cache_size``. Cached files are revalidated by their mtime, when
+    the stat cache expires, or with ``watch=True`` changes are detected by a watchdog observer, and
+    the stat cache does not expire.
+
+    When :class:`Compression` is enabled, a precompressed ``.gz`` file next to the requested one is sent
+    to clients accepting gzip, and compressed variants of the in memory files are cached.
+
+    example::
+
+        static = StaticFiles("/var/www/assets")
+        router.add_handler([b"GET"], "/assets/{path}", static.handle)
+
+        # or
+
+        router.static("/assets", "/var/www/assets")
+    """
+    __slots__ = ("root", "stat_ttl", "stat_cache_size", "hot_file_size", "hot_cache", "_stat_cache", "_changes",
+                 "_observer")
+
+    root: str
+    stat_ttl: float
+    stat_cache_size: int
+    hot_file_size: int
+    hot_cache: HotCache
+    _stat_cache: Dict[str, Tuple[float, Union[FileInfo, None]]]
+    _changes: Union[Deque[str], None]
+
+    def __init__(self,
+                 root: str,
+                 *,
+                 stat_ttl: float = 1.0,
+                 stat_cache_size: int = 1024,
+                 hot_file_size: int = 65536,
+                 hot_cache_size: int = 16777216,
+                 watch: bool = False):
+        self.root = os.path.realpath(root)
+        self.stat_ttl = stat_ttl
+        self.stat_cache_size = stat_cache_size
+        self.hot_file_size = hot_file_size
+        self.hot_cache = HotCache(hot_cache_size)
+        self._stat_cache = OrderedDict()
+
+        if watch:
+            self.stat_ttl = float("inf")
+            self._changes = deque()
+            self._observer = PollingObserver()
+            self._observer.schedule(_Watcher(self.root, self._changes), self.root, recursive=True)
+            self._observer.start()
+        else:
+            self._changes = None
+            self._observer = None
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.unschedule_all()
+            self._observer.stop()
+
+    async def handle(self, request: Request, response: Response, compression: Compression, *, path: str) -> None:
+        info = self.file_info(path)
+        if info is None:
+            raise HTTPError(404)
+
+        # the precompressed file is sent with the type of the requested file
+        content_type = info.content_type
+        hot_key = path
+        encoding = None
+        if compression.enabled and content_type.startswith(compression.types):
+            response.headers[b"vary"] = b"accept-encoding"
+            accept = request.headers.get(b"accept-encoding")
+            if accept is not None:
+                if negotiate(accept, (b"gzip", )) is not None:
+                    gz_info = self.file_info(path + ".gz")
+                    if gz_info is not None and gz_info.mtime >= info.mtime:
+                        response.headers[b"content-encoding"] = b"gzip"
+                        path, info = path + ".gz", gz_info
+                        # requesting the ``.gz`` file directly gives different headers
+                        hot_key = path + "\0"
+                        accept = None
+                if accept is not None and info.size >= compression.min_size:
+                    encoding = compression.negotiate(accept, info.content_type)
+
+        if not_modified(request, info):
+            headers = response.headers
+            headers[b"etag"] = info.etag
+            headers[b"last-modified"] = info.last_modified
+            await response.begin(304, None)
+            response.reset()
+            return
+
+        range_header = request.headers.get(b"range")
+        if range_header is None and info.size <= self.hot_file_size:
+            entry = self.hot_cache.get(hot_key, info.etag)
+            if entry is None:
+                entry = self.__load_hot_file(hot_key, info, content_type)
+            if entry is not None:
+                if encoding is not None:
+                    body = await compression.compress(entry.body, encoding, (info.path, entry.etag))
+                    if len(body) < len(entry.body):
+                        await response.send_prepared(entry.encoded_head(encoding, len(body)), body)
+                        return
+                await response.send_prepared(entry.head, entry.body)
+                return
+
+        headers = response.headers
+        headers[b"etag"] = info.etag
+        headers[b"last-modified"] = info.last_modified
+        headers[b"accept-ranges"] = b"bytes"
+
+        offset, count, code = 0, info.size, 200
+        if range_header is not None and if_range(request, info):
+            byte_range = parse_range(range_header, info.size)
+            if byte_range is False:
+                headers[b"content-range"] = b"bytes */%d" % info.size
+                raise HTTPError(416)
+            elif byte_range is not None:
+                offset, end = byte_range
+                count = end - offset + 1
+                code = 206
+                headers[b"content-range"] = b"bytes %d-%d/%d" % (offset, end, info.size)
+
+        try:
+            file = open(info.path, "rb")
+        except OSError:
+            self._stat_cache.pop(path, None)
+            raise HTTPError(404)
+
+        response.content_type = content_type
+        with file:
+            await response.sendfile(file, offset, count, code)
+
+    def file_info(self, path: str) -> Union[FileInfo, None]:
+        """ Returns the cached file info of the given path (relative to root), or ``None`` if it is not a file """
+        cache = self._stat_cache
+        now = monotonic()
+
+        changes = self._changes
+        if changes:
+            hot_cache = self.hot_cache
+            while changes:
+                changed = changes.popleft()
+                cache.pop(changed, None)
+                hot_cache.discard(changed)
+                hot_cache.discard(changed + "\0")
+
+        try:
+            checked, info = cache[path]
+        except KeyError:
+            pass
+        else:
+            if now - checked < self.stat_ttl:
+                cache.move_to_end(path)
+                return info
+
+        full_path = self.resolve(path)
+        info = None
+        if full_path is not None:
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                pass
+            else:
+                if stat.S_ISREG(st.st_mode):
+                    info = FileInfo(full_path, st)
+
+        cache[path] = (now, info)
+        cache.move_to_end(path)
+        if len(cache) > self.stat_cache_size:
+            cache.popitem(last=False)
+        return info
+
+    def __load_hot_file(self, key: str, info: FileInfo, content_type: bytes) -> Union[HotFile, None]:
+        try:
+            with open(info.path, "rb") as f:
+                body = f.read(info.size + 1)
+        except OSError:
+            return None
+
+        if len(body) != info.size:
+            # changed since the last stat
+            return None
+
+        entry = HotFile(info, body, content_type)
+        self.hot_cache.put(key, entry)
+        return entry
+
+    def resolve(self, path: str) -> Union[str, None]:
+        """ Returns the absolute path of the file, or ``None`` if it is outside of root """
+        if "\0" in path:
+            return None
+
+        parts = []
+        for part in path.replace("\\", "/").split("/"):
+            if part == "..":
+                return None
+            elif part and part != ".":
+                parts.append(part)
+
+        if not parts:
+            return None
+
+        full_path = os.path.join(self.root, *parts)
+        if os.path.commonpath((self.root, os.path.realpath(full_path))) != self.root:
+            return None
+        return full_path
+
+
+def not_modified(request: Request, info: FileInfo) -> bool:
+    headers = request.headers
+
+    inm = headers.get(b"if-none-match")
+    if inm is not None:
+        return inm.strip() == b"*" or info.etag in (tag.strip().lstrip(b"W/") for tag in inm.split(b","))
+
+    ims = headers.get(b"if-modified-since")
+    if ims is not None:
+        since = parse_http_date(ims)
+        return since is not None and int(info.mtime) <= since
+
+    return False
+
+
+def if_range(request: Request, info: FileInfo) -> bool:
+    """ Returns ``True``, when the range request is applicable for the current version of the file """
+    value = request.headers.get(b"if-range")
+    if value is None:
+        return True
+    elif value.startswith(b'"'):
+        return value == info.etag
+    else:
+        since = parse_http_date(value)
+        return since is not None and int(info.mtime) <= since
+
+
+def parse_range(value: bytes, size: int) -> Union[Tuple[int, int], None, bool]:
+    """ Parse single ``bytes`` range, returns ``(first, last)`` byte positions, ``None`` when the header is
+    ignored (invalid or multiple ranges) and ``False`` when the range is not satisfiable
+    """
+    unit, _, spec = value.partition(b"=")
+    if unit.strip() != b"bytes" or b"," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition(b"-")
+    if not sep:
+        return None
+
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                return False
+            return max(0, size - suffix), size - 1
+
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def parse_http_date(value: bytes) -> Union[int, None]:
+    try:
+        return int(parsedate_to_datetime(value.decode("ASCII")).timestamp())
+    except (TypeError, ValueError, IndexError):
+        return None
\ No newline at end of file
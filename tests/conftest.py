@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from httptools import HttpResponseParser
+from yapic.di import Injector, SINGLETON
+
+import vizen  # noqa
+from vizen.server import _SERVER_INIT
+from vizen.router import Router
+from vizen.loop import Loop
+from vizen.protocol import ProtocolSelector
+
+
+class FakeTransport(asyncio.Transport):
+    """ Collects the written data, and feeds the received data directly into the protocol """
+
+    def __init__(self, loop, protocol, extra=None):
+        super().__init__(extra)
+        self.loop = loop
+        self.protocol = protocol
+        self.data = bytearray()
+        self.closed = False
+        self.reading = True
+
+    def write(self, data):
+        self.data += data
+
+    def writelines(self, data):
+        for chunk in data:
+            self.data += chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.loop.call_soon(self.protocol.connection_lost, None)
+
+    def is_closing(self):
+        return self.closed
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def receive(self, *packets, delay=0.01):
+        """ Feed the packets into the protocol, and run the loop after each of them """
+        for packet in packets:
+            self.protocol.data_received(packet)
+            self.run(delay)
+
+    def run(self, seconds=0.01):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def take(self):
+        data = bytes(self.data)
+        self.data.clear()
+        return data
+
+    def responses(self):
+        """ Parse the written HTTP/1 responses, returns a list of ``(status, headers, body)`` """
+        collector = _ResponseCollector()
+        collector.parser = HttpResponseParser(collector)
+        collector.parser.feed_data(self.take())
+        return [(status, headers, bytes(body)) for status, headers, body in collector.items]
+
+
+class _ResponseCollector:
+    def __init__(self):
+        self.items = []
+        self.parser = None
+
+    def on_message_begin(self):
+        self.items.append([0, {}, bytearray()])
+
+    def on_headers_complete(self):
+        self.items[-1][0] = self.parser.get_status_code()
+
+    def on_header(self, name, value):
+        self.items[-1][1][name.lower()] = value
+
+    def on_body(self, body):
+        self.items[-1][2] += body
+
+
+@pytest.fixture
+def server():
+    injector = Injector()
+    injector.provide(Router, Router, SINGLETON)
+    for init in _SERVER_INIT:
+        init(injector)
+    yield injector
+
+    # handlers of connections, that are left open by the test
+    loop = injector[Loop]
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture
+def router(server):
+    return server[Router]
+
+
+@pytest.fixture
+def connect(server):
+    """ Returns a function, that opens a new connection with a :class:`FakeTransport` """
+
+    def connect(extra=None):
+        protocol = server.descend()[ProtocolSelector]
+        transport = FakeTransport(server[Loop], protocol, extra)
+        protocol.connection_made(transport)
+        return transport
+
+    return connect
@@ -0,0 +1,85 @@
+import hashlib
+import pytest
+
+from vizen.error import HTTPError
+from vizen.protocol.body import FormDataParser, FormDataFile, FormDataEntry
+
+BOUNDARY = b"----vizen-boundary"
+
+FORM_DATA = (
+    b"preamble\r\n"
+    b"------vizen-boundary\r\n"
+    b'Content-Disposition: form-data; name="title"\r\n'
+    b"\r\n"
+    b"Hello\r\nWorld\r\n"
+    b"------vizen-boundary\r\n"
+    b'Content-Disposition: form-data; name="upload"; filename="a.txt"\r\n'
+    b"Content-Type: text/plain\r\n"
+    b"\r\n"
+    b"--" + b"x" * 1000 + b"\r\n------vizen-boundar\r\n"
+    b"\r\n"
+    b"------vizen-boundary\r\n"
+    b'Content-Disposition: form-data; name="empty"\r\n'
+    b"\r\n"
+    b"\r\n"
+    b"------vizen-boundary--\r\n"
+    b"epilogue"
+)
+
+
+def parse(data: bytes, chunk_size: int) -> FormDataParser:
+    parser = FormDataParser(BOUNDARY)
+    for i in range(0, len(data), chunk_size):
+        parser.feed(data[i:i + chunk_size])
+    parser.process()
+    return parser
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 23, 64, 1024, len(FORM_DATA)])
+def test_form_data(chunk_size):
+    fields = parse(FORM_DATA, chunk_size).fields
+    assert [f.name for f in fields] == ["title", "upload", "empty"]
+
+    title, upload, empty = fields
+    assert type(title) is FormDataEntry
+    assert title.content == b"Hello\r\nWorld"
+    assert title.headers["content-disposition"] == b'form-data; name="title"'
+
+    assert isinstance(upload, FormDataFile)
+    assert upload.filename == "a.txt"
+    assert upload.content_type == ("text/plain", {})
+    assert upload.content.read() == b"--" + b"x" * 1000 + b"\r\n------vizen-boundar\r\n"
+
+    assert empty.content == b""
+
+
+def test_form_data_incomplete():
+    with pytest.raises(HTTPError):
+        parse(FORM_DATA[:-30], 100)
+
+
+def test_form_data_invalid_headers():
+    with pytest.raises(HTTPError):
+        parse(b"--" + BOUNDARY + b"\r\nContent-Disposition form-data\r\n\r\n", 100)
+
+
+def test_spool():
+    data = FORM_DATA.replace(b"x" * 1000, b"x" * 100000)
+    parser = FormDataParser(BOUNDARY, spool_size=1024, hash_name="sha256")
+    parser.feed(data)
+    parser.process()
+
+    upload = parser.fields[1].content
+    assert not upload.in_memory
+    assert upload.size == 100000 + 25
+    assert upload.hexdigest() == hashlib.sha256(upload.read()).hexdigest()
+
+    parser = FormDataParser(BOUNDARY)
+    parser.feed(FORM_DATA)
+    parser.process()
+
+    upload = parser.fields[1].content
+    assert upload.in_memory
+    assert upload.size == 1000 + 25
+    with pytest.raises(RuntimeError):
+        upload.digest()
@@ -0,0 +1,81 @@
+import gzip
+import os
+import pytest
+
+from vizen import Response
+from vizen.protocol.compression import Compression, VariantCache, negotiate
+
+AVAILABLE = (b"gzip", b"deflate")
+
+
+@pytest.mark.parametrize("value,expected", [
+    (b"gzip, deflate, br", b"gzip"),
+    (b"deflate", b"deflate"),
+    (b"deflate;q=1, gzip;q=0.5", b"deflate"),
+    (b"GZIP;q=0.8", b"gzip"),
+    (b"gzip;q=0, deflate;q=0", None),
+    (b"*", b"gzip"),
+    (b"*;q=0.1, gzip;q=0", b"deflate"),
+    (b"identity", None),
+    (b"", None),
+])
+def test_negotiate(value, expected):
+    assert negotiate(value, AVAILABLE) == expected
+
+
+def test_variant_cache():
+    cache = VariantCache(10)
+    cache.put((b"a", b"gzip"), b"1234")
+    cache.put((b"b", b"gzip"), b"1234")
+    assert cache.get((b"a", b"gzip")) == b"1234"
+
+    cache.put((b"c", b"gzip"), b"1234")
+    assert cache.get((b"b", b"gzip")) is None
+    assert cache.get((b"a", b"gzip")) == b"1234"
+    assert cache.size == 8
+
+    cache.put((b"d", b"gzip"), b"x" * 11)
+    assert len(cache) == 2
+
+
+@pytest.fixture
+def compressed(server, router):
+    server[Compression.ENABLED] = True
+
+    @router.get("/text")
+    async def text(response: Response):
+        response.headers[b"etag"] = b'"1"'
+        await response.send("text " * 1000)
+
+
+def test_head_like_get(compressed, connect):
+    conn = connect()
+    conn.receive(b"GET /text HTTP/1.1\r\naccept-encoding: gzip\r\n\r\n")
+    (status, get_headers, body), = conn.responses()
+    assert gzip.decompress(body) == b"text " * 1000
+
+    conn.receive(b"HEAD /text HTTP/1.1\r\naccept-encoding: gzip\r\n\r\n")
+    head = conn.take()
+    assert head.endswith(b"\r\n\r\n")
+    head_headers = dict(line.split(b": ", 1) for line in head.split(b"\r\n")[1:-2])
+    del head_headers[b"date"], get_headers[b"date"]
+    assert head_headers == get_headers
+    assert head_headers[b"content-encoding"] == b"gzip"
+    assert head_headers[b"vary"] == b"accept-encoding"
+
+
+def test_cache_key_has_path(server, router, connect, tmp_path):
+    server[Compression.ENABLED] = True
+    for name, content in (("a.txt", b"a" * 2000), ("b.txt", b"b" * 2000)):
+        (tmp_path / name).write_bytes(content)
+        # the etags of the files are equal
+        os.utime(tmp_path / name, ns=(1000000000, 1000000000))
+    router.static("/static", str(tmp_path))
+
+    conn = connect()
+    conn.receive(b"GET /static/a.txt HTTP/1.1\r\naccept-encoding: gzip\r\n\r\n",
+                 b"GET /static/b.txt HTTP/1.1\r\naccept-encoding: gzip\r\n\r\n")
+    a, b = conn.responses()
+    assert a[1][b"etag"] == b[1][b"etag"]
+    assert gzip.decompress(a[2]) == b"a" * 2000
+    assert gzip.decompress(b[2]) == b"b" * 2000
@@ -0,0 +1,61 @@
+from vizen import Request, Response, RequestContext, RequestContextFactory, HTTP1Protocol
+
+
+class MyResponse(Response):
+    __slots__ = ()
+
+
+def test_provided_response(server, router, connect):
+    server.provide(Response, MyResponse)
+
+    @router.get("/type")
+    async def response_type(request: Request, response: Response):
+        await response.send(type(response).__name__)
+
+    conn = connect()
+    conn.receive(b"GET /type HTTP/1.1\r\n\r\n", b"GET /type HTTP/1.1\r\n\r\n")
+    assert [body for _, _, body in conn.responses()] == [b"MyResponse", b"MyResponse"]
+    assert server[RequestContextFactory].resolve is True
+
+
+def test_lazy_cookie(server, router, connect):
+    contexts = []
+
+    @router.get("/plain")
+    async def plain(context: RequestContext, response: Response):
+        contexts.append(context)
+        await response.send("plain")
+
+    @router.get("/cookie")
+    async def cookie(context: RequestContext, response: Response):
+        contexts.append(context)
+        context.cookie.set("name", "value")
+        await response.send("cookie")
+
+    conn = connect()
+    conn.receive(b"GET /plain HTTP/1.1\r\n\r\n", b"GET /cookie HTTP/1.1\r\n\r\n")
+    plain, cookie = conn.responses()
+    assert b"set-cookie" not in plain[1]
+    assert cookie[1][b"set-cookie"] == b"name=value"
+    assert contexts[0]._cookie is None
+    assert server[RequestContextFactory].resolve is False
+
+
+def test_pooled_headers(server, router, connect):
+    server[RequestContextFactory.POOL_SIZE] = 8
+    server[RequestContextFactory.POOL_DEBUG] = True
+    server[HTTP1Protocol.MAX_REQUESTS] = 3
+
+    @router.get("/hello")
+    async def hello(response: Response):
+        await response.send("Hello")
+
+    conn = connect()
+    conn.receive(b"GET /hello HTTP/1.1\r\n\r\n" * 3 + b"GET /ignored HTTP/1.1\r\nx-a: 1\r\n\r\n" * 2)
+    assert [status for status, _, _ in conn.responses()] == [200, 200, 200]
+    assert conn.closed
+
+    factory = server[RequestContextFactory]
+    # the headers of the ignored requests are reused by each other
+    assert len(factory.headers_pool) == 4
+    assert len(factory.requests) == len(factory.responses) == 3
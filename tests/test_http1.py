@@ -0,0 +1,258 @@
+import asyncio
+import pytest
+
+from vizen import Loop, Request, Response
+from vizen.protocol import HTTP1Protocol
+
+
+@pytest.fixture
+def hello(router):
+    @router.get("/hello")
+    async def hello(response: Response):
+        await response.send("Hello")
+
+
+def test_keep_alive(hello, connect):
+    conn = connect()
+    conn.receive(b"GET /hello HTTP/1.1\r\n\r\n")
+    conn.receive(b"GET /hello HTTP/1.1\r\n\r\n")
+    assert [(status, body) for status, _, body in conn.responses()] == [(200, b"Hello"), (200, b"Hello")]
+    assert not conn.closed
+
+    conn.receive(b"GET /hello HTTP/1.0\r\nconnection: keep-alive\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert headers[b"connection"] == b"keep-alive"
+    assert not conn.closed
+
+
+def test_max_requests(hello, server, connect):
+    server[HTTP1Protocol.MAX_REQUESTS] = 2
+    conn = connect()
+    conn.receive(b"GET /hello HTTP/1.1\r\n\r\nGET /hello HTTP/1.1\r\n\r\nGET /hello HTTP/1.1\r\n\r\n")
+    first, second = conn.responses()
+    assert b"connection" not in first[1]
+    assert second[1][b"connection"] == b"close"
+    assert conn.closed
+
+
+def test_connection_close(hello, connect):
+    conn = connect()
+    conn.receive(b"GET /hello HTTP/1.0\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert headers[b"connection"] == b"close"
+    assert conn.closed
+
+
+def test_idle_timeout(hello, server, connect):
+    server[HTTP1Protocol.KEEP_ALIVE_TIMEOUT] = 0.05
+
+    conn = connect()
+    conn.run(0.1)
+    assert conn.closed
+
+    conn = connect()
+    conn.receive(b"GET /hello HTTP/1.1\r\n\r\n")
+    assert conn.responses()[0][0] == 200
+    assert not conn.closed
+    conn.run(0.1)
+    assert conn.closed
+
+
+@pytest.fixture
+def echo(router):
+    @router.post("/echo")
+    async def echo(request: Request, response: Response):
+        await request.on_body.wait()
+        await response.send(request.body.data)
+
+
+@pytest.mark.parametrize("head", [
+    b"POST /echo HTTP/1.1\r\nconnection: close\r\ncontent-length: 10\r\n\r\n",
+    b"POST /echo HTTP/1.0\r\ncontent-length: 10\r\n\r\n",
+])
+def test_closing_request_body(echo, connect, head):
+    conn = connect()
+    conn.receive(head + b"01234", b"56789", b"GET /ignored HTTP/1.1\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert (status, body) == (200, b"0123456789")
+    assert conn.closed
+
+
+def test_invalid_chunked_body(echo, connect):
+    conn = connect()
+    conn.receive(b"POST /echo HTTP/1.1\r\ntransfer-encoding: chunked\r\n\r\n5\r\n01234\r\n", b"zz\r\n")
+    (status, headers, body), = conn.responses()
+    assert status == 400
+    assert conn.closed
+
+
+@pytest.mark.parametrize("content_type", [b"multipart/form-data", b"multipart/form-data; boundary=\xe1"])
+def test_invalid_boundary(echo, connect, content_type):
+    conn = connect()
+    conn.receive(b"POST /echo HTTP/1.1\r\ncontent-type: %s\r\ncontent-length: 4\r\n\r\ndata" % content_type)
+    (status, headers, body), = conn.responses()
+    assert status == 400
+    assert conn.closed
+
+
+def test_connection_lost_while_streaming(router, connect):
+    errors = []
+
+    @router.post("/upload")
+    async def upload(request: Request, response: Response):
+        try:
+            async for chunk in request.stream():
+                pass
+        except ConnectionResetError as e:
+            errors.append(e)
+            raise
+
+    @router.post("/wait")
+    async def wait(request: Request, response: Response):
+        try:
+            await request.on_body.wait()
+        except asyncio.CancelledError as e:
+            errors.append(e)
+            raise
+
+    conn = connect()
+    conn.receive(b"POST /upload HTTP/1.1\r\ncontent-length: 10\r\n\r\n01234")
+    conn.protocol.connection_lost(None)
+    conn.run()
+    assert [type(e) for e in errors] == [ConnectionResetError]
+
+    conn = connect()
+    conn.receive(b"POST /wait HTTP/1.1\r\ncontent-length: 10\r\n\r\n01234")
+    conn.protocol.connection_lost(None)
+    conn.run()
+    assert [type(e) for e in errors] == [ConnectionResetError, asyncio.CancelledError]
+    assert conn.data == b""
+
+
+def test_pipelining(router, server, connect):
+    @router.get("/delay/{ms:int}")
+    async def delay(response: Response, *, ms: int):
+        await asyncio.sleep(ms / 1000)
+        await response.send(str(ms))
+
+    server[HTTP1Protocol.PIPELINE_DEPTH] = 1
+    conn = connect()
+    conn.receive(b"".join(b"GET /delay/%d HTTP/1.1\r\n\r\n" % ms for ms in (30, 1, 10)), delay=0)
+    assert not conn.reading
+    conn.run(0.1)
+    assert [body for _, _, body in conn.responses()] == [b"30", b"1", b"10"]
+    assert conn.reading
+
+
+def test_chunked_body(echo, connect):
+    conn = connect()
+    conn.receive(b"POST /echo HTTP/1.1\r\ntransfer-encoding: chunked\r\n\r\n5\r\n01234\r\n",
+                 b"3\r\n567\r\n2\r\n89\r\n0\r\n\r\n",
+                 b"POST /echo HTTP/1.1\r\ntransfer-encoding: chunked\r\n\r\n0\r\n\r\n")
+    assert [(status, body) for status, _, body in conn.responses()] == [(200, b"0123456789"), (200, b"")]
+    assert not conn.closed
+
+
+@pytest.mark.parametrize("packets", [
+    (b"POST /echo HTTP/1.1\r\ncontent-length: 11\r\n\r\n", ),
+    (b"POST /echo HTTP/1.1\r\ntransfer-encoding: chunked\r\n\r\n6\r\n012345\r\n", b"5\r\n6789a\r\n0\r\n\r\n"),
+])
+def test_body_too_large(echo, server, connect, packets):
+    server[HTTP1Protocol.MAX_BODY_SIZE] = 10
+    conn = connect()
+    conn.receive(*packets)
+    (status, headers, body), = conn.responses()
+    assert status == 413
+    assert headers[b"connection"] == b"close"
+    assert conn.closed
+
+
+@pytest.fixture
+def parts(router):
+    @router.get("/parts")
+    @router.get("/parts/{length:int}")
+    async def parts(response: Response, *, length: int = None):
+        async with response.stream(length=length) as stream:
+            await stream.write("abc")
+            await stream.write(b"x" * 5000)
+
+
+def test_stream_chunked(parts, connect):
+    conn = connect()
+    conn.receive(b"GET /parts HTTP/1.1\r\n\r\n")
+    data = conn.take()
+    assert data.endswith(b"\r\n3\r\nabc\r\n1388\r\n" + b"x" * 5000 + b"\r\n0\r\n\r\n")
+    conn.data += data
+
+    (status, headers, body), = conn.responses()
+    assert headers[b"transfer-encoding"] == b"chunked"
+    assert body == b"abc" + b"x" * 5000
+    assert not conn.closed
+
+
+def test_stream_length(parts, connect):
+    conn = connect()
+    conn.receive(b"GET /parts/5003 HTTP/1.1\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert headers[b"content-length"] == b"5003"
+    assert b"transfer-encoding" not in headers
+    assert body == b"abc" + b"x" * 5000
+    assert not conn.closed
+
+    # the client waits for the rest of the body, so the connection is closed
+    conn.receive(b"GET /parts/6000 HTTP/1.1\r\n\r\n")
+    assert conn.closed
+
+
+def test_stream_http10(parts, connect):
+    conn = connect()
+    conn.receive(b"GET /parts HTTP/1.0\r\nconnection: keep-alive\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert headers[b"connection"] == b"close"
+    assert body == b"abc" + b"x" * 5000
+    assert conn.closed
+
+
+def test_write_backpressure(parts, connect):
+    conn = connect()
+    conn.protocol.pause_writing()
+    conn.receive(b"GET /parts HTTP/1.1\r\n\r\n")
+    assert conn.data == b""
+
+    conn.protocol.resume_writing()
+    conn.run()
+    (status, headers, body), = conn.responses()
+    assert body == b"abc" + b"x" * 5000
+
+
+def test_connection_reset_is_not_reported(router, server, connect):
+    errors = []
+    server[Loop].set_exception_handler(lambda loop, context: errors.append(context))
+
+    @router.post("/upload")
+    async def upload(request: Request):
+        async for chunk in request.stream():
+            pass
+
+    conn = connect()
+    conn.receive(b"POST /upload HTTP/1.1\r\ncontent-length: 10\r\n\r\n01234")
+    conn.protocol.connection_lost(None)
+    conn.run()
+    assert errors == []
+
+
+def test_error_after_headers_sent(router, server, connect):
+    errors = []
+    server[Loop].set_exception_handler(lambda loop, context: errors.append(context))
+
+    @router.get("/broken")
+    async def broken(response: Response):
+        async with response.stream() as stream:
+            await stream.write("abc")
+            raise ValueError("broken")
+
+    conn = connect()
+    conn.receive(b"GET /broken HTTP/1.1\r\n\r\n")
+    assert conn.take().startswith(b"HTTP/1.1 200 OK\r\n")
+    assert conn.closed
+    assert errors == []
@@ -0,0 +1,178 @@
+import asyncio
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import DataReceived, ResponseReceived, StreamEnded, StreamReset
+
+from vizen import Request, Response
+from vizen.protocol.http2 import HTTP2Protocol, parse_head
+
+
+def test_parse_head():
+    head = (b"HTTP/2.0 404 Not Found\r\ndate: Sun, 18 Oct 2026 08:00:00 GMT\r\nContent-Type: text/plain\r\n"
+            b"content-length: 9\r\nconnection: close\r\ntransfer-encoding: chunked\r\n\r\nNot Found")
+    headers, length = parse_head(head, head.find(b"\r\n\r\n"))
+    assert headers == [
+        (b":status", b"404"),
+        (b"date", b"Sun, 18 Oct 2026 08:00:00 GMT"),
+        (b"content-type", b"text/plain"),
+        (b"content-length", b"9"),
+    ]
+    assert length == 9
+
+
+def test_parse_head_without_length():
+    head = b"HTTP/2.0 200 OK\r\ncontent-type: text/plain\r\n\r\n"
+    headers, length = parse_head(head, head.find(b"\r\n\r\n"))
+    assert headers == [(b":status", b"200"), (b"content-type", b"text/plain")]
+    assert length is None
+
+
+class Client:
+    """ HTTP/2 client, that talks with the server through the fake transport """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.conn = H2Connection(H2Configuration(client_side=True, header_encoding=None))
+        self.conn.initiate_connection()
+        self.responses = {}
+        self.bodies = {}
+
+    def request(self, method, path, body=(), headers=()):
+        stream_id = self.conn.get_next_available_stream_id()
+        fields = [(b":method", method), (b":path", path), (b":scheme", b"http"), (b":authority", b"localhost")]
+        self.conn.send_headers(stream_id, fields + list(headers), end_stream=not body)
+        self.flush()
+        self.responses[stream_id] = [None, bytearray(), False]
+        if body:
+            self.bodies[stream_id] = list(body)
+            self.send_bodies()
+        return stream_id
+
+    def send_bodies(self):
+        """ Send the request bodies, while the flow control windows allow it """
+        conn = self.conn
+        for stream_id, chunks in list(self.bodies.items()):
+            while chunks:
+                size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                if size <= 0:
+                    break
+                chunk = chunks.pop(0)
+                if len(chunk) > size:
+                    chunks.insert(0, chunk[size:])
+                    chunk = chunk[:size]
+                conn.send_data(stream_id, chunk, end_stream=not chunks)
+            self.flush()
+            if not chunks:
+                del self.bodies[stream_id]
+
+    def flush(self):
+        self.transport.receive(self.conn.data_to_send())
+
+    def wait(self, *streams):
+        """ Exchange frames until the responses of the given streams (default: every stream) are complete """
+        for _ in range(200):
+            for event in self.conn.receive_data(self.transport.take()):
+                if isinstance(event, ResponseReceived):
+                    self.responses[event.stream_id][0] = dict(event.headers)
+                elif isinstance(event, DataReceived):
+                    self.responses[event.stream_id][1] += event.data
+                    self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, (StreamEnded, StreamReset)):
+                    self.responses[event.stream_id][2] = True
+            self.send_bodies()
+            self.flush()
+            if all(self.responses[stream_id][2] for stream_id in streams or self.responses):
+                return
+        raise TimeoutError("Responses are not complete")
+
+
+def test_loopback(router, connect):
+    @router.get("/large")
+    async def large(response: Response):
+        await response.send(b"x" * 300000)
+
+    @router.get("/stream")
+    async def stream(response: Response):
+        async with response.stream() as stream:
+            for i in range(3):
+                await stream.write("part%d;" % i)
+                await asyncio.sleep(0.01)
+
+    @router.post("/upload")
+    async def upload(request: Request, response: Response):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        await response.send(str(size))
+
+    client = Client(connect())
+    large = client.request(b"GET", b"/large")
+    stream = client.request(b"GET", b"/stream")
+    missing = client.request(b"GET", b"/missing")
+    upload = client.request(b"POST", b"/upload", [b"y" * 10000] * 5)
+    client.wait()
+
+    headers, body, _ = client.responses[large]
+    assert headers[b":status"] == b"200"
+    assert headers[b"content-length"] == b"300000"
+    assert body == b"x" * 300000
+
+    headers, body, _ = client.responses[stream]
+    assert b"content-length" not in headers and b"transfer-encoding" not in headers
+    assert body == b"part0;part1;part2;"
+
+    headers, body, _ = client.responses[missing]
+    assert headers[b":status"] == b"404"
+    assert headers[b"content-length"] == b"%d" % len(body)
+
+    headers, body, _ = client.responses[upload]
+    assert body == b"50000"
+
+
+def test_invalid_content_type(router, connect):
+    @router.post("/form")
+    async def form(request: Request, response: Response):
+        await request.on_body.wait()
+        await response.send("ok")
+
+    conn = connect()
+    client = Client(conn)
+    invalid = client.request(b"POST", b"/form", [b"data"], [(b"content-type", b"multipart/form-data")])
+    valid = client.request(b"POST", b"/form", [b"data"], [(b"content-type", b"text/plain")])
+    client.wait()
+
+    assert client.responses[invalid][0] is None
+    assert client.responses[valid][1] == b"ok"
+    conn.protocol.connection_lost(None)
+    conn.run()
+
+
+def test_paused_body_keeps_connection_window(router, server, connect):
+    server[HTTP2Protocol.INITIAL_WINDOW_SIZE] = 4194304
+    server[HTTP2Protocol.CONNECTION_WINDOW_SIZE] = 65535
+    blocked = asyncio.Event()
+
+    @router.post("/slow")
+    async def slow(request: Request, response: Response):
+        size = 0
+        async for chunk in request.stream():
+            await blocked.wait()
+            size += len(chunk)
+        await response.send(str(size))
+
+    @router.post("/upload")
+    async def upload(request: Request, response: Response):
+        await request.on_body.wait()
+        await response.send(str(len(request.body.data)))
+
+    client = Client(connect())
+    slow = client.request(b"POST", b"/slow", [b"x" * 16384] * 96)
+    upload = client.request(b"POST", b"/upload", [b"y" * 100000])
+    client.wait(upload)
+    assert client.responses[upload][1] == b"100000"
+    assert not client.responses[slow][2]
+
+    blocked.set()
+    client.wait()
+    assert client.responses[slow][1] == b"%d" % (16384 * 96)
@@ -0,0 +1,70 @@
+import pytest
+
+from vizen.headers import Headers
+from vizen.protocol.pool import Pool
+from vizen.protocol.body import RawBody
+
+
+def test_pool_size():
+    pool = Pool(2)
+    assert pool.acquire() is None
+
+    a, b, c = Headers(), Headers(), Headers()
+    pool.release(a)
+    pool.release(b)
+    pool.release(c)
+    assert len(pool) == 2
+
+    assert pool.acquire() is b
+    assert pool.acquire() is a
+    assert pool.acquire() is None
+
+
+def test_pool_debug():
+    pool = Pool(2, debug=True)
+
+    headers = Headers()
+    headers[b"x-test"] = b"1"
+    headers.clear()
+    pool.release(headers)
+
+    with pytest.raises(RuntimeError, match="Headers is used after it was released"):
+        headers[b"x-test"] = b"2"
+    with pytest.raises(RuntimeError):
+        headers.get(b"x-test")
+    with pytest.raises(RuntimeError, match="already released"):
+        pool.release(headers)
+
+    assert pool.acquire() is headers
+    headers[b"x-test"] = b"2"
+    assert type(headers) is Headers
+    assert headers[b"x-test"] == b"2"
+
+
+def test_pool_debug_full():
+    pool = Pool(1, debug=True)
+    kept, dropped = Headers(), Headers()
+    pool.release(kept)
+    pool.release(dropped)
+    assert len(pool) == 1
+
+    with pytest.raises(RuntimeError, match="Headers is used after it was released"):
+        dropped.get(b"x-test")
+    with pytest.raises(RuntimeError, match="already released"):
+        pool.release(dropped)
+
+
+def test_pool_debug_slots():
+    pool = Pool(1, debug=True)
+
+    body = RawBody()
+    body.feed(b"data")
+    body._recycle()
+    pool.release(body)
+
+    with pytest.raises(RuntimeError):
+        body.data
+
+    assert pool.acquire() is body
+    assert body.data == b""
+    assert isinstance(body, RawBody)
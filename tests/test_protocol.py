@@ -0,0 +1,78 @@
+import pytest
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import RemoteSettingsChanged
+
+from vizen import Response
+from vizen.protocol import MAX_REQUEST_LINE
+
+
+class SSLObject:
+    def __init__(self, alpn):
+        self.alpn = alpn
+
+    def selected_alpn_protocol(self):
+        return self.alpn
+
+
+@pytest.fixture
+def hello(router):
+    @router.get("/hello")
+    async def hello(response: Response):
+        await response.send("Hello")
+
+
+def h2_settings(conn, packets):
+    """ Send the connection preface in the given packets, returns the events of the server's response """
+    client = H2Connection(H2Configuration(client_side=True))
+    client.initiate_connection()
+    data = client.data_to_send()
+    start = 0
+    for end in packets + [len(data)]:
+        conn.receive(data[start:end])
+        start = end
+    return client.receive_data(conn.take())
+
+
+@pytest.mark.parametrize("packets", [[], [1], [5, 12, 23]])
+def test_h2_preface(connect, packets):
+    events = h2_settings(connect(), packets)
+    assert any(isinstance(event, RemoteSettingsChanged) for event in events)
+
+
+@pytest.mark.parametrize("packets", [
+    [b"GET /hello HTTP/1.1\r\n\r\n"],
+    [b"G", b"ET /hel", b"lo HTTP/1.", b"1\r\n", b"\r\n"],
+    [b"\r\n\r\nGET /hello HTTP/1.0\r\n\r\n"],
+])
+def test_http1(hello, connect, packets):
+    conn = connect()
+    conn.receive(*packets)
+    (status, headers, body), = conn.responses()
+    assert (status, body) == (200, b"Hello")
+
+
+@pytest.mark.parametrize("packets,status", [
+    ([b"GET /" + b"x" * MAX_REQUEST_LINE], 414),
+    ([b"GET /" + b"x" * 100, b"x" * MAX_REQUEST_LINE + b" HTTP/1.1\r\n"], 414),
+    ([b"GET /hello HTTP/2.5\r\n\r\n"], 505),
+    ([b"GET /hello HTTP/3\r\n\r\n"], 505),
+    ([b"GARBAGE\r\n\r\n"], 400),
+    ([b"GET /hello FTP/1.1\r\n\r\n"], 400),
+])
+def test_reject(hello, connect, packets, status):
+    conn = connect()
+    conn.receive(*packets)
+    (code, headers, body), = conn.responses()
+    assert code == status
+    assert headers[b"connection"] == b"close"
+    assert conn.closed
+
+
+def test_alpn(hello, connect):
+    events = h2_settings(connect({"ssl_object": SSLObject("h2")}), [])
+    assert any(isinstance(event, RemoteSettingsChanged) for event in events)
+
+    conn = connect({"ssl_object": SSLObject("http/1.1")})
+    conn.receive(b"GET /hello HTTP/1.1\r\n\r\n")
+    assert conn.responses()[0][0] == 200
@@ -4,7 +4,9 @@ from uuid import UUID
 
 from yapic.di import Injector
 
-from vizen.router import Router
+from vizen.router import Router, RouteGroup, RouteNotFound, MethodNotAllowed, RouteTree, RouteRegex
+from vizen.protocol.params import Params, URL, QUERY, BODY
+from vizen.protocol.response import Response
 
 url_params = [
     ("{var:int}", "/42", int, 42),
@@ -22,10 +24,14 @@ url_params = [
 ]
 
 
+engines = pytest.mark.parametrize("engine", [RouteTree, RouteRegex], ids=["tree", "regex"])
+
+
+@engines
 @pytest.mark.parametrize("pattern,url,type,value", url_params, ids=[f"{x[1]}--{x[0]}" for x in url_params])
-def test_params(pattern, url, type, value):
+def test_params(pattern, url, type, value, engine):
     injector = Injector()
-    r = Router()
+    r = Router(engine=engine)
 
     @r.on(pattern)
     def action():
@@ -38,9 +44,10 @@ def test_params(pattern, url, type, value):
     assert params["var"] == value
 
 
-def test_multi_params():
+@engines
+def test_multi_params(engine):
     injector = Injector()
-    r = Router()
+    r = Router(engine=engine)
 
     @r.on("/{name: str}-{id :int}/page-{page : int}")
     def action():
@@ -57,9 +64,10 @@ def test_multi_params():
     assert params["page"] == 1
 
 
-def test_regex_params():
+@engines
+def test_regex_params(engine):
     injector = Injector()
-    r = Router()
+    r = Router(engine=engine)
 
     @r.on("{re:A\\d+A}")
     def action():
@@ -72,9 +80,10 @@ def test_regex_params():
     assert params["re"] == "A42A"
 
 
-def test_multiple_dynamic():
+@engines
+def test_multiple_dynamic(engine):
     injector = Injector()
-    r = Router()
+    r = Router(engine=engine)
 
     @r.on("/test/{string:str}")
     def action_string():
@@ -119,9 +128,10 @@ def test_multiple_dynamic():
     assert params["id"] == 42
 
 
-def test_params_wo_type():
+@engines
+def test_params_wo_type(engine):
     injector = Injector()
-    r = Router()
+    r = Router(engine=engine)
 
     @r.on("/test/{any}")
     def action_any():
@@ -146,3 +156,333 @@ def test_params_wo_type():
     handler, params = r.find("/test/exact", b"GET")
     assert handler(injector) == "exact"
     assert len(params) == 0
+
+
+@engines
+def test_nested_params(engine):
+    injector = Injector()
+    r = Router(engine=engine)
+
+    @r.on("/user/{id:int}/posts/{post:int}")
+    def action_post():
+        return "post"
+
+    @r.on("/user/{id:int}/comments")
+    def action_comments():
+        return "comments"
+
+    @r.on("/user/{name}/profile")
+    def action_profile():
+        return "profile"
+
+    @r.on("/user/{id:int}/posts/latest")
+    def action_latest():
+        return "latest"
+
+    handler, params = r.find("/user/42/posts/12", b"GET")
+    assert handler(injector) == "post"
+    assert params == {"id": 42, "post": 12}
+
+    handler, params = r.find("/user/42/comments", b"GET")
+    assert handler(injector) == "comments"
+    assert params == {"id": 42}
+
+    handler, params = r.find("/user/42/profile", b"GET")
+    assert handler(injector) == "profile"
+    assert params == {"name": "42"}
+
+    handler, params = r.find("/user/42/posts/latest", b"GET")
+    assert handler(injector) == "latest"
+    assert params == {"id": 42}
+
+    handler, params = r.find("/user/a/b/profile", b"GET")
+    assert handler(injector) == "profile"
+    assert params == {"name": "a/b"}
+
+    with pytest.raises(RouteNotFound):
+        r.find("/user/x/comments", b"GET")
+
+
+@engines
+def test_precedence(engine):
+    injector = Injector()
+    r = Router(engine=engine)
+
+    @r.on("/{a:str}/{b:int}/{c:int}")
+    def action_str_first():
+        return "str-first"
+
+    @r.on("/{x:int}/5/{y:str}")
+    def action_int_first():
+        return "int-first"
+
+    @r.on("/{name}/edit")
+    def action_edit():
+        return "edit"
+
+    @r.on("/item/{id:int}")
+    def action_item():
+        return "item"
+
+    @r.on("/item-{id:int}")
+    def action_item_dash():
+        return "item-dash"
+
+    handler, params = r.find("/5/5/5", b"GET")
+    assert handler(injector) == "str-first"
+    assert params == {"a": "5", "b": 5, "c": 5}
+
+    handler, params = r.find("/5/5/x", b"GET")
+    assert handler(injector) == "int-first"
+    assert params == {"x": 5, "y": "x"}
+
+    handler, params = r.find("/a/b/edit", b"GET")
+    assert handler(injector) == "edit"
+    assert params == {"name": "a/b"}
+
+    handler, params = r.find("/item/1", b"GET")
+    assert handler(injector) == "item"
+
+    handler, params = r.find("/item-1", b"GET")
+    assert handler(injector) == "item-dash"
+
+
+@engines
+def test_last_segment_match_rest(engine):
+    injector = Injector()
+    r = Router(engine=engine)
+
+    @r.on("/files/{path}")
+    def action_files():
+        return "files"
+
+    handler, params = r.find("/files/a/b/c.txt", b"GET")
+    assert handler(injector) == "files"
+    assert params["path"] == "a/b/c.txt"
+
+
+@engines
+def test_many_routes(engine):
+    injector = Injector()
+    r = Router(engine=engine)
+
+    for i in range(200):
+        r.add_handler([b"GET"], f"/section{i}/{{id:int}}/item-{{item:int}}", lambda i=i: i)
+
+    handler, params = r.find("/section142/3/item-4", b"GET")
+    assert handler(injector) == 142
+    assert params == {"id": 3, "item": 4}
+
+    with pytest.raises(RouteNotFound):
+        r.find("/section200/3/item-4", b"GET")
+
+
+def test_groups():
+    injector = Injector()
+    r = Router()
+    api = RouteGroup()
+    users = RouteGroup()
+
+    @r.on("/")
+    def action_index():
+        return "index"
+
+    @api.on("/status")
+    def action_status():
+        return "status"
+
+    @users.on("/{id:int}")
+    def action_user():
+        return "user"
+
+    @users.post("/")
+    def action_create():
+        return "create"
+
+    api.add_group("/users", users)
+    r.add_group("/api/", api)
+
+    handler, params = r.find("/", b"GET")
+    assert handler(injector) == "index"
+
+    handler, params = r.find("/api/status", b"GET")
+    assert handler(injector) == "status"
+
+    handler, params = r.find("/api/users/42", b"GET")
+    assert handler(injector) == "user"
+    assert params == {"id": 42}
+
+    handler, params = r.find("/api/users/", b"POST")
+    assert handler(injector) == "create"
+
+
+def test_conflict():
+    r = Router()
+
+    @r.on("/user/{id:int}")
+    def action_id():
+        pass
+
+    @r.on("/user/{user_id:integer}")
+    def action_user_id():
+        pass
+
+    with pytest.raises(ValueError):
+        r.freeze()
+
+
+def test_frozen():
+    r = Router()
+    g = RouteGroup()
+    r.add_group("/g", g)
+    r.freeze()
+
+    with pytest.raises(RuntimeError):
+        r.add_handler([b"GET"], "/", lambda: None)
+
+    with pytest.raises(RuntimeError):
+        g.add_handler([b"GET"], "/", lambda: None)
+
+
+def test_cache():
+    injector = Injector()
+    r = Router(cache_size=2)
+
+    @r.on("/product/{id:int}")
+    def action_product():
+        return "product"
+
+    @r.on("/exact")
+    def action_exact():
+        return "exact"
+
+    handler, params = r.find("/product/1", b"GET")
+    assert handler(injector) == "product"
+    assert params == {"id": 1}
+    params["id"] = 2
+
+    handler, params = r.find("product/1", b"GET")
+    assert params == {"id": 1}
+    assert (r.cache.hits, r.cache.misses, len(r.cache)) == (1, 1, 1)
+
+    r.find("/exact", b"GET")
+    assert len(r.cache) == 1
+
+    r.find("/product/2", b"GET")
+    r.find("/product/3", b"GET")
+    assert len(r.cache) == 2
+
+    with pytest.raises(RouteNotFound):
+        r.find("/product/x", b"GET")
+    assert len(r.cache) == 2
+
+    r.find("/product/1", b"GET")
+    assert (r.cache.hits, r.cache.misses) == (1, 6)
+
+
+def test_handler_kwargs():
+    injector = Injector()
+    injector[Params] = Params({"id": 42}, {"q": "search", "page": "2", "tags": ["a", "b"]}, {"name": "x"})
+    r = Router()
+
+    @r.on("/item/{id:int}")
+    def action(*, id: int, q: str, page: int, tags: list, name, limit: int = 10):
+        return (id, q, page, tags, name, limit)
+
+    handler, params = r.find("/item/42", b"GET")
+    assert handler(injector) == (42, "search", 2, ["a", "b"], "x", 10)
+
+
+def test_handler_kwargs_sources():
+    r = Router()
+    shop = RouteGroup()
+
+    @shop.on("/item/{id:int}")
+    def action(*, shop: str, id: int, q: str = None):
+        return (shop, id, q)
+
+    r.add_group("/{shop:str}", shop)
+    handler, params = r.find("/books/item/42", b"GET")
+    assert handler.kwargs.args["shop"][0] == handler.kwargs.args["id"][0] == (URL, )
+    assert handler.kwargs.args["q"][0] == (QUERY, BODY)
+
+    injector = Injector()
+    injector[Params] = Params(params, {"id": "1", "shop": "x", "q": "query"}, {"q": "body"})
+    assert handler(injector) == ("books", 42, "query")
+
+    injector[Params] = Params(params, {}, {"q": "body"})
+    assert handler(injector) == ("books", 42, "body")
+
+
+def test_handler_call():
+    class Context:
+        def __init__(self, objects):
+            self.objects = objects
+            self.params = objects[Params]
+            self.injector = Injector()
+            self.injector[Params] = self.params
+            self.injector[str] = "injected"
+
+        def __getitem__(self, key):
+            return self.objects[key]
+
+    response = Response.__new__(Response)
+    context = Context({Response: response, Params: Params({"id": 42}, {}, {})})
+    r = Router()
+
+    @r.on("/direct/{id:int}")
+    def direct(response: Response, *, id: int, limit: int = 10):
+        return (response, id, limit)
+
+    @r.on("/scoped/{id:int}")
+    def scoped(value: str, *, id: int):
+        return (value, id)
+
+    handler, params = r.find("/direct/42", b"GET")
+    assert handler.args == (Response, )
+    assert handler.call(context) == (response, 42, 10)
+
+    handler, params = r.find("/scoped/42", b"GET")
+    assert handler.args is None
+    assert handler.call(context) == ("injected", 42)
+
+
+@engines
+def test_methods(engine):
+    injector = Injector()
+    r = Router(engine=engine)
+
+    @r.get("/test/{number:int}")
+    def action_number():
+        return "number"
+
+    @r.post("/test/{string:str}")
+    def action_string():
+        return "string"
+
+    @r.on("/exact", b"PUT", b"DELETE")
+    def action_exact():
+        return "exact"
+
+    handler, params = r.find("/test/42", b"POST")
+    assert handler(injector) == "string"
+    assert params == {"string": "42"}
+
+    handler, params = r.find("/test/42", b"HEAD")
+    assert handler(injector) == "number"
+    assert params == {"number": 42}
+
+    with pytest.raises(MethodNotAllowed) as exc:
+        r.find("/test/42", b"PUT")
+    assert exc.value.headers[b"allow"] == b"GET, HEAD, OPTIONS, POST"
+
+    with pytest.raises(MethodNotAllowed) as exc:
+        r.find("/exact", b"GET")
+    assert exc.value.headers[b"allow"] == b"DELETE, OPTIONS, PUT"
+
+    handler, params = r.find("/exact", b"OPTIONS")
+    assert handler is not None
+    assert params == {}
+
+    with pytest.raises(RouteNotFound):
+        r.find("/missing", b"GET")
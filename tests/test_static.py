@@ -0,0 +1,233 @@
+import asyncio
+import gzip
+import os
+import pytest
+from mimetypes import guess_type
+
+from vizen import Loop
+from vizen.protocol import ProtocolFactory, output
+from vizen.protocol.compression import Compression
+from vizen.static import StaticFiles, HotCache, HotFile, parse_range
+
+
+@pytest.mark.parametrize("value,expected", [
+    (b"bytes=0-9", (0, 9)),
+    (b"bytes=5-", (5, 99)),
+    (b"bytes=90-200", (90, 99)),
+    (b"bytes=-10", (90, 99)),
+    (b"bytes=-200", (0, 99)),
+    (b"bytes=100-", False),
+    (b"bytes=-0", False),
+    (b"bytes=9-5", None),
+    (b"bytes=0-1,5-6", None),
+    (b"items=0-1", None),
+    (b"bytes=x-1", None),
+])
+def test_parse_range(value, expected):
+    assert parse_range(value, 100) == expected
+
+
+def test_parse_range_empty_file():
+    assert parse_range(b"bytes=0-", 0) is False
+    assert parse_range(b"bytes=-5", 0) is False
+
+
+def test_resolve(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "file.txt").write_bytes(b"content")
+    static = StaticFiles(str(tmp_path))
+
+    assert static.resolve("sub/file.txt") == os.path.join(static.root, "sub", "file.txt")
+    assert static.resolve("./sub//file.txt") == os.path.join(static.root, "sub", "file.txt")
+    assert static.resolve("../file.txt") is None
+    assert static.resolve("sub/../../file.txt") is None
+    assert static.resolve("") is None
+    assert static.resolve("a\0b") is None
+
+
+def test_file_info(tmp_path):
+    (tmp_path / "style.css").write_bytes(b"body {}")
+    (tmp_path / "dir").mkdir()
+    static = StaticFiles(str(tmp_path), stat_ttl=60)
+
+    info = static.file_info("style.css")
+    assert info.size == 7
+    assert info.content_type == b"text/css; charset=utf-8"
+    assert info.etag.startswith(b'"') and info.etag.endswith(b'"')
+    assert static.file_info("style.css") is info
+
+    assert static.file_info("dir") is None
+    assert static.file_info("missing.css") is None
+
+
+@pytest.mark.parametrize("name,content_type", [
+    ("style.css", b"text/css; charset=utf-8"),
+    ("style.css.gz", b"application/gzip"),
+    ("data.tar.bz2", b"application/x-bzip2"),
+    ("unknown.Z", b"application/octet-stream"),
+    ("unknown", b"application/octet-stream"),
+])
+def test_file_info_content_type(tmp_path, name, content_type):
+    (tmp_path / name).write_bytes(b"content")
+    static = StaticFiles(str(tmp_path))
+    assert static.file_info(name).content_type == content_type
+
+
+def test_hot_cache(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_bytes(name.encode() * 100)
+    static = StaticFiles(str(tmp_path), stat_ttl=0)
+
+    entries = {}
+    for name in ("a", "b", "c"):
+        info = static.file_info(name)
+        entries[name] = HotFile(info, (tmp_path / name).read_bytes())
+
+    cache = HotCache(len(entries["a"]) * 2 + 10)
+    cache.put("a", entries["a"])
+    cache.put("b", entries["b"])
+    assert cache.get("a", entries["a"].etag) is entries["a"]
+
+    # evicts the least recently used
+    cache.put("c", entries["c"])
+    assert len(cache) == 2
+    assert cache.get("b", entries["b"].etag) is None
+    assert cache.get("a", entries["a"].etag) is entries["a"]
+
+    # changed file
+    assert cache.get("c", b'"other"') is None
+    assert len(cache) == 1
+    assert cache.size == len(entries["a"])
+
+    # larger than the whole cache
+    cache.put("big", HotFile(static.file_info("a"), b"x" * 1000))
+    assert cache.get("big", entries["a"].etag) is None
+
+
+@pytest.fixture
+def static_root(tmp_path, server, router):
+    server[Compression.ENABLED] = True
+
+    def serve(**options):
+        return router.static("/s", str(tmp_path), **options)
+
+    return tmp_path, serve
+
+
+@pytest.mark.parametrize("hot_file_size", [65536, 0])
+def test_precompressed(static_root, connect, hot_file_size):
+    root, serve = static_root
+    (root / "app.js").write_bytes(b"console.log(1)")
+    (root / "app.js.gz").write_bytes(gzip.compress(b"console.log(1)"))
+    serve(hot_file_size=hot_file_size)
+    content_type = guess_type("app.js")[0].encode() + b"; charset=utf-8"
+
+    conn = connect()
+    for _ in range(2):
+        conn.receive(b"GET /s/app.js HTTP/1.1\r\naccept-encoding: gzip\r\n\r\n")
+        (status, headers, body), = conn.responses()
+        assert headers[b"content-type"] == content_type
+        assert headers[b"content-encoding"] == b"gzip"
+        assert gzip.decompress(body) == b"console.log(1)"
+
+    conn.receive(b"GET /s/app.js.gz HTTP/1.1\r\naccept-encoding: gzip\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert headers[b"content-type"] == b"application/gzip"
+    assert b"content-encoding" not in headers
+    assert gzip.decompress(body) == b"console.log(1)"
+
+
+def test_sendfile_socket(static_root, server, monkeypatch):
+    root, serve = static_root
+    content = os.urandom(16777216)
+    (root / "large.bin").write_bytes(content)
+    serve()
+
+    async def no_copy(*args):
+        raise AssertionError("File is copied through userspace")
+
+    monkeypatch.setattr(output, "copy_file", no_copy)
+
+    async def download():
+        tcp = await loop.create_server(server[ProtocolFactory], "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /s/large.bin HTTP/1.1\r\n\r\n")
+        # the socket buffer fills up, while the client does not read
+        await asyncio.sleep(0.1)
+        head = await reader.readuntil(b"\r\n\r\n")
+        body = await reader.readexactly(len(content))
+        writer.close()
+        tcp.close()
+        return head, body
+
+    loop = server[Loop]
+    head, body = loop.run_until_complete(download())
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert body == content
+
+
+@pytest.fixture
+def served(static_root):
+    root, serve = static_root
+    (root / "style.css").write_bytes(b"0123456789")
+    (root / "large.bin").write_bytes(b"x" * 100000)
+    static = serve(hot_file_size=1000)
+    return static.file_info("style.css")
+
+
+def test_handle_not_modified(served, connect):
+    conn = connect()
+    conn.receive(b"GET /s/style.css HTTP/1.1\r\nif-none-match: W/%s\r\n\r\n" % served.etag)
+    conn.receive(b"GET /s/style.css HTTP/1.1\r\nif-modified-since: %s\r\n\r\n" % served.last_modified)
+    conn.receive(b"GET /s/style.css HTTP/1.1\r\nif-none-match: \"other\"\r\n\r\n")
+    not_modified, since, changed = conn.responses()
+
+    assert (not_modified[0], not_modified[2]) == (304, b"")
+    assert not_modified[1][b"etag"] == served.etag
+    assert (since[0], since[2]) == (304, b"")
+    assert (changed[0], changed[2]) == (200, b"0123456789")
+
+
+@pytest.mark.parametrize("path", [b"style.css", b"large.bin"])
+def test_handle_range(served, connect, path):
+    conn = connect()
+    conn.receive(b"GET /s/%s HTTP/1.1\r\nrange: bytes=2-4\r\n\r\n" % path)
+    (status, headers, body), = conn.responses()
+    assert (status, body) == (206, b"234" if path == b"style.css" else b"xxx")
+    assert headers[b"content-range"].startswith(b"bytes 2-4/")
+
+    conn.receive(b"GET /s/%s HTTP/1.1\r\nrange: bytes=200000-\r\n\r\n" % path)
+    (status, headers, body), = conn.responses()
+    assert status == 416
+
+
+def test_handle_if_range(served, connect):
+    conn = connect()
+    conn.receive(b"GET /s/style.css HTTP/1.1\r\nrange: bytes=2-4\r\nif-range: %s\r\n\r\n" % served.etag)
+    conn.receive(b"GET /s/style.css HTTP/1.1\r\nrange: bytes=2-4\r\nif-range: \"other\"\r\n\r\n")
+    matching, changed = conn.responses()
+    assert (matching[0], matching[2]) == (206, b"234")
+    assert (changed[0], changed[2]) == (200, b"0123456789")
+
+
+@pytest.mark.parametrize("path,length", [(b"style.css", b"10"), (b"large.bin", b"100000")])
+def test_handle_head(served, connect, path, length):
+    conn = connect()
+    conn.receive(b"HEAD /s/%s HTTP/1.1\r\n\r\n" % path)
+    head = conn.take()
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n") and head.endswith(b"\r\n\r\n")
+    assert b"\r\ncontent-length: %s\r\n" % length in head
+
+    conn.receive(b"GET /s/missing HTTP/1.1\r\n\r\n")
+    assert conn.responses()[0][0] == 404
+
+
+def test_handle_large_file(served, connect):
+    conn = connect()
+    conn.receive(b"GET /s/large.bin HTTP/1.1\r\n\r\n")
+    (status, headers, body), = conn.responses()
+    assert headers[b"content-length"] == b"100000"
+    assert headers[b"accept-ranges"] == b"bytes"
+    assert body == b"x" * 100000
+    assert not conn.closed
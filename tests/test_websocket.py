@@ -0,0 +1,156 @@
+import pytest
+from base64 import b64encode
+from hashlib import sha1
+
+from websockets.client import ClientProtocol
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from websockets.frames import Opcode
+from websockets.uri import parse_uri
+
+from vizen import Loop, WebSocket, broadcast
+from vizen.protocol.websocket import (encode_frame, unmask, negotiate_deflate, OP_TEXT, OP_BINARY, CLOSE_NORMAL,
+                                      CLOSE_GOING_AWAY, DEFLATE_MIN_SIZE, _GUID)
+
+
+def test_unmask():
+    mask = b"\x01\x02\x03\x04"
+    data = bytes(range(23))
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+    assert unmask(masked, mask) == data
+    assert unmask(b"", mask) == b""
+
+
+@pytest.mark.parametrize("length,header", [
+    (5, b"\x81\x05"),
+    (126, b"\x81\x7e\x00\x7e"),
+    (70000, b"\x81\x7f\x00\x00\x00\x00\x00\x01\x11\x70"),
+])
+def test_encode_frame(length, header):
+    frame = encode_frame(OP_TEXT, b"x" * length)
+    assert frame[:len(header)] == header
+    assert len(frame) == len(header) + length
+
+
+def test_encode_compressed_frame():
+    assert encode_frame(OP_BINARY, b"", True) == b"\xc2\x00"
+
+
+@pytest.mark.parametrize("offer,response,params", [
+    (b"permessage-deflate; client_max_window_bits", b"permessage-deflate", (15, 15, True, True)),
+    (b"permessage-deflate; server_no_context_takeover; client_max_window_bits=10",
+     b"permessage-deflate; server_no_context_takeover; client_max_window_bits=10", (15, 10, False, True)),
+    (b"permessage-deflate; server_max_window_bits=8, permessage-deflate; client_no_context_takeover",
+     b"permessage-deflate; client_no_context_takeover", (15, 15, True, False)),
+])
+def test_negotiate_deflate(offer, response, params):
+    assert negotiate_deflate(offer) == (response, params)
+
+
+def test_negotiate_deflate_unknown():
+    assert negotiate_deflate(b"x-webkit-deflate-frame") is None
+    assert negotiate_deflate(b"permessage-deflate; unknown") is None
+
+
+class Client:
+    """ WebSocket client, that talks with the server through the fake transport """
+
+    def __init__(self, transport, path="/ws", deflate=False):
+        self.transport = transport
+        extensions = [ClientPerMessageDeflateFactory()] if deflate else None
+        self.protocol = ClientProtocol(parse_uri("ws://localhost" + path), extensions=extensions)
+        self.request = self.protocol.connect()
+        self.protocol.send_request(self.request)
+        self.flush()
+        self.pending = []
+        self.response, *self.pending = self.receive()
+
+    def flush(self):
+        self.transport.receive(*self.protocol.data_to_send())
+
+    def receive(self):
+        self.protocol.receive_data(self.transport.take())
+        events = self.pending + self.protocol.events_received()
+        self.pending = []
+        return events
+
+    def send(self, message):
+        self.protocol.send_text(message.encode())
+        self.flush()
+
+
+@pytest.fixture
+def clients(router):
+    clients = set()
+
+    @router.get("/ws")
+    async def echo(ws: WebSocket):
+        await ws.accept()
+        clients.add(ws)
+        try:
+            async for message in ws:
+                await ws.send(message)
+        finally:
+            clients.discard(ws)
+
+    @router.get("/bye")
+    async def bye(ws: WebSocket):
+        await ws.accept()
+        await ws.close(CLOSE_GOING_AWAY, "bye")
+
+    return clients
+
+
+def test_handshake(clients, connect):
+    client = Client(connect())
+    response = client.response
+    assert response.status_code == 101
+    assert client.protocol.handshake_exc is None
+
+    key = client.request.headers["Sec-WebSocket-Key"].encode()
+    assert response.headers["Sec-WebSocket-Accept"] == b64encode(sha1(key + _GUID).digest()).decode()
+    assert "Sec-WebSocket-Extensions" not in response.headers
+
+
+@pytest.mark.parametrize("deflate", [False, True])
+def test_echo(clients, connect, deflate):
+    conn = connect()
+    client = Client(conn, deflate=deflate)
+    assert ("Sec-WebSocket-Extensions" in client.response.headers) is deflate
+
+    for message in ("hello", "x" * 1000, "hello"):
+        client.send(message)
+        # rsv1 bit of compressed frames
+        assert bool(conn.data[0] & 0x40) is (deflate and len(message) >= DEFLATE_MIN_SIZE)
+        frame, = client.receive()
+        assert frame.data.decode() == message
+
+    client.protocol.send_close(CLOSE_NORMAL)
+    client.flush()
+    frame, = client.receive()
+    assert frame.opcode == Opcode.CLOSE
+    assert conn.closed
+    conn.run()
+    assert not clients
+
+
+def test_server_close(clients, connect):
+    conn = connect()
+    client = Client(conn, path="/bye")
+    frame, = client.receive()
+    assert frame.opcode == Opcode.CLOSE
+    assert client.protocol.close_rcvd.code == CLOSE_GOING_AWAY
+    assert client.protocol.close_rcvd.reason == "bye"
+
+    client.flush()
+    assert conn.closed
+
+
+def test_broadcast(clients, server, connect):
+    conns = [Client(connect()), Client(connect(), deflate=True), Client(connect(), deflate=True)]
+    assert len(clients) == 3
+
+    message = "broadcast " * 100
+    server[Loop].run_until_complete(broadcast(clients, message))
+    for client in conns:
+        frame, = client.receive()
+        assert frame.data.decode() == message